@@ -0,0 +1,95 @@
+#r# ============================================
+#r#  Fast models of the controlled converters
+#r# ============================================
+
+#r# This example compares the average output voltage of the semi-converter and the full converter given by the
+#r# fast models (closed-form averaged equations and switched piecewise-linear model) with the full SPICE model,
+#r# and then uses the fast models to sweep thousands of operating points
+
+######################################### IMPORT UTILITIES #########################################
+
+import sys, os
+
+if os.environ.get('IN_CONTAINER') == 'Yes':
+    sys.path.insert(1, '/root/utilities/')
+else:
+    sys.path.insert(1, '../utilities/')
+
+from utilities import pyplot as plt
+from figures import save_figures
+from builders import semi_converter, full_converter
+from converter_models import average_output_voltage, simulate_switched, calibrate, print_calibration
+
+####################################################################################################
+
+import numpy as np
+
+import PySpice.Logging.Logging as Logging
+logger = Logging.setup_logging()
+
+#####################################################################################################
+# DEFINING PLOTS
+#####################################################################################################
+
+figure1, (ax1, ax2) = plt.subplots(2, 1, figsize=(20, 10))
+
+####################################################################################################
+# CALIBRATION AGAINST THE SPICE MODEL
+####################################################################################################
+
+R = 10 # load resistance [Ω]
+L = 100e-3 # load inductance [H]
+
+points = [{'alpha': alpha, 'R': R, 'L': L} for alpha in (0.1, 0.3, 0.5, 0.7)]
+for builder in (semi_converter, full_converter):
+    print('**** Calibration of {}: ****'.format(builder.__name__))
+    print_calibration(calibrate(builder, points))
+
+####################################################################################################
+# STEADY STATE WITH A LARGE L/R
+####################################################################################################
+
+# The load current settles over many periods after the output voltage does. In steady state the inductor has no
+# average voltage, so the average current must be the average output voltage over R (about 70 A here)
+result = simulate_switched(semi_converter, alpha=0.5, R=1, L=1)
+print('**** Switched model of semi_converter with L/R = 1 s: ****')
+print('Average current: {:.2f} [A], average voltage / R: {:.2f} [A], after {} periods'.format(
+    float(result['current_average']), float(result['average']), result['periods']))
+assert abs(result['current_average'] - result['average']) <= 1e-3 * abs(result['average']), 'The load current did not settle'
+
+####################################################################################################
+# SWEEP WITH THE FAST MODELS
+####################################################################################################
+
+alpha = np.linspace(0, 1, 1000)
+inductances = [None, 1e-3, 10e-3, 100e-3]
+
+# Average output voltage (closed-form equations, every point at once)
+ax1.set_title('Full converter - Average output voltage')
+ax1.set_xlabel('alpha')
+ax1.set_ylabel('Voltage [V]')
+ax1.grid()
+for inductance in inductances:
+    ax1.plot(alpha, average_output_voltage(full_converter, alpha, R=R, L=inductance))
+ax1.legend(['R' if inductance is None else 'L = {:g} H'.format(inductance) for inductance in inductances], loc=(.05,.1))
+
+# Waveforms of the switched model (the last period, once in steady state)
+result = simulate_switched(full_converter, alpha=[0.2, 0.5, 0.8], R=R, L=L)
+ax2.set_title('Full converter with RL load - Output voltage (switched model)')
+ax2.set_xlabel('Time [s]')
+ax2.set_ylabel('Voltage [V]')
+ax2.grid()
+for output in result['output']:
+    ax2.plot(result['time'], output)
+ax2.legend(('alpha = 0.2', 'alpha = 0.5', 'alpha = 0.8'), loc=(.05,.1))
+
+####################################################################################################
+
+# Adjusts the spacing between subplots
+figure1.tight_layout(pad=3.0)
+
+# Save/show plots
+if os.environ.get('IN_CONTAINER') == 'Yes':
+    save_figures("fast-models-result")
+else:
+    plt.show()
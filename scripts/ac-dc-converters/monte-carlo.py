@@ -0,0 +1,75 @@
+#r# ============================================
+#r#  Monte Carlo tolerance analysis
+#r# ============================================
+
+#r# This example simulates a filtered semi-converter with its load, filter capacitor and SCR parameters varying within
+#r# tolerance, and shows the distribution of the average output voltage and its ripple
+#r# Set MONTE_CARLO_SAMPLES to change the amount of samples (an interrupted run is resumed from its CSV table)
+
+######################################### IMPORT UTILITIES #########################################
+
+import sys, os
+
+if os.environ.get('IN_CONTAINER') == 'Yes':
+    sys.path.insert(1, '/root/utilities/')
+else:
+    sys.path.insert(1, '../utilities/')
+
+from utilities import get_output_file_name, pyplot as plt
+from figures import save_figures
+from builders import semi_converter
+from monte_carlo import run_monte_carlo, print_summary, summarize, get_yield
+
+####################################################################################################
+
+import PySpice.Logging.Logging as Logging
+logger = Logging.setup_logging()
+
+#####################################################################################################
+# DEFINING PLOTS
+#####################################################################################################
+
+figure1, (ax1, ax2) = plt.subplots(2, 1, figsize=(20, 10))
+
+####################################################################################################
+# MONTE CARLO ANALYSIS
+####################################################################################################
+
+samples = int(os.environ.get('MONTE_CARLO_SAMPLES', 200))
+period = 1 / 50
+
+# Nominal circuit and relative tolerance of each component (the SCR parameters scale the values of the library)
+nominal = {'alpha': 0.3, 'R': 100, 'L': 10e-3, 'C': 100e-6}
+tolerances = {'R': 0.05, 'L': 0.10, 'C': 0.20, 'scr_bv': 0.10, 'scr_is': 0.50, 'scr_bf': 0.30}
+
+table = run_monte_carlo(semi_converter, nominal, tolerances, samples, {'step_time': period / 500, 'end_time': period * 10},
+                        seed=1, path=get_output_file_name('monte-carlo-semi-converter.csv'))
+
+print('**** Monte Carlo result: ****')
+print_summary(table)
+print('Yield (average output >= 120 V, ripple <= 40 V): {:.1%}'.format(get_yield(table, {'average': (120, None), 'ripple': (None, 40)})))
+
+# Histograms
+for ax, name, title, unit in ((ax1, 'average', 'Average output voltage', 'V'), (ax2, 'ripple', 'Output ripple (peak to peak)', 'V')):
+    summary = summarize(table[name])
+    if summary is None:
+        continue
+    counts, edges = summary['histogram']
+    ax.set_title('{} - {} samples'.format(title, summary['samples']))
+    ax.set_xlabel('{} [{}]'.format(title, unit))
+    ax.set_ylabel('Samples')
+    ax.grid()
+    ax.stairs(counts, edges, fill=True)
+    for percentile in (5, 50, 95):
+        ax.axvline(summary['percentiles'][percentile], color='k', linestyle='--')
+
+####################################################################################################
+
+# Adjusts the spacing between subplots
+figure1.tight_layout(pad=3.0)
+
+# Save/show plots
+if os.environ.get('IN_CONTAINER') == 'Yes':
+    save_figures("monte-carlo-result")
+else:
+    plt.show()
@@ -6,7 +6,6 @@
 
 ######################################### IMPORT MODULES #########################################
 
-import matplotlib.pyplot as plt
 import numpy as np
 
 ######################################### IMPORT UTILITIES #########################################
@@ -18,7 +17,13 @@ if os.environ.get('IN_CONTAINER') == 'Yes':
 else:
     sys.path.insert(1, '../utilities/')
 
-from utilities import format_output, get_output_file_name
+from utilities import get_output_file_name, pyplot as plt
+from builders import rc_lowpass
+from spice_library import IndexedSpiceLibrary
+from adaptive_ac import adaptive_ac, corner_frequency, passband_gain
+from profiling import span
+from result_export import export_results
+from figures import save_figures
 
 ####################################################################################################
 
@@ -27,8 +32,6 @@ logger = Logging.setup_logging()
 
 ####################################################################################################
 
-from PySpice.Probe.Plot import plot
-from PySpice.Spice.Library import SpiceLibrary
 from PySpice.Spice.Netlist import Circuit
 from PySpice.Unit import *
 
@@ -38,7 +41,7 @@ if os.environ.get('IN_CONTAINER') == 'Yes':
     libraries_path = '/root/libraries'
 else:
     libraries_path = '../libraries'
-spice_library = SpiceLibrary(libraries_path)
+spice_library = IndexedSpiceLibrary(libraries_path)
 
 #####################################################################################################
 # DEFINING PLOTS
@@ -50,35 +53,34 @@ figure1, (ax1, ax2) = plt.subplots(2, 1, figsize=(20, 10))
 # CIRCUIT DEFINITION
 ####################################################################################################
 
-circuit = Circuit('Full converter with SCR')
-
-# Input voltage
-source = circuit.SinusoidalVoltageSource('input', 'A', circuit.gnd, amplitude=10@u_V, frequency=500@u_Hz)
-
-# Simple RC circuit
-circuit.R('1', 'A', 'output', 100@u_Ω)
-circuit.C('1', 'output', circuit.gnd, 10@u_nF)
+# Simple RC circuit fed by a 10 V / 500 Hz sinusoidal source (see builders.rc_lowpass)
+circuit = rc_lowpass()
 
 # Show the netlist
 print('**** Circuit netlist: ****')
-print(circuit)
+with span('netlist'):
+    print(circuit)
 
 ####################################################################################################
 # SIMULATION
 ####################################################################################################
 
-simulator = circuit.simulator(temperature=25, nominal_temperature=25)
-analysis = simulator.ac(start_frequency=20@u_kHz, stop_frequency=20@u_MHz, number_of_points=10,  variation='dec')
-
 # Conversion factor
 RAD_TO_DEG = 180 / np.pi
 
-# Formatting results
-voltages, currents = format_output(analysis, 'ac')
+# Coarse sweep, refined only around the corner frequency (the circuit is linear, so ngspice is not needed)
+voltages, currents = adaptive_ac(circuit, 20@u_kHz, 20@u_MHz, points_per_decade=5, probes=['output'])
+# Save the result for later analysis (see result_export.load_results)
+export_results(get_output_file_name('RC-lowpass-simulation1'), 'ac', voltages, currents, netlist=str(circuit), parameters={'start_frequency': 20@u_kHz, 'stop_frequency': 20@u_MHz, 'points_per_decade': 5, 'adaptive': True})
 v_output_magnitude = voltages['output']['magnitude']
 v_output_phase = voltages['output']['phase'] * RAD_TO_DEG
 f = voltages['frequency']
 
+# Corner frequency: half power, referred to the DC gain
+reference = passband_gain(circuit, 'output', 1@u_Hz)
+print('**** Simulation result: ****')
+print('Corner frequency (-3 dB): {:.0f} [Hz], with {} AC points'.format(corner_frequency(f, v_output_magnitude, reference), len(f)))
+
 # Plot magnitude
 ax1.set_title('Magnitude')
 ax1.set_xlabel('Frequency [Hz]')
@@ -103,7 +105,6 @@ ax2.set_ylim(-190.0, 190.0)
 
 # Save/show plots
 if os.environ.get('IN_CONTAINER') == 'Yes':
-    file_name = get_output_file_name("RC-lowpass.png")
-    plt.savefig(file_name)
+    save_figures("RC-lowpass")
 else:
-    plt.show()
\ No newline at end of file
+    plt.show()
@@ -14,7 +14,11 @@ if os.environ.get('IN_CONTAINER') == 'Yes':
 else:
     sys.path.insert(1, '../utilities/')
 
-from utilities import format_output
+from utilities import get_output_file_name
+from builders import voltage_divider
+from linear_solver import fast_simulation
+from profiling import span
+from result_export import export_results
 
 ####################################################################################################
 
@@ -30,29 +34,24 @@ from PySpice.Unit import *
 # CIRCUIT DEFINITION
 ####################################################################################################
 
-circuit = Circuit('Voltage divider')
-
-# Define the netlist
-circuit.V('in', 'input', circuit.gnd, 10@u_V)
-circuit.R(1, 'input', 'out', 8@u_kOhm)
-circuit.R(2, 'out', circuit.gnd, 2@u_kOhm)
+# Define the netlist (10 V divided by 8 kΩ and 2 kΩ, see builders.voltage_divider)
+circuit = voltage_divider()
 
 # Show the netlist
 print('**** Circuit netlist: ****')
-print(circuit)
+with span('netlist'):
+    print(circuit)
 
 ####################################################################################################
 # SIMULATION
 ####################################################################################################
 
-# Set up the simulation
-simulator = circuit.simulator(temperature=25, nominal_temperature=25)
-
-# Run the simulation
-analysis = simulator.operating_point()
+# Run the simulation (the circuit is linear, so it is solved without starting ngspice)
+voltages, currents = fast_simulation(circuit, 'operating_point', probes=['out'])
+# Save the result for later analysis (see result_export.load_results)
+export_results(get_output_file_name('voltage-divider-simulation1'), 'operating_point', voltages, currents, netlist=str(circuit))
 
 # Show results
 print('**** Simulation result: ****')
-voltages, currents = format_output(analysis, 'operating_point')
 out_value = voltages['out']
 print(out_value, " [V]")
\ No newline at end of file
@@ -0,0 +1,225 @@
+#r# ============================================
+#r#  Benchmark suite
+#r# ============================================
+
+#r# Simulates every topology (the circuits of builders.py) with fixed parameters at several resolutions, and compares the wall time and the peak
+#r# memory of each case with a stored baseline, to detect performance regressions of PySpice, ngspice or the utilities
+#r# Usage:
+#r#     python benchmark.py --save-baseline      (once, on the machine used for the comparisons)
+#r#     python benchmark.py [--tolerance 0.25] [--repeat 3] [cases...]
+#r#     docker-compose run --rm pyspice benchmarks/benchmark.py
+
+######################################### IMPORT MODULES #########################################
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+######################################### IMPORT UTILITIES #########################################
+
+BENCHMARKS_PATH = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(1, os.path.join(os.path.dirname(BENCHMARKS_PATH), 'utilities'))
+
+from builders import voltage_divider, rc_lowpass, rc_highpass, half_wave_converter, semi_converter, full_converter, bridge_inverter
+
+import PySpice.Logging.Logging as Logging
+logger = Logging.setup_logging(logging_level='ERROR')
+
+DEFAULT_BASELINE_PATH = os.path.join(BENCHMARKS_PATH, 'baseline.json')
+
+# Resolutions of each kind of analysis: steps per period (transient) and points per decade (ac)
+TRANSIENT_RESOLUTIONS = (200, 1000, 5000)
+AC_RESOLUTIONS = (10, 100, 1000)
+
+'''
+- Name: transient_cases
+- Parameter(s):
+    - name: Name of the case
+    - build: Function that returns the circuit
+    - periods: Amount of periods of the source (50 Hz) to simulate
+- Description:
+    Returns one transient case for each resolution of TRANSIENT_RESOLUTIONS
+'''
+
+def transient_cases(name, build, periods):
+    period = 1 / 50
+    return [
+        ('{}/{}'.format(name, resolution), build, 'transient',
+         {'step_time': period / resolution, 'end_time': period * periods})
+        for resolution in TRANSIENT_RESOLUTIONS
+    ]
+
+'''
+- Name: ac_cases
+- Parameter(s):
+    - name: Name of the case
+    - build: Function that returns the circuit
+- Description:
+    Returns one ac case (20 kHz to 20 MHz) for each resolution of AC_RESOLUTIONS
+'''
+
+def ac_cases(name, build):
+    return [
+        ('{}/{}'.format(name, resolution), build, 'ac',
+         {'start_frequency': 20e3, 'stop_frequency': 20e6, 'number_of_points': resolution, 'variation': 'dec'})
+        for resolution in AC_RESOLUTIONS
+    ]
+
+# Every case: name, function that builds the circuit, simulation mode and analysis parameters
+CASES = (
+    [('voltage-divider/op', voltage_divider, 'operating_point', {})] +
+    ac_cases('RC-lowpass', rc_lowpass) +
+    ac_cases('RC-highpass', rc_highpass) +
+    transient_cases('half-wave-R', lambda: half_wave_converter(alpha=0.5, R=100), 2) +
+    transient_cases('half-wave-RL', lambda: half_wave_converter(alpha=0.5, R=100, L=100e-3, flyback_diode=True), 6) +
+    transient_cases('semi-converter', lambda: semi_converter(alpha=0.5, R=100), 6) +
+    transient_cases('full-converter', lambda: full_converter(alpha=0.3, R=100), 6) +
+    transient_cases('bridge-inverter', lambda: bridge_inverter(alpha=0.0, R=100), 6)
+)
+
+'''
+- Name: get_points
+- Parameter(s):
+    - analysis: Result of a PySpice analysis
+    - simulation_mode: Type of simulation (operating_point, transient, ac)
+- Description:
+    Returns the amount of points computed by the simulator
+'''
+
+def get_points(analysis, simulation_mode):
+    if simulation_mode == 'transient':
+        return len(analysis.time)
+    if simulation_mode == 'ac':
+        return len(analysis.frequency)
+    return 1
+
+'''
+- Name: run_case
+- Parameter(s):
+    - index: Position of the case in CASES (the builders can not be sent to the worker process)
+    - repeat: Amount of times the analysis is run (the fastest one is kept)
+- Description:
+    Builds the circuit and runs the analysis in a fresh worker process, so the peak memory belongs to this case only
+    The plots are destroyed after each run, so the peak memory is the one of a single run whatever the repeat
+    Returns a dictionary with the wall time [s], points, points per second and peak RSS [kB]
+'''
+
+def run_case(index, repeat=3):
+    name, build, simulation_mode, analysis_parameters = CASES[index]
+    simulator = build().simulator(temperature=25, nominal_temperature=25)
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        analysis = getattr(simulator, simulation_mode)(**analysis_parameters)
+        times.append(time.perf_counter() - start)
+        # ngspice keeps every plot (the analysis holds a copy), so the peak memory would grow with "repeat"
+        simulator.ngspice.destroy()
+
+    best = min(times)
+    points = get_points(analysis, simulation_mode)
+    return {
+        'case': name,
+        'time': best,
+        'points': points,
+        'points_per_second': points / best if best > 0 else None,
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+'''
+- Name: run_benchmarks
+- Parameter(s):
+    - indexes: Positions of the cases to run in CASES
+    - repeat: Amount of runs of each analysis
+- Description:
+    Runs the cases one by one (a single worker, so they do not compete for the CPU), each one in a new process
+'''
+
+def run_benchmarks(indexes, repeat=3):
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        return pool.starmap(run_case, [(index, repeat) for index in indexes], chunksize=1)
+
+'''
+- Name: compare
+- Parameter(s):
+    - results: List returned by run_benchmarks
+    - baseline: Dictionary with the stored result of each case
+    - tolerance: Allowed relative increase of the wall time and peak memory (e.g. 0.25 for 25 %)
+- Description:
+    Returns the relative change of the time of each case (None if it is not in the baseline), and the list of
+    regressions as (case, metric, baseline value, new value)
+'''
+
+def compare(results, baseline, tolerance):
+    changes = {}
+    regressions = []
+    for result in results:
+        reference = baseline.get(result['case'])
+        if reference is None:
+            changes[result['case']] = None
+            continue
+        changes[result['case']] = result['time'] / reference['time'] - 1
+        for metric in ('time', 'max_rss'):
+            if result[metric] > reference[metric] * (1 + tolerance):
+                regressions.append((result['case'], metric, reference[metric], result[metric]))
+    return changes, regressions
+
+'''
+- Name: print_results
+- Parameter(s):
+    - results: List returned by run_benchmarks
+    - changes: Relative change of the time of each case, returned by compare
+- Description:
+    Prints the wall time, points, points per second, peak memory and change against the baseline of every case
+'''
+
+def print_results(results, changes):
+    width = max(len(result['case']) for result in results)
+    print('{:<{}}  {:>10}  {:>8}  {:>12}  {:>8}  {:>8}'.format('case', width, 'time [ms]', 'points', 'points/s', 'RSS [MB]', 'change'))
+    for result in results:
+        change = changes.get(result['case'])
+        print('{:<{}}  {:>10.2f}  {:>8}  {:>12.0f}  {:>8.1f}  {:>8}'.format(
+            result['case'], width, result['time'] * 1e3, result['points'], result['points_per_second'] or 0,
+            result['max_rss'] / 1024, '-' if change is None else '{:+.1%}'.format(change)))
+
+####################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the simulation of every topology')
+    parser.add_argument('cases', nargs='*', help='run only the cases that start with these names (e.g. semi-converter)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each analysis, the fastest one is kept')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative increase of time and memory')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help='JSON file with the stored results')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    arguments = parser.parse_args()
+
+    indexes = [index for index, case in enumerate(CASES) if not arguments.cases or case[0].startswith(tuple(arguments.cases))]
+    if not indexes:
+        sys.exit('No cases to run')
+    results = run_benchmarks(indexes, arguments.repeat)
+
+    baseline = {}
+    if os.path.isfile(arguments.baseline):
+        with open(arguments.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+    changes, regressions = compare(results, baseline, arguments.tolerance)
+    print_results(results, changes)
+
+    if arguments.save_baseline:
+        # Cases that were not run keep their stored values
+        baseline.update({result['case']: result for result in results})
+        with open(arguments.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=1, sort_keys=True)
+        print('Baseline saved to {}'.format(arguments.baseline))
+    elif not baseline:
+        print('No baseline found, run with --save-baseline to store one')
+
+    for case, metric, reference, value in regressions:
+        print('Regression in {}: {} went from {:.4g} to {:.4g}'.format(case, metric, reference, value))
+    sys.exit(1 if regressions and not arguments.save_baseline else 0)
@@ -4,11 +4,6 @@
 
 #r# This example shows the simulation of a one phase bridge inverter with PWM control
 
-######################################### IMPORT MODULES #########################################
-
-import matplotlib.pyplot as plt
-import numpy as np
-
 ######################################### IMPORT UTILITIES #########################################
 
 import sys, os
@@ -18,7 +13,15 @@ if os.environ.get('IN_CONTAINER') == 'Yes':
 else:
     sys.path.insert(1, '../utilities/')
 
-from utilities import format_output, get_output_file_name
+from utilities import get_output_file_name, pyplot as plt
+from spice_library import IndexedSpiceLibrary
+from result_cache import cached_simulation
+from session import session_simulator
+from profiling import span
+from result_export import export_results
+from figures import save_figures
+from probes import set_probes
+from plotting import plot_decimated
 
 ####################################################################################################
 
@@ -27,9 +30,6 @@ logger = Logging.setup_logging()
 
 ####################################################################################################
 
-from PySpice.Doc.ExampleTools import find_libraries
-from PySpice.Probe.Plot import plot
-from PySpice.Spice.Library import SpiceLibrary
 from PySpice.Spice.Netlist import Circuit
 from PySpice.Unit import *
 
@@ -39,7 +39,7 @@ if os.environ.get('IN_CONTAINER') == 'Yes':
     libraries_path = '/root/libraries'
 else:
     libraries_path = '../libraries'
-spice_library = SpiceLibrary(libraries_path)
+spice_library = IndexedSpiceLibrary(libraries_path)
 
 #####################################################################################################
 # DEFINING PLOTS
@@ -76,18 +76,21 @@ circuit.R('load', 'A', 'B', 100@u_Ω)
 
 # Show the netlist
 print('**** Circuit netlist: ****')
-print(circuit)
+with span('netlist'):
+    print(circuit)
 
 ####################################################################################################
 # SIMULATION
 ####################################################################################################
 
-simulator = circuit.simulator(temperature=25, nominal_temperature=25)
-analysis = simulator.transient(step_time=source.period/5000, end_time=source.period*6)
-
-# Formatting results
-voltages, currents = format_output(analysis, 'transient')
-v_source = np.subtract(voltages['a'], voltages['b'])
+simulator = session_simulator(circuit, temperature=25, nominal_temperature=25)
+# Only the signals used below are saved by the simulator
+names = set_probes(simulator, ['a-b', 'gate1', 'gate2', 'output'])
+# Formatting results (reused from the cache if this simulation was already run)
+voltages, currents = cached_simulation(simulator, 'transient', names=names, step_time=source.period/5000, end_time=source.period*6)
+# Save the result for later analysis (see result_export.load_results)
+export_results(get_output_file_name('bridge-converter-simulation1'), 'transient', voltages, currents, netlist=str(circuit), parameters={'step_time': source.period/5000, 'end_time': source.period*6})
+v_source = voltages['a-b']
 v_gate1 = voltages['gate1']
 v_gate2 = voltages['gate2']
 v_output = voltages['output']
@@ -98,10 +101,10 @@ ax1.set_title('One phase bridge inverter with resistive load')
 ax1.set_xlabel('Time [s]')
 ax1.set_ylabel('Voltage [V]')
 ax1.grid()
-ax1.plot(t, v_source)
-ax1.plot(t, v_gate1)
-ax1.plot(t, v_gate2)
-ax1.plot(t, v_output)
+plot_decimated(ax1, t, v_source)
+plot_decimated(ax1, t, v_gate1)
+plot_decimated(ax1, t, v_gate2)
+plot_decimated(ax1, t, v_output)
 ax1.legend(('input', 'gate1', 'gate2', 'output'), loc=(.05,.1))
 ax1.set_ylim(float(-source.amplitude*1.1), float(source.amplitude*1.1))
 
@@ -118,18 +121,21 @@ circuit.L('_load', 'RL', circuit.gnd, 10@u_mH)
 
 # Show the netlist
 print('**** Circuit netlist (with RL load): ****')
-print(circuit)
+with span('netlist'):
+    print(circuit)
 
 ####################################################################################################
 # SIMULATION
 ####################################################################################################
 
-simulator = circuit.simulator(temperature=25, nominal_temperature=25)
-analysis = simulator.transient(step_time=source.period/5000, end_time=source.period*6)
-
-# Formatting results
-voltages, currents = format_output(analysis, 'transient')
-v_source = np.subtract(voltages['a'], voltages['b'])
+simulator = session_simulator(circuit, temperature=25, nominal_temperature=25)
+# Only the signals used below are saved by the simulator
+names = set_probes(simulator, ['a-b', 'gate1', 'gate2', 'output', 'i(l_load)'])
+# Formatting results (reused from the cache if this simulation was already run)
+voltages, currents = cached_simulation(simulator, 'transient', names=names, step_time=source.period/5000, end_time=source.period*6)
+# Save the result for later analysis (see result_export.load_results)
+export_results(get_output_file_name('bridge-converter-simulation2'), 'transient', voltages, currents, netlist=str(circuit), parameters={'step_time': source.period/5000, 'end_time': source.period*6})
+v_source = voltages['a-b']
 v_gate1 = voltages['gate1']
 v_gate2 = voltages['gate2']
 v_output = voltages['output']
@@ -141,10 +147,10 @@ ax3.set_title('One phase bridge inverter with RL load')
 ax3.set_xlabel('Time [s]')
 ax3.set_ylabel('Voltage [V]')
 ax3.grid()
-ax3.plot(t, v_source)
-ax3.plot(t, v_gate1)
-ax3.plot(t, v_gate2)
-ax3.plot(t, v_output)
+plot_decimated(ax3, t, v_source)
+plot_decimated(ax3, t, v_gate1)
+plot_decimated(ax3, t, v_gate2)
+plot_decimated(ax3, t, v_output)
 ax3.legend(('input', 'gate1', 'gate2', 'output'), loc=(.05,.1))
 ax3.set_ylim(float(-source.amplitude*1.1), float(source.amplitude*1.1))
 
@@ -156,7 +162,7 @@ ax4.set_title('Full converter with RL load - Current')
 ax4.set_xlabel('Time [s]')
 ax4.set_ylabel('Current [A]')
 ax4.grid()
-ax4.plot(t, i_load)
+plot_decimated(ax4, t, i_load)
 ax4.legend('Load current', loc=(.05,.1))
 ax4.set_ylim(float(1.1 * min_current), float(1.1 * max_current))
 
@@ -168,7 +174,6 @@ figure2.tight_layout(pad=3.0)
 
 # Save/show plots
 if os.environ.get('IN_CONTAINER') == 'Yes':
-    file_name = get_output_file_name("bridge-converter-result.png")
-    plt.savefig(file_name)
+    save_figures("bridge-converter-result")
 else:
     plt.show()
\ No newline at end of file
@@ -0,0 +1,186 @@
+#r# ============================================
+#r#  Batch runner
+#r# ============================================
+
+#r# Runs every circuit script (or the ones listed in a manifest) without plotting windows, and shows the wall time of each one
+#r# Usage:
+#r#     python run_all.py [-j PROCESSES] [--manifest FILE] [--verbose] [scripts...]
+#r#     docker-compose run --rm pyspice run_all.py
+
+######################################### IMPORT MODULES #########################################
+
+import argparse
+import contextlib
+import glob
+import io
+import multiprocessing
+import os
+import runpy
+import sys
+import time
+import traceback
+import warnings
+
+# Plots are saved to files, so the non-interactive backend is used (plt.show does nothing)
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+######################################### IMPORT UTILITIES #########################################
+
+SCRIPTS_PATH = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(1, os.path.join(SCRIPTS_PATH, 'utilities'))
+
+import figures
+import profiling
+
+# Heavy modules are imported once here: the workers are forked from this (warm) interpreter
+import numpy
+import PySpice.Logging.Logging
+import PySpice.Spice.Netlist
+import PySpice.Spice.NgSpice.Shared
+import PySpice.Unit
+import spice_library
+import result_cache
+
+# Folders of "scripts" that do not hold circuit scripts
+EXCLUDED_FOLDERS = ('utilities', 'libraries', 'results', 'benchmarks')
+
+# Analysis scripts that run many simulations (Monte Carlo samples, model calibration), only run when listed explicitly
+EXCLUDED_SCRIPTS = ('ac-dc-converters/monte-carlo.py', 'ac-dc-converters/fast-models.py')
+
+'''
+- Name: discover_scripts
+- Parameter(s):
+    - manifest: Optional path to a text file with one script per line (relative to "scripts", "#" starts a comment)
+- Description:
+    Returns the relative paths of the scripts to run: the ones in the manifest, or every script of the circuit folders
+    except the analysis scripts of EXCLUDED_SCRIPTS
+'''
+
+def discover_scripts(manifest=None):
+    if manifest is not None:
+        with open(manifest, 'r') as manifest_file:
+            lines = [line.split('#', 1)[0].strip() for line in manifest_file]
+        return [line for line in lines if line]
+
+    scripts = []
+    for path in sorted(glob.glob(os.path.join(SCRIPTS_PATH, '*', '*.py'))):
+        folder = os.path.basename(os.path.dirname(path))
+        script = os.path.relpath(path, SCRIPTS_PATH)
+        if folder not in EXCLUDED_FOLDERS and not folder.startswith('.') and script.replace(os.sep, '/') not in EXCLUDED_SCRIPTS:
+            scripts.append(script)
+    return scripts
+
+'''
+- Name: run_script
+- Parameter(s):
+    - script: Path of the script, relative to "scripts"
+- Description:
+    Runs a script in its own folder (the scripts use relative paths), saves every figure it creates and returns a
+    dictionary with its name, status, wall time, number of saved figure files and captured output
+    It is executed in a fresh worker process, so the circuit and the ngspice state are never shared between scripts
+'''
+
+def run_script(script):
+    path = os.path.join(SCRIPTS_PATH, script)
+    name = os.path.splitext(os.path.basename(script))[0]
+    output = io.StringIO()
+    error = None
+
+    start = time.perf_counter()
+    try:
+        os.chdir(os.path.dirname(path))
+        sys.argv = [path]
+        if profiling.is_enabled():
+            profiling.get_profiler()  # Measured from the start of the script
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            runpy.run_path(path, run_name='__main__')
+    except SystemExit as exit_error:
+        if exit_error.code not in (None, 0):
+            error = 'exit code {}'.format(exit_error.code)
+    except Exception:
+        error = traceback.format_exc()
+    elapsed = time.perf_counter() - start
+
+    # Save the figures the script left open (in the container, the scripts save and close them)
+    if plt.get_fignums():
+        figures.save_figures('{}-result'.format(name))
+
+    # The pool workers exit without running the "atexit" functions
+    if profiling.is_enabled():
+        profiling.get_profiler().emit()
+
+    return {
+        'script': script,
+        'ok': error is None,
+        'error': error,
+        'time': elapsed,
+        'files': len(figures.saved_files),
+        'output': output.getvalue(),
+    }
+
+'''
+- Name: run_batch
+- Parameter(s):
+    - scripts: Paths of the scripts, relative to "scripts"
+    - processes: Amount of worker processes (defaults to the amount of CPUs)
+- Description:
+    Runs the scripts in a pool of worker processes (one new process per script) and returns their results, in order
+'''
+
+def run_batch(scripts, processes=None):
+    processes = min(processes or os.cpu_count() or 1, len(scripts)) or 1
+    # Forking keeps the modules already imported by this interpreter
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with context.Pool(processes, maxtasksperchild=1) as pool:
+        return pool.map(run_script, scripts, chunksize=1)
+
+'''
+- Name: print_summary
+- Parameter(s):
+    - results: List returned by run_batch
+    - total_time: Wall time of the whole batch [s]
+- Description:
+    Prints the status, wall time and amount of saved figure files of each script
+'''
+
+def print_summary(results, total_time):
+    width = max(len(result['script']) for result in results)
+    print('**** Batch summary: ****')
+    for result in results:
+        status = 'ok' if result['ok'] else 'FAILED'
+        print('{:<{}}  {:>6}  {:8.2f} s  {} file(s)'.format(result['script'], width, status, result['time'], result['files']))
+    print('Total: {} script(s), {} failed, {:.2f} s (sum of scripts: {:.2f} s)'.format(
+        len(results), sum(not result['ok'] for result in results), total_time, sum(result['time'] for result in results)))
+
+####################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the circuit scripts in a pool of warm worker processes')
+    parser.add_argument('scripts', nargs='*', help='scripts to run, relative to the "scripts" folder (default: all of them, except the analysis scripts)')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='amount of worker processes')
+    parser.add_argument('--manifest', default=None, help='text file with the scripts to run, one per line')
+    parser.add_argument('--verbose', action='store_true', help='show the output of every script')
+    arguments = parser.parse_args()
+
+    scripts = arguments.scripts or discover_scripts(arguments.manifest)
+    if not scripts:
+        sys.exit('No scripts to run')
+
+    start = time.perf_counter()
+    results = run_batch(scripts, arguments.processes)
+    total_time = time.perf_counter() - start
+
+    for result in results:
+        if arguments.verbose and result['output']:
+            print('**** Output of {}: ****'.format(result['script']))
+            print(result['output'])
+        if not result['ok']:
+            print('**** {} failed: ****'.format(result['script']))
+            print(result['error'])
+
+    print_summary(results, total_time)
+    sys.exit(0 if all(result['ok'] for result in results) else 1)
@@ -0,0 +1,77 @@
+#r# ============================================
+#r#  Startup time report
+#r# ============================================
+
+#r# Runs a script with "python -X importtime" and shows how long its imports took, with the slowest modules first
+#r# Usage:
+#r#     python startup_time.py basic-circuits/voltage-divider.py [--top 15]
+#r#     docker-compose run --rm pyspice startup_time.py basic-circuits/voltage-divider.py
+
+######################################### IMPORT MODULES #########################################
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+SCRIPTS_PATH = os.path.dirname(os.path.realpath(__file__))
+
+'''
+- Name: parse_import_times
+- Parameter(s):
+    - report: Output (stderr) of "python -X importtime"
+- Description:
+    Returns a list of (module, self time, cumulative time) [s] for every imported module, and the total import time
+    The total is the sum of the cumulative times of the top level imports (the ones that are not nested)
+'''
+
+def parse_import_times(report):
+    modules = []
+    total = 0
+    for line in report.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|', 2)
+        self_time, cumulative = int(self_time) / 1e6, int(cumulative) / 1e6
+        # Nested imports are indented two spaces per level
+        if not name[1:].startswith(' '):
+            total += cumulative
+        modules.append((name.strip(), self_time, cumulative))
+    return modules, total
+
+'''
+- Name: measure_startup
+- Parameter(s):
+    - script: Path of the script, relative to "scripts"
+- Description:
+    Runs the script (in its own folder, without plotting windows) with the import time report enabled
+    Returns the output of the report, the exit code and the total wall time of the script [s]
+'''
+
+def measure_startup(script):
+    path = os.path.join(SCRIPTS_PATH, script)
+    environment = dict(os.environ, MPLBACKEND='Agg')
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', path], cwd=os.path.dirname(path),
+                             env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    return process.stderr, process.returncode, elapsed
+
+####################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Shows the import time of a script')
+    parser.add_argument('script', help='script to measure, relative to the "scripts" folder')
+    parser.add_argument('--top', type=int, default=15, help='amount of modules to show')
+    arguments = parser.parse_args()
+
+    report, return_code, elapsed = measure_startup(arguments.script)
+    modules, total = parse_import_times(report)
+
+    print('**** Slowest imports of {} (cumulative): ****'.format(arguments.script))
+    for name, self_time, cumulative in sorted(modules, key=lambda module: -module[2])[:arguments.top]:
+        print('{:>10.1f} ms  {:>10.1f} ms (self)  {}'.format(cumulative * 1e3, self_time * 1e3, name))
+    print('Imports: {:.1f} ms, total run: {:.1f} ms'.format(total * 1e3, elapsed * 1e3))
+    if return_code != 0:
+        print('Warning: the script exited with code {}'.format(return_code))
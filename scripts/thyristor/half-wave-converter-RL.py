@@ -4,12 +4,6 @@
 
 #r# This example shows the simulation of a controlled half-wave rectifier with an SCR with an RL load
 
-######################################### IMPORT MODULES #########################################
-
-import matplotlib.pyplot as plt
-import numpy
-from scipy.fft import fft, fftfreq
-
 ######################################### IMPORT UTILITIES #########################################
 
 import sys, os
@@ -19,7 +13,17 @@ if os.environ.get('IN_CONTAINER') == 'Yes':
 else:
     sys.path.insert(1, '../utilities/')
 
-from utilities import format_output, get_output_file_name
+from utilities import get_output_file_name, pyplot as plt
+from spice_library import IndexedSpiceLibrary
+from result_cache import cached_simulation
+from session import session_simulator
+from profiling import span
+from result_export import export_results
+from figures import save_figures
+from probes import set_probes
+from plotting import plot_decimated
+from harmonics import harmonics, spectrum
+from steady_state import steady_state_transient
 
 #####################################################################################################
 
@@ -28,8 +32,6 @@ logger = Logging.setup_logging()
 
 #####################################################################################################
 
-from PySpice.Probe.Plot import plot
-from PySpice.Spice.Library import SpiceLibrary
 from PySpice.Spice.Netlist import Circuit
 from PySpice.Unit import *
 
@@ -39,7 +41,7 @@ if os.environ.get('IN_CONTAINER') == 'Yes':
     libraries_path = '/root/libraries'
 else:
     libraries_path = '../libraries'
-spice_library = SpiceLibrary(libraries_path)
+spice_library = IndexedSpiceLibrary(libraries_path)
 
 #####################################################################################################
 # DEFINING PLOTS
@@ -57,6 +59,9 @@ circuit = Circuit('SCR half wave rectifier')
 R = 1@u_Ω
 L = 60@u_mH
 periods = 20 # Amount of periods of source signal to show in plot
+steady_state_periods = 10 # Amount of periods (the last ones) used in the frequency domain analysis
+# Stop each simulation as soon as the load current settles, keeping only the last period
+steady_state = os.environ.get('STEADY_STATE') == 'Yes'
 
 ####################################### UNFILTERED OUTPUT #######################################
 
@@ -79,17 +84,25 @@ circuit.L('1', 'RL_middle', circuit.gnd, L)
 
 # Show the netlist
 print('**** Circuit netlist: ****')
-print(circuit)
+with span('netlist'):
+    print(circuit)
 
 ####################################################################################################
 # SIMULATION
 ####################################################################################################
 
-simulator = circuit.simulator(temperature=25, nominal_temperature=25)
-analysis = simulator.transient(step_time=source.period/50000, end_time=source.period*periods)
-
-# Formatting results
-voltages, currents = format_output(analysis, 'transient')
+simulator = session_simulator(circuit, temperature=25, nominal_temperature=25)
+# Only the signals used below are saved by the simulator
+names = set_probes(simulator, ['source', 'gate', 'output', 'i(l1)'])
+# Formatting results (reused from the cache if this simulation was already run)
+if steady_state:
+    voltages, currents, simulated_periods = steady_state_transient(simulator, source.period, source.period/50000, watch=['l1'], names=names, max_periods=periods)
+    print('Steady state reached after {} periods'.format(simulated_periods))
+else:
+    voltages, currents = cached_simulation(simulator, 'transient', names=names, step_time=source.period/50000, end_time=source.period*periods)
+    simulated_periods = periods
+# Save the result for later analysis (see result_export.load_results)
+export_results(get_output_file_name('half-wave-converter-RL-simulation1'), 'transient', voltages, currents, netlist=str(circuit), parameters={'step_time': source.period/50000, 'end_time': source.period*simulated_periods})
 v_source = voltages['source']
 v_gate = voltages['gate']
 v_output = voltages['output']
@@ -101,9 +114,9 @@ ax1.set_title('Half-Wave Rectification - Voltage')
 ax1.set_xlabel('Time [s]')
 ax1.set_ylabel('Voltage [V]')
 ax1.grid()
-ax1.plot(t, v_source)
-ax1.plot(t, v_gate)
-ax1.plot(t, v_output)
+plot_decimated(ax1, t, v_source)
+plot_decimated(ax1, t, v_gate)
+plot_decimated(ax1, t, v_output)
 ax1.legend(('source', 'gate', 'output'), loc=(.05,.1))
 ax1.set_ylim(float(-source.amplitude*1.1), float(source.amplitude*1.1))
 
@@ -115,7 +128,7 @@ ax2.set_title('Half-Wave Rectification - Current')
 ax2.set_xlabel('Time [s]')
 ax2.set_ylabel('Current [A]')
 ax2.grid()
-ax2.plot(t, i_load)
+plot_decimated(ax2, t, i_load)
 ax2.legend('l1', loc=(.05,.1))
 ax2.set_ylim(float(1.1 * min_current), float(1.1 * max_current))
 
@@ -123,19 +136,18 @@ ax2.set_ylim(float(1.1 * min_current), float(1.1 * max_current))
 # FREQUENCY DOMAIN
 ####################################################################################################
 
-# Number of samplepoints
-N = len(i_load)
-DURATION = source.period*periods
-SAMPLE_RATE = N / DURATION
-
-yf = fft(i_load)
-xf = fftfreq(N, 1 / SAMPLE_RATE)[:N//5000]
+# Spectrum of the steady-state periods, resampled to a uniform grid (the simulation timestep is not uniform)
+# The steady-state run can stop before "periods", so only the simulated periods are analyzed
+analyzed_periods = min(steady_state_periods, simulated_periods)
+xf, yf = spectrum(t, i_load, source.frequency, max_frequency=10*source.frequency, periods=analyzed_periods)
+result = harmonics(t, i_load, source.frequency, orders=range(1, 11), periods=analyzed_periods)
+print('Load current THD (without filter): {:.2f} %'.format(result['thd'] * 100))
 
 ax5.set_title('Half-Wave Rectification - Without filter')
 ax5.set_xlabel('Frequency [Hz]')
 ax5.set_ylabel('Amplitude')
 ax5.grid()
-ax5.plot(xf, 2.0/N * numpy.abs(yf[0:N//5000]))
+ax5.plot(xf, yf)
 
 ####################################################################################################
 # CIRCUIT DEFINITION - FILTERED
@@ -146,18 +158,25 @@ circuit.C('1', 'output', circuit.gnd, 100@u_mF)
 
 # Show the netlist
 print('**** Circuit netlist (with filter): ****')
-print(circuit)
+with span('netlist'):
+    print(circuit)
 
 ####################################################################################################
 # SIMULATION
 ####################################################################################################
 
-simulator = circuit.simulator(temperature=25, nominal_temperature=25)
-simulator.save_currents = True
-analysis = simulator.transient(step_time=source.period/1000, end_time=source.period*periods)
-
-# Formatting results
-voltages, currents = format_output(analysis, 'transient')
+simulator = session_simulator(circuit, temperature=25, nominal_temperature=25)
+# Only the signals used below are saved by the simulator
+names = set_probes(simulator, ['source', 'gate', 'output', 'i(l1)'])
+# Formatting results (reused from the cache if this simulation was already run)
+if steady_state:
+    voltages, currents, simulated_periods = steady_state_transient(simulator, source.period, source.period/1000, watch=['l1'], names=names, max_periods=periods)
+    print('Steady state reached after {} periods'.format(simulated_periods))
+else:
+    voltages, currents = cached_simulation(simulator, 'transient', names=names, step_time=source.period/1000, end_time=source.period*periods)
+    simulated_periods = periods
+# Save the result for later analysis (see result_export.load_results)
+export_results(get_output_file_name('half-wave-converter-RL-simulation2'), 'transient', voltages, currents, netlist=str(circuit), parameters={'step_time': source.period/1000, 'end_time': source.period*simulated_periods})
 v_source = voltages['source']
 v_gate = voltages['gate']
 v_output = voltages['output']
@@ -169,9 +188,9 @@ ax3.set_title('Half-Wave Rectification with filtering')
 ax3.set_xlabel('Time [s]')
 ax3.set_ylabel('Voltage [V]')
 ax3.grid()
-ax3.plot(t, v_source)
-ax3.plot(t, v_gate)
-ax3.plot(t, v_output)
+plot_decimated(ax3, t, v_source)
+plot_decimated(ax3, t, v_gate)
+plot_decimated(ax3, t, v_output)
 ax3.legend(('source', 'gate', 'output'), loc=(.05,.1))
 ax3.set_ylim(float(-source.amplitude*1.1), float(source.amplitude*1.1))
 
@@ -183,7 +202,7 @@ ax4.set_title('Half-Wave Rectification with filtering - Current')
 ax4.set_xlabel('Time [s]')
 ax4.set_ylabel('Current [A]')
 ax4.grid()
-ax4.plot(t, i_load)
+plot_decimated(ax4, t, i_load)
 ax4.legend('l1', loc=(.05,.1))
 ax4.set_ylim(float(1.1 * min_current), float(1.1 * max_current))
 
@@ -191,16 +210,16 @@ ax4.set_ylim(float(1.1 * min_current), float(1.1 * max_current))
 # FREQUENCY DOMAIN
 ####################################################################################################
 
-N = len(i_load)
-SAMPLE_RATE = N / DURATION
-yf = fft(i_load)
-xf = fftfreq(N, 1 / SAMPLE_RATE)[:N//100]
+analyzed_periods = min(steady_state_periods, simulated_periods)
+xf, yf = spectrum(t, i_load, source.frequency, max_frequency=10*source.frequency, periods=analyzed_periods)
+result = harmonics(t, i_load, source.frequency, orders=range(1, 11), periods=analyzed_periods)
+print('Load current THD (filtered): {:.2f} %'.format(result['thd'] * 100))
 
 ax6.set_title('Half-Wave Rectification - Filtered')
 ax6.set_xlabel('Frequency [Hz]')
 ax6.set_ylabel('Amplitude')
 ax6.grid()
-ax6.plot(xf, 2.0/N * numpy.abs(yf[0:N//100]))
+ax6.plot(xf, yf)
 
 ####################################################################################################
 
@@ -211,7 +230,6 @@ figure3.tight_layout(pad=3.0)
 
 # Save/show plots
 if os.environ.get('IN_CONTAINER') == 'Yes':
-    file_name = get_output_file_name("half-wave-converter-RL-result.png")
-    plt.savefig(file_name)
+    save_figures("half-wave-converter-RL-result")
 else:
     plt.show()
\ No newline at end of file
@@ -6,8 +6,7 @@
 
 ######################################### IMPORT MODULES #########################################
 
-import matplotlib.pyplot as plt
-import numpy
+import numpy as np
 
 ######################################### IMPORT UTILITIES #########################################
 
@@ -18,7 +17,18 @@ if os.environ.get('IN_CONTAINER') == 'Yes':
 else:
     sys.path.insert(1, '../utilities/')
 
-from utilities import format_output, get_output_file_name
+from utilities import get_output_file_name, pyplot as plt
+from spice_library import IndexedSpiceLibrary
+from result_cache import cached_simulation
+from session import session_simulator
+from profiling import span
+from result_export import export_results
+from figures import save_figures
+from probes import set_probes
+from plotting import plot_decimated
+from builders import half_wave_converter
+from sweep import run_sweep
+from metrics import waveform_metrics
 
 ####################################################################################################
 
@@ -27,9 +37,6 @@ logger = Logging.setup_logging()
 
 ####################################################################################################
 
-from PySpice.Doc.ExampleTools import find_libraries
-from PySpice.Probe.Plot import plot
-from PySpice.Spice.Library import SpiceLibrary
 from PySpice.Spice.Netlist import Circuit
 from PySpice.Unit import *
 
@@ -39,13 +46,14 @@ if os.environ.get('IN_CONTAINER') == 'Yes':
     libraries_path = '/root/libraries'
 else:
     libraries_path = '../libraries'
-spice_library = SpiceLibrary(libraries_path)
+spice_library = IndexedSpiceLibrary(libraries_path)
 
 #####################################################################################################
 # DEFINING PLOTS
 #####################################################################################################
 
 figure1, (ax1, ax2) = plt.subplots(1, 2, figsize=(20, 10))
+figure2, ax3 = plt.subplots(figsize=(20, 10))
 
 ####################################################################################################
 # CIRCUIT DEFINITION
@@ -68,17 +76,20 @@ circuit.R('load', 'output', circuit.gnd, 100@u_Ω)
 
 # Show the netlist
 print('**** Circuit netlist: ****')
-print(circuit)
+with span('netlist'):
+    print(circuit)
 
 ####################################################################################################
 # SIMULATION
 ####################################################################################################
 
-simulator = circuit.simulator(temperature=25, nominal_temperature=25)
-analysis = simulator.transient(step_time=source.period/200, end_time=source.period*2)
-
-# Formatting results
-voltages, currents = format_output(analysis, 'transient')
+simulator = session_simulator(circuit, temperature=25, nominal_temperature=25)
+# Only the signals used below are saved by the simulator
+names = set_probes(simulator, ['source', 'gate', 'output'])
+# Formatting results (reused from the cache if this simulation was already run)
+voltages, currents = cached_simulation(simulator, 'transient', names=names, step_time=source.period/200, end_time=source.period*2)
+# Save the result for later analysis (see result_export.load_results)
+export_results(get_output_file_name('half-wave-converter-simulation1'), 'transient', voltages, currents, netlist=str(circuit), parameters={'step_time': source.period/200, 'end_time': source.period*2})
 v_source = voltages['source']
 v_gate = voltages['gate']
 v_output = voltages['output']
@@ -89,9 +100,9 @@ ax1.set_title('Half-Wave Rectification')
 ax1.set_xlabel('Time [s]')
 ax1.set_ylabel('Voltage [V]')
 ax1.grid()
-ax1.plot(t, v_source)
-ax1.plot(t, v_gate)
-ax1.plot(t, v_output)
+plot_decimated(ax1, t, v_source)
+plot_decimated(ax1, t, v_gate)
+plot_decimated(ax1, t, v_output)
 ax1.legend(('input', 'gate', 'output'), loc=(.05,.1))
 ax1.set_ylim(float(-source.amplitude*1.1), float(source.amplitude*1.1))
 
@@ -104,17 +115,20 @@ circuit.C('1', 'output', circuit.gnd, 1@u_mF)
 
 # Show the netlist
 print('**** Circuit netlist (with filter): ****')
-print(circuit)
+with span('netlist'):
+    print(circuit)
 
 ####################################################################################################
 # SIMULATION
 ####################################################################################################
 
-simulator = circuit.simulator(temperature=25, nominal_temperature=25)
-analysis = simulator.transient(step_time=source.period/200, end_time=source.period*2)
-
-# Formatting results
-voltages, currents = format_output(analysis, 'transient')
+simulator = session_simulator(circuit, temperature=25, nominal_temperature=25)
+# Only the signals used below are saved by the simulator
+names = set_probes(simulator, ['source', 'gate', 'output'])
+# Formatting results (reused from the cache if this simulation was already run)
+voltages, currents = cached_simulation(simulator, 'transient', names=names, step_time=source.period/200, end_time=source.period*2)
+# Save the result for later analysis (see result_export.load_results)
+export_results(get_output_file_name('half-wave-converter-simulation2'), 'transient', voltages, currents, netlist=str(circuit), parameters={'step_time': source.period/200, 'end_time': source.period*2})
 v_source = voltages['source']
 v_gate = voltages['gate']
 v_output = voltages['output']
@@ -125,12 +139,41 @@ ax2.set_title('Half-Wave Rectification with filtering')
 ax2.set_xlabel('Time [s]')
 ax2.set_ylabel('Voltage [V]')
 ax2.grid()
-ax2.plot(t, v_source)
-ax2.plot(t, v_gate)
-ax2.plot(t, v_output)
+plot_decimated(ax2, t, v_source)
+plot_decimated(ax2, t, v_gate)
+plot_decimated(ax2, t, v_output)
 ax2.legend(('input', 'gate', 'output'), loc=(.05,.1))
 ax2.set_ylim(float(-source.amplitude*1.1), float(source.amplitude*1.1))
 
+####################################################################################################
+# PARAMETER SWEEP - TRIGGER ANGLE
+####################################################################################################
+
+# Average output voltage of the last period, computed in the worker so only one value per point is returned
+def output_average(waveforms, **point):
+    return waveform_metrics(waveforms.time, waveforms['output'], source.period, periods=1)['average']
+
+# Same circuit without filter (see builders.half_wave_converter), simulated for each trigger angle in parallel
+alphas = np.linspace(0.1, 0.9, 9)
+sweep = run_sweep(half_wave_converter, {'alpha': list(alphas)}, 'transient', {'step_time': source.period/200, 'end_time': source.period*2},
+                  names=['output'], reduce=output_average)
+v_average = sweep.to_array()
+# Ideal SCR with a resistive load: Vm / (2 pi) * (1 + cos(alpha pi))
+v_ideal = float(source.amplitude) / (2*np.pi) * (1 + np.cos(alphas*np.pi))
+
+print('**** Average output voltage: ****')
+for alpha_value, average, ideal in zip(alphas, v_average, v_ideal):
+    print('alpha = {:.1f}: {:.2f} [V] (ideal: {:.2f} [V])'.format(alpha_value, average, ideal))
+
+# Plot
+ax3.set_title('Half-Wave Rectification - Average output voltage')
+ax3.set_xlabel('Trigger angle (alpha)')
+ax3.set_ylabel('Voltage [V]')
+ax3.grid()
+ax3.plot(alphas, v_average, 'o-')
+ax3.plot(alphas, v_ideal, '--')
+ax3.legend(('simulated', 'ideal'), loc=(.05,.1))
+
 ####################################################################################################
 
 # Adjusts the spacing between subplots
@@ -138,7 +181,6 @@ figure1.tight_layout(pad=3.0)
 
 # Save/show plots
 if os.environ.get('IN_CONTAINER') == 'Yes':
-    file_name = get_output_file_name("half-wave-converter-result.png")
-    plt.savefig(file_name)
+    save_figures("half-wave-converter-result")
 else:
     plt.show()
\ No newline at end of file
@@ -0,0 +1,213 @@
+import numpy as np
+
+from linear_solver import fast_simulation
+from result_export import get_raw_values
+from utilities import format_waveforms
+
+'''
+- Name: to_db
+- Parameter(s):
+    - magnitude: Linear magnitude
+- Description:
+    Returns the magnitude in dB (20*log10), avoiding -inf for zero values
+'''
+
+def to_db(magnitude):
+    return 20 * np.log10(np.maximum(np.asarray(magnitude, dtype=float), 1e-300))
+
+'''
+- Name: run_sweep
+- Parameter(s):
+    - circuit: PySpice circuit
+    - start_frequency, stop_frequency: Band of the sweep [Hz]
+    - points_per_decade: Density of the logarithmic grid
+    - probes: Optional list of signals to probe (see probes.parse_probe)
+- Description:
+    Runs one logarithmic AC sweep (see linear_solver.fast_simulation) and returns its frequencies and the complex
+    values of each signal
+'''
+
+def run_sweep(circuit, start_frequency, stop_frequency, points_per_decade, probes=None):
+    voltages, currents = fast_simulation(circuit, 'ac', probes=probes, start_frequency=float(start_frequency),
+                                         stop_frequency=float(stop_frequency),
+                                         number_of_points=int(points_per_decade), variation='dec')
+    nodes = {name: get_raw_values('ac', value) for name, value in voltages.items() if name != 'frequency'}
+    branches = {name: get_raw_values('ac', value) for name, value in currents.items() if name != 'frequency'}
+    return np.asarray(voltages['frequency'], dtype=float), nodes, branches
+
+'''
+- Name: get_interpolation_error
+- Parameter(s):
+    - log_frequency: Logarithm of the sorted frequencies
+    - values: Value of the response at each frequency
+- Description:
+    Returns, for each inner point, the distance between its value and the line that joins its two neighbours
+    (in log-frequency). It is zero along straight asymptotes (e.g. -20 dB/decade) and large around corners and peaks
+'''
+
+def get_interpolation_error(log_frequency, values):
+    position = (log_frequency[1:-1] - log_frequency[:-2]) / (log_frequency[2:] - log_frequency[:-2])
+    interpolated = values[:-2] + position * (values[2:] - values[:-2])
+    return np.abs(values[1:-1] - interpolated)
+
+'''
+- Name: get_refinement_bands
+- Parameter(s):
+    - frequency: Sorted frequencies of the current grid [Hz]
+    - signals: List of complex responses to watch
+    - magnitude_tolerance: Maximum interpolation error of the magnitude [dB]
+    - phase_tolerance: Maximum interpolation error of the phase [degrees]
+- Description:
+    Returns the bands (start, stop) around the points where the response bends more than the tolerances, i.e. where
+    interpolating between the points of the grid would not be accurate. Contiguous intervals are merged, so each band
+    is refined with a single sweep
+'''
+
+def get_refinement_bands(frequency, signals, magnitude_tolerance, phase_tolerance):
+    flagged = np.zeros(len(frequency) - 1, dtype=bool)
+    if len(frequency) < 3:
+        return []
+    log_frequency = np.log10(frequency)
+    for signal in signals:
+        magnitude_error = get_interpolation_error(log_frequency, to_db(np.abs(signal)))
+        phase_error = get_interpolation_error(log_frequency, np.degrees(np.unwrap(np.angle(signal))))
+        bent = (magnitude_error > magnitude_tolerance) | (phase_error > phase_tolerance)
+        # Both intervals next to a bent point are refined
+        flagged[:-1] |= bent
+        flagged[1:] |= bent
+
+    bands = []
+    for index in np.flatnonzero(flagged):
+        if bands and bands[-1][1] == frequency[index]:
+            bands[-1][1] = frequency[index + 1]
+        else:
+            bands.append([frequency[index], frequency[index + 1]])
+    return [tuple(band) for band in bands]
+
+'''
+- Name: merge_sweeps
+- Parameter(s):
+    - sweeps: List of (frequency, nodes, branches) returned by run_sweep
+- Description:
+    Joins several sweeps in a single response sorted by frequency (points repeated by two sweeps are kept once)
+'''
+
+def merge_sweeps(sweeps):
+    frequency = np.concatenate([sweep[0] for sweep in sweeps])
+    frequency, indexes = np.unique(frequency, return_index=True)
+    nodes = {name: np.concatenate([sweep[1][name] for sweep in sweeps])[indexes] for name in sweeps[0][1]}
+    branches = {name: np.concatenate([sweep[2][name] for sweep in sweeps])[indexes] for name in sweeps[0][2]}
+    return frequency, nodes, branches
+
+'''
+- Name: adaptive_ac
+- Parameter(s):
+    - circuit: PySpice circuit
+    - start_frequency, stop_frequency: Band of the analysis [Hz]
+    - points_per_decade: Density of the first (coarse) sweep
+    - probes: Optional list of signals to probe (see probes.parse_probe)
+    - watch: Signals that define where to refine (defaults to every extracted signal)
+    - magnitude_tolerance: Maximum error of interpolating the magnitude between two points of the result [dB]
+    - phase_tolerance: Maximum error of interpolating the phase between two points of the result [degrees]
+    - refine_points: Minimum amount of points of each refinement sweep
+    - max_iterations: Maximum amount of refinements
+- Description:
+    Runs a coarse logarithmic sweep and then extra sweeps only over the bands where the magnitude or the phase change
+    in a way that the grid can not follow (corners, resonances), until the interpolation error is below the tolerances
+    or max_iterations is reached. Flat bands and straight asymptotes keep the coarse density
+    Returns the voltages/currents dictionaries with the same structure as format_output, with all the points sorted
+    by frequency, so corner frequencies and margins can be interpolated accurately with few AC points
+    Example:
+        voltages, currents = adaptive_ac(circuit, 20@u_kHz, 20@u_MHz, probes=['output'])
+        corner = corner_frequency(voltages['frequency'], voltages['output']['magnitude'], 1)
+'''
+
+def adaptive_ac(circuit, start_frequency, stop_frequency, points_per_decade=5, probes=None, watch=None,
+                magnitude_tolerance=0.05, phase_tolerance=0.5, refine_points=10, max_iterations=6):
+    sweeps = [run_sweep(circuit, start_frequency, stop_frequency, points_per_decade, probes)]
+    frequency, nodes, branches = sweeps[0]
+
+    for _ in range(max_iterations):
+        signals = {**nodes, **branches}
+        watched = [signals[name] for name in (watch or signals)]
+        bands = get_refinement_bands(frequency, watched, magnitude_tolerance, phase_tolerance)
+        if not bands:
+            break
+        for band_start, band_stop in bands:
+            # At least twice the current density of the band (new points fall between the existing ones)
+            decades = max(np.log10(band_stop / band_start), 1e-12)
+            intervals = np.count_nonzero((frequency >= band_start) & (frequency <= band_stop)) - 1
+            density = int(np.ceil(max(2 * intervals, refine_points) / decades))
+            sweeps.append(run_sweep(circuit, band_start, band_stop, density, probes))
+        frequency, nodes, branches = merge_sweeps(sweeps)
+
+    return format_waveforms('ac', nodes, branches, frequency)
+
+'''
+- Name: crossing_frequency
+- Parameter(s):
+    - frequency: Sorted frequencies [Hz]
+    - values: Value of the response at each frequency (e.g. magnitude in dB, phase in degrees)
+    - level: Level to find
+- Description:
+    Returns the first frequency where the values cross the level, interpolated linearly in log-frequency, or None
+'''
+
+def crossing_frequency(frequency, values, level):
+    frequency = np.asarray(frequency, dtype=float)
+    values = np.asarray(values, dtype=float) - level
+    crossings = np.flatnonzero(np.signbit(values[:-1]) != np.signbit(values[1:]))
+    if len(crossings) == 0:
+        return None
+    index = crossings[0]
+    fraction = values[index] / (values[index] - values[index + 1])
+    log_frequency = np.log10(frequency[index]) + fraction * np.log10(frequency[index + 1] / frequency[index])
+    return float(10 ** log_frequency)
+
+'''
+- Name: passband_gain
+- Parameter(s):
+    - circuit: PySpice circuit
+    - probe: Signal whose gain is returned (see probes.parse_probe)
+    - frequency: Frequency of the asymptote [Hz]: far below the corners for DC gain (ω→0), far above them for the
+      high-frequency gain (ω→∞)
+- Description:
+    Returns the magnitude of the signal at a single frequency (see linear_solver.fast_simulation), used as the
+    reference of corner_frequency when the sweep does not reach the flat band
+'''
+
+def passband_gain(circuit, probe, frequency):
+    _, nodes, branches = run_sweep(circuit, frequency, frequency, 1, [probe])
+    return float(np.abs(next(iter({**nodes, **branches}.values()))[0]))
+
+'''
+- Name: corner_frequency
+- Parameter(s):
+    - frequency: Sorted frequencies [Hz]
+    - magnitude: Linear magnitude of the response
+    - reference: Linear passband gain (DC or high-frequency asymptote, see passband_gain)
+    - level: Attenuation from the reference [dB], half power (-10*log10(2), about -3.01 dB) by default
+- Description:
+    Returns the first frequency where the response falls "level" dB below the passband gain, or None
+'''
+
+def corner_frequency(frequency, magnitude, reference, level=-10 * np.log10(2)):
+    return crossing_frequency(frequency, to_db(magnitude), float(to_db(reference)) + level)
+
+'''
+- Name: phase_margin
+- Parameter(s):
+    - frequency: Sorted frequencies [Hz]
+    - magnitude: Linear magnitude of the loop gain
+    - phase: Phase of the loop gain [rad]
+- Description:
+    Returns the unity gain (0 dB) frequency and the phase margin at that frequency [degrees], or (None, None)
+'''
+
+def phase_margin(frequency, magnitude, phase):
+    crossover = crossing_frequency(frequency, to_db(magnitude), 0)
+    if crossover is None:
+        return None, None
+    phase_degrees = np.degrees(np.unwrap(np.asarray(phase, dtype=float)))
+    phase_at_crossover = np.interp(np.log10(crossover), np.log10(frequency), phase_degrees)
+    return crossover, float(180 + phase_at_crossover)
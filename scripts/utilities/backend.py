@@ -0,0 +1,131 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+from PySpice.Spice.Xyce.RawFile import RawFile
+from PySpice.Spice.Xyce.Server import XyceServer
+from PySpice.Spice.Xyce.Simulation import XyceCircuitSimulator
+
+# Simulators that can be selected with the SPICE_BACKEND environment variable
+BACKENDS = ('ngspice', 'xyce', 'xyce-parallel')
+
+'''
+- Name: get_backend
+- Parameter(s):
+    - None
+- Description:
+    Returns the simulator selected with the SPICE_BACKEND environment variable (ngspice by default):
+        - ngspice: shared ngspice library, in this process
+        - xyce: Xyce, one process per simulation
+        - xyce-parallel: Xyce launched with MPI (XYCE_PROCESSES processes, all the CPUs by default)
+'''
+
+def get_backend():
+    backend = os.environ.get('SPICE_BACKEND', 'ngspice').lower()
+    if backend not in BACKENDS:
+        raise ValueError('Unknown SPICE_BACKEND: {} (expected one of {})'.format(backend, ', '.join(BACKENDS)))
+    return backend
+
+'''
+- Name: is_xyce
+- Parameter(s):
+    - simulator: PySpice simulator
+- Description:
+    Returns whether the simulator runs Xyce, which has no shared library and uses ".save" for initial conditions
+'''
+
+def is_xyce(simulator):
+    return getattr(simulator, 'SIMULATOR', None) == 'xyce'
+
+'''
+- Name: ParallelXyceServer
+- Parameter(s):
+    - processes: Amount of MPI processes
+    - mpi_command: Command that launches the MPI processes (defaults to MPI_COMMAND, or "mpirun")
+    - xyce_command: Path to the Xyce executable (built with MPI support)
+- Description:
+    Same as PySpice's XyceServer, but Xyce is run with "mpirun -np <processes>", so the matrix of a large netlist
+    is partitioned and solved by several cores
+'''
+
+class ParallelXyceServer(XyceServer):
+
+    def __init__(self, processes, mpi_command=None, **kwargs):
+        super().__init__(**kwargs)
+        self._processes = int(processes)
+        self._mpi_command = mpi_command or os.environ.get('MPI_COMMAND', 'mpirun')
+
+    def __call__(self, spice_input):
+        temporary_folder = tempfile.mkdtemp()
+        try:
+            input_file_name = os.path.join(temporary_folder, 'input.cir')
+            output_file_name = os.path.join(temporary_folder, 'output.raw')
+            with open(input_file_name, 'w') as input_file:
+                input_file.write(str(spice_input))
+
+            command = (self._mpi_command, '-np', str(self._processes), self._xyce_command, '-r', output_file_name, input_file_name)
+            self._logger.info('Run {}'.format(' '.join(command)))
+            process = subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self._parse_stdout(process.stdout)
+            if process.returncode != 0:
+                raise NameError('Xyce exited with code {}: {}'.format(process.returncode, process.stderr.decode('utf-8', 'replace').strip()))
+
+            with open(output_file_name, 'rb') as output_file:
+                return RawFile(output_file.read())
+        finally:
+            shutil.rmtree(temporary_folder, ignore_errors=True)
+
+'''
+- Name: ParallelXyceCircuitSimulator
+- Parameter(s):
+    - circuit: Circuit to simulate
+    - processes: Amount of MPI processes (defaults to XYCE_PROCESSES, or the amount of CPUs)
+    - mpi_command: Command that launches the MPI processes
+    - kwargs: Same keyword arguments of circuit.simulator (temperature, nominal_temperature, xyce_command, ...)
+- Description:
+    Xyce simulator that runs every analysis in MPI-parallel mode
+'''
+
+class ParallelXyceCircuitSimulator(XyceCircuitSimulator):
+
+    def __init__(self, circuit, processes=None, mpi_command=None, **kwargs):
+        super().__init__(circuit, **kwargs)
+        if processes is None:
+            processes = int(os.environ.get('XYCE_PROCESSES', os.cpu_count() or 1))
+        self._xyce_server = ParallelXyceServer(processes, mpi_command, xyce_command=kwargs.get('xyce_command'))
+
+'''
+- Name: xyce_simulator
+- Parameter(s):
+    - circuit: Circuit to simulate
+    - parallel: Whether to run Xyce in MPI-parallel mode
+    - processes: Amount of MPI processes (parallel mode only, see ParallelXyceCircuitSimulator)
+    - kwargs: Same keyword arguments of circuit.simulator (temperature, nominal_temperature, ...)
+- Description:
+    Returns a Xyce simulator, with the executable given by the XYCE_COMMAND environment variable (or "Xyce")
+    Its results are formatted by format_output/cached_simulation with the same names used for ngspice
+    Example:
+        simulator = xyce_simulator(circuit, parallel=True, processes=4, temperature=25, nominal_temperature=25)
+'''
+
+def xyce_simulator(circuit, parallel=False, processes=None, **kwargs):
+    kwargs.setdefault('xyce_command', os.environ.get('XYCE_COMMAND'))
+    if parallel:
+        return ParallelXyceCircuitSimulator(circuit, processes=processes, **kwargs)
+    return circuit.simulator(simulator='xyce-serial', **kwargs)
+
+'''
+- Name: backend_simulator
+- Parameter(s):
+    - circuit: Circuit to simulate
+    - kwargs: Same keyword arguments of circuit.simulator (temperature, nominal_temperature, ...)
+- Description:
+    Returns a Xyce simulator when it is the selected backend (see get_backend), or None for ngspice
+'''
+
+def backend_simulator(circuit, **kwargs):
+    backend = get_backend()
+    if backend == 'ngspice':
+        return None
+    return xyce_simulator(circuit, parallel=backend == 'xyce-parallel', **kwargs)
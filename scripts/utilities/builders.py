@@ -0,0 +1,362 @@
+import functools
+import inspect
+
+from PySpice.Spice.Netlist import Circuit
+from PySpice.Unit import u_V, u_Hz, u_kOhm, u_Ohm, u_nF
+
+from spice_library import IndexedSpiceLibrary
+from utilities import get_libraries_path
+
+# Circuit parameters that can be changed without modifying the structure of the circuit,
+# and the name of the SPICE ".param" that holds each of them
+PARAMETERS = {
+    'alpha': 'alpha',
+    'R': 'r_load',
+    'L': 'l_load',
+    'C': 'c_filter',
+}
+
+# Switches of the bridge inverter: on above 2.5 V of drive, with the on and off resistances of a power switch
+SWITCH_MODEL = 'switch'
+SWITCH_PARAMETERS = {'ron': 0.05, 'roff': 1e7, 'vt': 2.5, 'vh': 0.5}
+
+'''
+- Name: get_spice_library
+- Parameter(s):
+    - None
+- Description:
+    Returns the library of components of the "libraries" folder, which is loaded only once per process
+'''
+
+@functools.lru_cache(maxsize=None)
+def get_spice_library():
+    return IndexedSpiceLibrary(get_libraries_path())
+
+'''
+- Name: gate_pulse
+- Parameter(s):
+    - period: Period of the source signal [s]
+    - half_period_shift: Amount of half periods to delay the pulse (0 for the positive semi-cycle, 1 for the negative one)
+    - amplitude: Amplitude of the pulse [V]
+    - edge_time: Rise and fall time of the pulse [s]
+- Description:
+    Returns the SPICE definition of a gate triggering pulse, with its delay and width defined by the "alpha" parameter
+'''
+
+def gate_pulse(period, half_period_shift=0, amplitude=1, edge_time=1e-3):
+    half_period = period / 2
+    delay = '{{{}*alpha+{}}}'.format(half_period, half_period * half_period_shift)
+    width = '{{{}*(1-alpha)}}'.format(half_period)
+    return 'PULSE(0 {} {} {} {} {} {})'.format(amplitude, delay, edge_time, edge_time, width, period)
+
+'''
+- Name: add_load
+- Parameter(s):
+    - circuit: Circuit to which the load is added
+    - positive, negative: Nodes of the load
+    - has_inductor: Whether the load is RL (True) or purely resistive (False)
+    - inductor_name: Name of the inductor, which defines the name of the current branch (L1 -> 'l1')
+- Description:
+    Adds a resistive or series RL load, with its values taken from the "r_load" and "l_load" parameters
+'''
+
+def add_load(circuit, positive, negative, has_inductor, inductor_name='_load'):
+    if has_inductor:
+        circuit.R('load', positive, 'RL_middle', '{r_load}')
+        circuit.L(inductor_name, 'RL_middle', negative, '{l_load}')
+    else:
+        circuit.R('load', positive, negative, '{r_load}')
+
+'''
+- Name: set_parameters
+- Parameter(s):
+    - circuit: Circuit created by any of the builders of this module
+    - parameters: New values, with the same names used by the builders (alpha, R, L, C)
+- Description:
+    Patches the values of an existing circuit, without rebuilding it
+    The structure of the circuit can not change (e.g. an L can only be set on circuits built with an RL load)
+'''
+
+def set_parameters(circuit, **parameters):
+    for name, value in parameters.items():
+        if value is None:
+            continue
+        if name not in PARAMETERS:
+            raise ValueError('Unknown circuit parameter: {}'.format(name))
+        circuit.parameter(PARAMETERS[name], float(value))
+
+'''
+- Name: voltage_divider
+- Parameter(s):
+    - None
+- Description:
+    Returns a resistive voltage divider of 10 V with 8 kΩ and 2 kΩ (nodes: input, out)
+'''
+
+def voltage_divider():
+    circuit = Circuit('Voltage divider')
+
+    circuit.V('in', 'input', circuit.gnd, 10@u_V)
+    circuit.R(1, 'input', 'out', 8@u_kOhm)
+    circuit.R(2, 'out', circuit.gnd, 2@u_kOhm)
+    return circuit
+
+'''
+- Name: rc_lowpass
+- Parameter(s):
+    - None
+- Description:
+    Returns a RC low-pass filter of 100 Ω and 10 nF, fed by a 10 V / 500 Hz sinusoidal source (nodes: A, output)
+'''
+
+def rc_lowpass():
+    circuit = Circuit('RC low-pass filter')
+
+    # Input voltage
+    circuit.SinusoidalVoltageSource('input', 'A', circuit.gnd, amplitude=10@u_V, frequency=500@u_Hz)
+    # Simple RC circuit
+    circuit.R('1', 'A', 'output', 100@u_Ohm)
+    circuit.C('1', 'output', circuit.gnd, 10@u_nF)
+    return circuit
+
+'''
+- Name: rc_highpass
+- Parameter(s):
+    - None
+- Description:
+    Returns a RC high-pass filter of 10 nF and 100 Ω, fed by a 10 V / 500 Hz sinusoidal source (nodes: A, output)
+'''
+
+def rc_highpass():
+    circuit = Circuit('RC high-pass filter')
+
+    # Input voltage
+    circuit.SinusoidalVoltageSource('input', 'A', circuit.gnd, amplitude=10@u_V, frequency=500@u_Hz)
+    # Simple RC circuit
+    circuit.C('1', 'A', 'output', 10@u_nF)
+    circuit.R('1', 'output', circuit.gnd, 100@u_Ohm)
+    return circuit
+
+'''
+- Name: half_wave_converter
+- Parameter(s):
+    - alpha: Trigger angle [0; 1]
+    - R: Load resistance [Ω]
+    - L: Load inductance [H] (None for a resistive load)
+    - C: Output filter capacitance [F] (None for no filter)
+    - flyback_diode: Whether to add the flyback diode Dm
+    - amplitude: Amplitude of the source [V]
+    - frequency: Frequency of the source [Hz]
+- Description:
+    Returns a controlled half-wave rectifier with an SCR (nodes: source, gate, output; inductor branch: l1)
+'''
+
+def half_wave_converter(alpha=0.5, R=100, L=None, C=None, flyback_diode=False, amplitude=220, frequency=50):
+    spice_library = get_spice_library()
+    circuit = Circuit('SCR half wave rectifier')
+
+    # Input voltage
+    source = circuit.SinusoidalVoltageSource('input', 'source', circuit.gnd, amplitude=amplitude@u_V, frequency=frequency@u_Hz)
+    period = float(source.period)
+    # SCR gate triggering signal
+    circuit.V('trigger', 'gate', 'output', gate_pulse(period))
+    # SCR
+    circuit.include(spice_library['EC103D1'])
+    circuit.X('scr', 'EC103D1', 'source', 'gate', 'output')
+    # Flyback diode Dm
+    if flyback_diode:
+        circuit.include(spice_library['BAV21'])
+        circuit.X('Dm', 'BAV21', circuit.gnd, 'output')
+    # Load
+    add_load(circuit, 'output', circuit.gnd, L is not None, inductor_name='1')
+    # Filter
+    if C is not None:
+        circuit.C('1', 'output', circuit.gnd, '{c_filter}')
+
+    set_parameters(circuit, alpha=alpha, R=R, L=L, C=C)
+    return circuit
+
+'''
+- Name: semi_converter
+- Parameter(s):
+    - Same as half_wave_converter (without flyback_diode, which is always present)
+- Description:
+    Returns a controlled semi-converter with SCRs and diodes (nodes: A, B, gate1, gate2, output; inductor branch: l_load)
+'''
+
+def semi_converter(alpha=0.5, R=100, L=None, C=None, amplitude=220, frequency=50):
+    spice_library = get_spice_library()
+    circuit = Circuit('Semi-converter with SCR')
+
+    # Input voltage
+    source = circuit.SinusoidalVoltageSource('input', 'A', 'B', amplitude=amplitude@u_V, frequency=frequency@u_Hz)
+    period = float(source.period)
+    # SCR gate triggering signal
+    circuit.V('trigger1', 'gate1', 'output', gate_pulse(period))
+    circuit.V('trigger2', 'gate2', 'output', gate_pulse(period, half_period_shift=1))
+    # SCRs
+    circuit.include(spice_library['EC103D1'])
+    circuit.X('t1', 'EC103D1', 'A', 'gate1', 'output')
+    circuit.X('t2', 'EC103D1', 'B', 'gate2', 'output')
+    # Diodes
+    circuit.include(spice_library['BAV21'])
+    circuit.X('d1', 'BAV21', circuit.gnd, 'A')
+    circuit.X('d2', 'BAV21', circuit.gnd, 'B')
+    # Flyback diode Dm
+    circuit.X('Dm', 'BAV21', circuit.gnd, 'output')
+    # Load
+    add_load(circuit, 'output', circuit.gnd, L is not None)
+    # Filter
+    if C is not None:
+        circuit.C('1', 'output', circuit.gnd, '{c_filter}')
+
+    set_parameters(circuit, alpha=alpha, R=R, L=L, C=C)
+    return circuit
+
+'''
+- Name: full_converter
+- Parameter(s):
+    - Same as semi_converter
+- Description:
+    Returns a controlled full converter with SCRs (nodes: A, B, gate1..gate4, output; inductor branch: l_load)
+'''
+
+def full_converter(alpha=0.3, R=100, L=None, C=None, amplitude=220, frequency=50):
+    spice_library = get_spice_library()
+    circuit = Circuit('Full converter with SCR')
+
+    # Input voltage
+    source = circuit.SinusoidalVoltageSource('input', 'A', 'B', amplitude=amplitude@u_V, frequency=frequency@u_Hz)
+    period = float(source.period)
+    # SCR gate triggering signal
+    circuit.V('trigger1', 'gate1', 'output', gate_pulse(period))
+    circuit.V('trigger2', 'gate2', 'B', gate_pulse(period))
+    circuit.V('trigger3', 'gate3', 'output', gate_pulse(period, half_period_shift=1))
+    circuit.V('trigger4', 'gate4', 'A', gate_pulse(period, half_period_shift=1))
+    # Define the rectifier bridge
+    circuit.include(spice_library['EC103D1'])
+    circuit.X('t1', 'EC103D1', 'A', 'gate1', 'output')
+    circuit.X('t2', 'EC103D1', circuit.gnd, 'gate2', 'B')
+    circuit.X('t3', 'EC103D1', 'B', 'gate3', 'output')
+    circuit.X('t4', 'EC103D1', circuit.gnd, 'gate4', 'A')
+    # Load
+    add_load(circuit, 'output', circuit.gnd, L is not None)
+    # Filter
+    if C is not None:
+        circuit.C('1', 'output', circuit.gnd, '{c_filter}')
+
+    set_parameters(circuit, alpha=alpha, R=R, L=L, C=C)
+    return circuit
+
+'''
+- Name: bridge_inverter
+- Parameter(s):
+    - alpha: Fraction of each half period in which no pair of switches conducts (0 for a square wave output)
+    - R: Load resistance [Ω]
+    - L: Load inductance [H] (None for a resistive load)
+    - C: Not supported (there is no output filter), a ValueError is raised when it is given
+    - amplitude: Voltage of the DC bus [V]
+    - frequency: Output frequency [Hz]
+- Description:
+    Returns a one phase bridge inverter with voltage-controlled switches and freewheeling diodes (nodes: supply, A, B;
+    inductor branch: l_load). The load is connected between A and B, the switches S1/S4 drive A high and S2/S3 drive
+    B high. The switches (SWITCH_MODEL) have no breakdown, so they stand any bus voltage; the small-signal transistors
+    of the library are rated for about 40 V
+'''
+
+def bridge_inverter(alpha=0.0, R=100, L=None, C=None, amplitude=220, frequency=50):
+    if C is not None:
+        raise ValueError('The bridge inverter has no output filter (C)')
+    spice_library = get_spice_library()
+    circuit = Circuit('One phase bridge inverter')
+    period = 1 / float(frequency)
+
+    # DC bus
+    circuit.V('input', 'supply', circuit.gnd, amplitude@u_V)
+    # Drive signals, each referenced to the low side of its switch
+    circuit.V('trigger1', 'drive1', 'A', gate_pulse(period, amplitude=5, edge_time=1e-6))
+    circuit.V('trigger2', 'drive2', 'B', gate_pulse(period, half_period_shift=1, amplitude=5, edge_time=1e-6))
+    circuit.V('trigger3', 'drive3', circuit.gnd, gate_pulse(period, half_period_shift=1, amplitude=5, edge_time=1e-6))
+    circuit.V('trigger4', 'drive4', circuit.gnd, gate_pulse(period, amplitude=5, edge_time=1e-6))
+    # Define the bridge
+    circuit.model(SWITCH_MODEL, 'SW', **SWITCH_PARAMETERS)
+    circuit.include(spice_library['BAV21'])
+    legs = (
+        ('1', 'supply', 'A'),
+        ('2', 'supply', 'B'),
+        ('3', 'A', circuit.gnd),
+        ('4', 'B', circuit.gnd),
+    )
+    for name, high, low in legs:
+        circuit.VoltageControlledSwitch(name, high, low, 'drive' + name, low, model=SWITCH_MODEL)
+        circuit.X('d' + name, 'BAV21', low, high)
+    # Load
+    add_load(circuit, 'A', 'B', L is not None)
+
+    set_parameters(circuit, alpha=alpha, R=R, L=L)
+    return circuit
+
+# Builders whose circuits can be cached by get_circuit (their values are ".param" statements, see PARAMETERS)
+BUILDERS = (half_wave_converter, semi_converter, full_converter, bridge_inverter)
+
+'''
+- Name: get_structure
+- Parameter(s):
+    - builder: Any of the builders of BUILDERS
+    - parameters: Keyword arguments of the builder (the missing ones take their default values)
+- Description:
+    Returns the parameters of the builder that define the structure of the circuit: whether each of PARAMETERS is
+    given (an L turns the load into RL, a C adds the filter) and the value of the rest (flyback_diode, amplitude,
+    frequency), which are fixed in the netlist. It also returns the values that can be patched with set_parameters
+'''
+
+def get_structure(builder, parameters):
+    arguments = inspect.signature(builder).bind(**parameters)
+    arguments.apply_defaults()
+    structure = []
+    values = {}
+    for name, value in sorted(arguments.arguments.items()):
+        if name in PARAMETERS:
+            structure.append((name, value is not None))
+            if value is not None:
+                values[name] = value
+        else:
+            structure.append((name, float(value) if isinstance(value, (int, float)) else value))
+    return tuple(structure), values
+
+'''
+- Name: get_circuit_template
+- Parameter(s):
+    - builder: Any of the builders of BUILDERS
+    - structure: Structure of the circuit, as returned by get_structure
+- Description:
+    Builds the circuit of a structure, only once per process (the libraries are included and the elements created once)
+'''
+
+@functools.lru_cache(maxsize=None)
+def get_circuit_template(builder, structure):
+    parameters = {name: (1.0 if value is True else None if value is False else value) for name, value in structure}
+    return builder(**parameters)
+
+'''
+- Name: get_circuit
+- Parameter(s):
+    - builder: Any of the builders of BUILDERS
+    - parameters: Keyword arguments of the builder
+- Description:
+    Returns the circuit built with the given parameters without building it again when only the values (alpha, R, L, C)
+    change: the circuit of the same structure is reused and those values are patched (see set_parameters)
+    The circuit is shared by every call with the same structure, so its elements must not be changed
+    Its netlist only differs in the ".param" lines, which the ngspice session (session module) sends with "alterparam"
+    Example:
+        for alpha in (0.1, 0.5, 0.9):
+            circuit = get_circuit(semi_converter, alpha=alpha, R=10, L=0.1)
+'''
+
+def get_circuit(builder, **parameters):
+    if builder not in BUILDERS:
+        raise ValueError('The circuits of {} can not be cached'.format(getattr(builder, '__name__', builder)))
+    structure, values = get_structure(builder, parameters)
+    circuit = get_circuit_template(builder, structure)
+    set_parameters(circuit, **values)
+    return circuit
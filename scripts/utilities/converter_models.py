@@ -0,0 +1,281 @@
+import numpy as np
+
+from builders import get_circuit, half_wave_converter, semi_converter, full_converter
+from harmonics import resample_periods
+from probes import set_probes
+from result_cache import cached_simulation
+from session import session_simulator
+
+# Conduction states of the switched models
+OFF, POSITIVE, NEGATIVE, FREEWHEEL = 0, 1, 2, 3
+
+# Fast model of each converter builder: whether the negative half cycle is rectified, whether there is a
+# freewheeling path (always, or only with flyback_diode) and the amount of devices in the conduction path
+TOPOLOGIES = {
+    half_wave_converter: {'full_wave': False, 'freewheel': None, 'devices': 1},
+    semi_converter: {'full_wave': True, 'freewheel': True, 'devices': 2},
+    full_converter: {'full_wave': True, 'freewheel': False, 'devices': 2},
+}
+
+'''
+- Name: get_topology
+- Parameter(s):
+    - builder: Converter builder (half_wave_converter, semi_converter or full_converter)
+    - flyback_diode: Whether the flyback diode Dm is present (only used by half_wave_converter)
+    - C: Output filter capacitance, which is not supported by the fast models
+- Description:
+    Returns the description of the topology used by the fast models, or raises ValueError if there is none
+'''
+
+def get_topology(builder, flyback_diode=False, C=None):
+    if builder not in TOPOLOGIES:
+        raise ValueError('There is no fast model for {}'.format(getattr(builder, '__name__', builder)))
+    if C is not None:
+        raise ValueError('The fast models do not support the output filter (C)')
+    topology = dict(TOPOLOGIES[builder])
+    if topology['freewheel'] is None:
+        topology['freewheel'] = bool(flyback_diode)
+    return topology
+
+'''
+- Name: get_parameters
+- Parameter(s):
+    - alpha, R, L: Trigger angle [0; 1], load resistance [Ω] and inductance [H] (None for a resistive load)
+- Description:
+    Returns alpha, R and L as float arrays with a common (broadcast) shape, so every function of this module
+    solves many operating points at once
+'''
+
+def get_parameters(alpha, R, L):
+    alpha, R, L = np.broadcast_arrays(np.asarray(alpha, dtype=float), np.asarray(R, dtype=float),
+                                      np.asarray(0.0 if L is None else L, dtype=float))
+    return alpha.astype(float), R.astype(float), L.astype(float)
+
+'''
+- Name: get_extinction_angle
+- Parameter(s):
+    - firing_angle: Angle where the switch is fired [rad]
+    - R, L: Load resistance [Ω] and inductance [H]
+    - omega: Angular frequency of the source [rad/s]
+    - limit: Largest conduction angle to look for [rad]
+- Description:
+    Returns the angle where the current of an RL load, fed by the source from the firing angle on (starting from zero),
+    falls back to zero (the extinction angle), or NaN when it does not fall to zero within firing_angle + limit
+    The current is proportional to sin(wt - phi) - sin(alpha - phi) * exp(-(wt - alpha) / tan(phi)), with phi the load angle
+'''
+
+def get_extinction_angle(firing_angle, R, L, omega, limit=2 * np.pi):
+    phi = np.arctan2(omega * L, R)[..., np.newaxis]
+    firing_angle = firing_angle[..., np.newaxis]
+
+    def current(angle):
+        decay = np.exp(-(angle - firing_angle) / np.maximum(np.tan(phi), 1e-12))
+        return np.sin(angle - phi) - np.sin(firing_angle - phi) * decay
+
+    # First zero crossing on a coarse grid, then bisection inside that interval
+    grid = firing_angle + np.linspace(0, limit, 1025)[1:]
+    negative = current(grid) <= 0
+    found = negative.any(axis=-1)
+    index = np.argmax(negative, axis=-1)[..., np.newaxis]
+    high = np.take_along_axis(grid, index, axis=-1)
+    low = np.maximum(high - limit / 1024, firing_angle)
+    for _ in range(40):
+        middle = (low + high) / 2
+        below = current(middle) <= 0
+        high = np.where(below, middle, high)
+        low = np.where(below, low, middle)
+    return np.where(found, high[..., 0], np.nan)
+
+'''
+- Name: average_output_voltage
+- Parameter(s):
+    - builder: Converter builder (half_wave_converter, semi_converter or full_converter)
+    - alpha: Trigger angle [0; 1], as in the builders (scalar or array)
+    - R: Load resistance [Ω] (scalar or array)
+    - L: Load inductance [H] (None for a resistive load)
+    - flyback_diode: Whether the flyback diode Dm is present (half_wave_converter)
+    - amplitude: Amplitude of the source [V]
+    - frequency: Frequency of the source [Hz]
+    - C: Output filter capacitance (not supported, kept to accept the same parameters as the builders)
+- Description:
+    Returns the average output voltage in steady state with the closed-form equations of ideal converters:
+        - Resistive load or freewheeling path: Vm/(2π)·(1+cos α) for half wave, Vm/π·(1+cos α) for full wave
+        - RL load without freewheeling: Vm/(2π)·(cos α - cos β) for half wave, and for the full converter
+          2Vm/π·cos α in continuous conduction or Vm/π·(cos α - cos β) in discontinuous conduction
+    where α = π·alpha is the firing angle and β the extinction angle of the current
+    Example:
+        average_output_voltage(full_converter, np.linspace(0, 1, 1000), R=10, L=0.1)
+'''
+
+def average_output_voltage(builder, alpha=0.5, R=100, L=None, flyback_diode=False, amplitude=220, frequency=50, C=None):
+    topology = get_topology(builder, flyback_diode, C)
+    alpha, R, L = get_parameters(alpha, R, L)
+    firing_angle = np.pi * alpha
+    omega = 2 * np.pi * float(frequency)
+    factor = 1 if topology['full_wave'] else 0.5
+    average = factor * amplitude / np.pi * (1 + np.cos(firing_angle))
+
+    inductive = L > 0
+    if topology['freewheel'] or not inductive.any():
+        return average
+
+    # Without a freewheeling path, the inductor keeps the switches on after the source reverses
+    limit = np.pi if topology['full_wave'] else 2 * np.pi
+    extinction_angle = get_extinction_angle(firing_angle, R, np.where(inductive, L, 1e-12), omega, limit)
+    continuous = np.isnan(extinction_angle)
+    discontinuous_average = factor * amplitude / np.pi * (np.cos(firing_angle) - np.cos(np.where(continuous, 0, extinction_angle)))
+    if topology['full_wave']:
+        rl_average = np.where(continuous, 2 * amplitude / np.pi * np.cos(firing_angle), discontinuous_average)
+    else:
+        rl_average = discontinuous_average
+    return np.where(inductive, rl_average, average)
+
+'''
+- Name: simulate_switched
+- Parameter(s):
+    - Same as average_output_voltage, and:
+    - forward_voltage: Voltage drop of each conducting SCR/diode [V] (0 for ideal switches)
+    - steps_per_period: Amount of time steps of each period of the source
+    - rtol: The simulation stops when, between the start and the end of a period, the average output voltage changes
+      less than rtol·amplitude and the load current less than rtol·amplitude/R
+    - max_periods: Maximum amount of periods to simulate
+- Description:
+    Piecewise-linear model of the converter: the SCRs and diodes are ideal switches (with an optional constant voltage
+    drop) and the RL load is stepped with its exact discrete-time solution. All the operating points (the broadcast
+    shape of alpha, R and L) are simulated at once with NumPy, period by period, until they reach the steady state
+    In continuous conduction the current at the end of a period is an affine function of the one at its start, so it
+    jumps to its fixed point instead of settling over many L/R time constants (the next period checks the jump)
+    Returns a dictionary with the time of the last period and, for every operating point, its output voltage and load
+    current waveforms (last axis: time), their average and RMS values and the amount of simulated periods
+    Example:
+        result = simulate_switched(semi_converter, alpha=np.linspace(0, 1, 500), R=10, L=0.1)
+        result['average'] -> average output voltage of each alpha
+'''
+
+def simulate_switched(builder, alpha=0.5, R=100, L=None, flyback_diode=False, amplitude=220, frequency=50, C=None,
+                      forward_voltage=0.0, steps_per_period=1000, rtol=1e-4, max_periods=200):
+    topology = get_topology(builder, flyback_diode, C)
+    alpha, R, L = get_parameters(alpha, R, L)
+    period = 1 / float(frequency)
+    step_time = period / steps_per_period
+    # The source and the gates are evaluated at the middle of each step
+    angle = 2 * np.pi * (np.arange(steps_per_period) + 0.5) / steps_per_period
+    source = amplitude * np.sin(angle)
+    firing_angle = (np.pi * alpha)[..., np.newaxis]
+    # Gates of the switches that conduct on each half cycle (as the PULSE sources of the builders)
+    gate_positive = (angle >= firing_angle) & (angle < np.pi)
+    gate_negative = (angle >= np.pi + firing_angle) & topology['full_wave']
+
+    inductive = L > 0
+    decay = np.exp(-step_time * R / np.where(inductive, L, 1.0))
+    period_decay = decay ** steps_per_period
+    drop = topology['devices'] * forward_voltage
+
+    current = np.zeros(alpha.shape)
+    state = np.full(alpha.shape, OFF)
+    output = np.empty(alpha.shape + (steps_per_period,))
+    load_current = np.empty_like(output)
+    previous_average = None
+
+    for simulated_periods in range(1, max_periods + 1):
+        start_current = current
+        for step in range(steps_per_period):
+            state = np.where(gate_positive[..., step], POSITIVE, state)
+            state = np.where(gate_negative[..., step], NEGATIVE, state)
+            if topology['freewheel']:
+                # The freewheeling diode takes the current as soon as the bridge voltage is negative
+                if topology['full_wave']:
+                    outside_gates = ~(gate_positive[..., step] | gate_negative[..., step])
+                    state = np.where(outside_gates & (state != OFF), FREEWHEEL, state)
+                elif source[step] < 0:
+                    state = np.where(state == POSITIVE, FREEWHEEL, state)
+
+            voltage = np.select([state == POSITIVE, state == NEGATIVE, state == FREEWHEEL],
+                                [source[step] - drop, -source[step] - drop, -forward_voltage], 0.0)
+            current = np.where(inductive, voltage / R + (current - voltage / R) * decay, voltage / R)
+            # The switches turn off when their current falls to zero
+            off = (current <= 0) | (state == OFF)
+            current = np.where(off, 0.0, current)
+            state = np.where(off, OFF, state)
+            output[..., step] = np.where(off, 0.0, voltage)
+            load_current[..., step] = current
+
+        average = output.mean(axis=-1)
+        # The load current settles much slower than the average voltage when L/R is large
+        settled = np.abs(current - start_current) <= rtol * amplitude / R
+        if previous_average is not None and np.all(settled & (np.abs(average - previous_average) <= rtol * amplitude)):
+            break
+        previous_average = average
+
+        # i_end = period_decay·i_start + c while the current never falls to zero, whose fixed point is the steady state
+        continuous = inductive & np.all(load_current > 0, axis=-1)
+        fixed_point = (current - period_decay * start_current) / np.where(continuous, 1 - period_decay, 1.0)
+        current = np.where(continuous, fixed_point, current)
+
+    return {
+        'time': (simulated_periods - 1) * period + np.arange(steps_per_period) * step_time,
+        'output': output,
+        'current': load_current,
+        'average': average,
+        'rms': np.sqrt(np.mean(output ** 2, axis=-1)),
+        'current_average': load_current.mean(axis=-1),
+        'current_rms': np.sqrt(np.mean(load_current ** 2, axis=-1)),
+        'periods': simulated_periods,
+    }
+
+'''
+- Name: calibrate
+- Parameter(s):
+    - builder: Converter builder (half_wave_converter, semi_converter or full_converter)
+    - points: List of operating points, dictionaries with the parameters of the builder (alpha, R, L, ...)
+    - periods: Amount of periods simulated with ngspice (the last one is compared)
+    - steps_per_period: Resolution of the ngspice simulation and of the switched model
+    - forward_voltage: Voltage drop of the switched model [V]
+- Description:
+    Simulates every point with the full SPICE model of the builder (SCR subcircuits) and with both fast models, and
+    returns one row per point with the average output voltage of each one and the errors of the fast models
+    relative to the amplitude of the source, to check how far the fast models can be trusted
+    Example:
+        rows = calibrate(semi_converter, [{'alpha': 0.2, 'R': 10, 'L': 0.1}, {'alpha': 0.6, 'R': 10, 'L': 0.1}])
+'''
+
+def calibrate(builder, points, periods=10, steps_per_period=1000, forward_voltage=0.0):
+    rows = []
+    for point in points:
+        circuit = get_circuit(builder, **point)
+        amplitude = point.get('amplitude', 220)
+        period = 1 / point.get('frequency', 50)
+
+        simulator = session_simulator(circuit, temperature=25, nominal_temperature=25)
+        names = set_probes(simulator, ['output'])
+        voltages, _ = cached_simulation(simulator, 'transient', names=names, step_time=period / steps_per_period,
+                                        end_time=period * periods)
+        _, spice_output = resample_periods(voltages['time'], voltages['output'], period, periods=1,
+                                           samples_per_period=steps_per_period)
+        spice_average = float(np.mean(spice_output))
+
+        averaged = float(average_output_voltage(builder, **point))
+        switched = float(simulate_switched(builder, forward_voltage=forward_voltage, steps_per_period=steps_per_period,
+                                           **point)['average'])
+        rows.append(dict(point, spice=spice_average, averaged=averaged, switched=switched,
+                         averaged_error=(averaged - spice_average) / amplitude,
+                         switched_error=(switched - spice_average) / amplitude))
+    return rows
+
+'''
+- Name: print_calibration
+- Parameter(s):
+    - rows: List returned by calibrate
+- Description:
+    Prints the average output voltage of each model and the errors of the fast ones [% of the amplitude]
+'''
+
+def print_calibration(rows):
+    print('{:>8} {:>8} {:>8} {:>10} {:>10} {:>10} {:>9} {:>9}'.format(
+        'alpha', 'R', 'L', 'SPICE', 'averaged', 'switched', 'error 1', 'error 2'))
+    for row in rows:
+        print('{:>8.3f} {:>8.3g} {:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>8.2f}% {:>8.2f}%'.format(
+            row.get('alpha', 0.5), row.get('R', 100), '-' if row.get('L') is None else '{:.3g}'.format(row['L']),
+            row['spice'], row['averaged'], row['switched'], row['averaged_error'] * 100, row['switched_error'] * 100))
+    print('Maximum error: averaged {:.2f}%, switched {:.2f}% (of the source amplitude)'.format(
+        max(abs(row['averaged_error']) for row in rows) * 100, max(abs(row['switched_error']) for row in rows) * 100))
@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+
+from profiling import timed
+from utilities import get_output_file_name, pyplot as plt
+
+# Formats saved by default, with their resolution (None for vector formats)
+DEFAULT_FORMATS = {'png': 100}
+
+# Files saved by save_figures in this process (reported by the batch runner)
+saved_files = []
+
+'''
+- Name: get_formats
+- Parameter(s):
+    - formats: Dictionary with the resolution of each format (e.g. {'png': 100, 'svg': None}), or None
+- Description:
+    Returns the formats to save: the given ones, the ones of the FIGURE_FORMATS environment variable
+    (e.g. "png:150,svg") or DEFAULT_FORMATS, in that order of precedence
+'''
+
+def get_formats(formats=None):
+    if formats is not None:
+        return dict(formats)
+
+    policy = os.environ.get('FIGURE_FORMATS')
+    if not policy:
+        return dict(DEFAULT_FORMATS)
+
+    formats = {}
+    for item in policy.split(','):
+        file_format, _, dpi = item.strip().partition(':')
+        if file_format:
+            formats[file_format.lower()] = int(dpi) if dpi else DEFAULT_FORMATS.get(file_format.lower())
+    return formats
+
+'''
+- Name: save_figure
+- Parameter(s):
+    - task: Tuple with the figure number, file path, format and resolution
+- Description:
+    Renders and saves a single figure. In the worker processes the figures are inherited from the script (fork)
+'''
+
+def save_figure(task):
+    number, path, file_format, dpi = task
+    plt.figure(number).savefig(path, format=file_format, dpi=dpi if dpi is not None else 'figure')
+    return path
+
+'''
+- Name: save_figures
+- Parameter(s):
+    - base_name: Base of the file names (e.g. "half-wave-converter-RL-result")
+    - figures: List of figures to save (defaults to every open figure)
+    - formats: Dictionary with the resolution of each format (see get_formats)
+    - processes: Amount of worker processes (defaults to the amount of CPUs)
+- Description:
+    Saves every figure of the script in the "results" folder, in every requested format, rendering them concurrently
+    With a single figure the file is named "<base_name>.<format>", otherwise "<base_name>-<n>.<format>"
+    The saved figures are closed, and the list of saved files is returned
+    Example:
+        save_figures("half-wave-converter-RL-result")  # half-wave-converter-RL-result-1.png, ...-2.png, ...-3.png
+'''
+
+@timed('save_figures')
+def save_figures(base_name, figures=None, formats=None, processes=None):
+    if figures is None:
+        numbers = plt.get_fignums()
+    else:
+        numbers = [figure.number for figure in figures]
+    formats = get_formats(formats)
+
+    tasks = []
+    for position, number in enumerate(numbers, start=1):
+        name = base_name if len(numbers) == 1 else '{}-{}'.format(base_name, position)
+        for file_format, dpi in formats.items():
+            tasks.append((number, get_output_file_name('{}.{}'.format(name, file_format)), file_format, dpi))
+
+    # Worker processes are forked, so they already hold the figures (the daemonic workers of a pool can not fork)
+    processes = min(processes or os.cpu_count() or 1, len(tasks))
+    can_fork = 'fork' in multiprocessing.get_all_start_methods() and not multiprocessing.current_process().daemon
+    if processes > 1 and can_fork:
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            paths = pool.map(save_figure, tasks, chunksize=1)
+    else:
+        paths = [save_figure(task) for task in tasks]
+
+    for number in numbers:
+        plt.close(number)
+    saved_files.extend(paths)
+    return paths
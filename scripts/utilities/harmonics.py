@@ -0,0 +1,173 @@
+import numpy as np
+
+from profiling import timed
+
+# A single-bin DFT over N samples costs about as much as SINGLE_BIN_COST * N of the N * log2(N) operations of a real
+# FFT (measured with numpy, whose FFT is so fast that single bins only pay off for one order of a long window)
+SINGLE_BIN_COST = 16
+
+'''
+- Name: get_window
+- Parameter(s):
+    - name: Window name (rectangular, hann, hamming, blackman)
+    - samples: Amount of samples
+- Description:
+    Returns the (periodic) window coefficients. With an integer number of periods the rectangular window has no leakage
+'''
+
+def get_window(name, samples):
+    n = np.arange(samples)
+    if name == 'rectangular':
+        return np.ones(samples)
+    elif name == 'hann':
+        return 0.5 - 0.5 * np.cos(2 * np.pi * n / samples)
+    elif name == 'hamming':
+        return 0.54 - 0.46 * np.cos(2 * np.pi * n / samples)
+    elif name == 'blackman':
+        return 0.42 - 0.5 * np.cos(2 * np.pi * n / samples) + 0.08 * np.cos(4 * np.pi * n / samples)
+    raise ValueError('Unknown window: {}'.format(name))
+
+'''
+- Name: resample_periods
+- Parameter(s):
+    - t: Time of each sample (non-uniform, as returned by the transient analysis)
+    - y: Value of each sample
+    - period: Period of the source [s]
+    - periods: Amount of whole periods to keep, counted back from the end of the simulation (None to keep all of them)
+    - samples_per_period: Amount of uniform samples per period (None to match the average simulation timestep)
+- Description:
+    Keeps an integer number of steady-state periods (the last ones) and resamples them to a uniform grid with linear interpolation
+    Returns the uniform time grid (without the end point, so the window holds exactly "periods" periods) and the resampled values
+'''
+
+def resample_periods(t, y, period, periods=None, samples_per_period=None):
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y)
+    period = float(period)
+
+    available = int(np.floor((t[-1] - t[0]) / period + 1e-9))
+    if available < 1:
+        raise ValueError('The simulation must hold at least one whole period')
+    periods = available if periods is None else min(int(periods), available)
+
+    start = t[-1] - periods * period
+    if samples_per_period is None:
+        first = np.searchsorted(t, start)
+        samples_per_period = int(np.ceil((len(t) - first) / periods))
+    samples = int(samples_per_period) * periods
+
+    uniform_t = start + np.arange(samples) * (periods * period / samples)
+    if np.iscomplexobj(y):
+        uniform_y = np.interp(uniform_t, t, y.real) + 1j * np.interp(uniform_t, t, y.imag)
+    else:
+        uniform_y = np.interp(uniform_t, t, y)
+    return uniform_t, uniform_y
+
+'''
+- Name: single_bin
+- Parameter(s):
+    - y: Uniform samples (already windowed)
+    - index: Bin of the DFT to compute
+- Description:
+    Returns the DFT of the samples at a single bin, with one pass over them and O(N) memory (the phase is reduced
+    modulo the length, so it stays exact for high bins)
+'''
+
+def single_bin(y, index):
+    samples = len(y)
+    phase = 2 * np.pi * ((int(index) * np.arange(samples)) % samples) / samples
+    return (y @ np.cos(phase)) - 1j * (y @ np.sin(phase))
+
+'''
+- Name: harmonics
+- Parameter(s):
+    - t: Time of each sample (non-uniform, as returned by the transient analysis)
+    - y: Value of each sample
+    - frequency: Fundamental frequency [Hz] (frequency of the source)
+    - orders: Harmonic orders to compute (default 1 to 40). Order 0 is the DC component
+    - periods: Amount of steady-state periods to analyze (the last ones, default all the whole periods)
+    - samples_per_period: Amount of uniform samples per period (None to match the average simulation timestep)
+    - window: Window applied before the analysis (rectangular, hann, hamming, blackman)
+- Description:
+    Computes only the requested harmonics: one real FFT, whose harmonic bins are taken, or a single-bin DFT per order
+    when that is cheaper (orders * N against N * log2(N), see SINGLE_BIN_COST)
+    Returns a dictionary with:
+        - orders, frequency: Order and frequency [Hz] of each harmonic
+        - magnitude, phase: Peak amplitude and phase [rad] of each harmonic
+        - dc: Average value
+        - rms: RMS value of the analyzed periods
+        - thd: Total harmonic distortion, relative to the fundamental (using the requested orders above 1)
+'''
+
+@timed('harmonics')
+def harmonics(t, y, frequency, orders=None, periods=None, samples_per_period=None, window='rectangular'):
+    frequency = float(frequency)
+    orders = np.arange(1, 41) if orders is None else np.atleast_1d(np.asarray(orders, dtype=int))
+    if samples_per_period is not None and samples_per_period <= 2 * orders.max():
+        raise ValueError('samples_per_period must be above twice the highest order (Nyquist)')
+
+    uniform_t, uniform_y = resample_periods(t, y, 1 / frequency, periods, samples_per_period)
+    samples = len(uniform_y)
+    periods = int(round((uniform_t[1] - uniform_t[0]) * samples * frequency))
+    if samples <= 2 * orders.max() * periods:
+        raise ValueError('Not enough samples per period for the requested orders')
+
+    coefficients = get_window(window, samples)
+    weighted = uniform_y * coefficients
+    # Harmonic h lies on bin h * periods, since the window holds "periods" periods of the fundamental
+    bins = orders * periods
+
+    if len(orders) * SINGLE_BIN_COST < np.log2(samples):
+        spectrum = np.array([single_bin(weighted, index) for index in bins])
+    else:
+        spectrum = np.fft.rfft(weighted)[bins]
+
+    scale = np.where(orders == 0, 1.0, 2.0) / coefficients.sum()
+    magnitude = np.abs(spectrum) * scale
+    phase = np.angle(spectrum)
+
+    fundamental = magnitude[orders == 1]
+    distortion = magnitude[orders > 1]
+    if len(fundamental) and fundamental[0] > 0:
+        thd = float(np.sqrt(np.sum(distortion ** 2)) / fundamental[0])
+    else:
+        thd = float('nan')
+
+    return {
+        'orders': orders,
+        'frequency': orders * frequency,
+        'magnitude': magnitude,
+        'phase': phase,
+        'dc': float(np.mean(uniform_y).real),
+        'rms': float(np.sqrt(np.mean(np.abs(uniform_y) ** 2))),
+        'thd': thd,
+    }
+
+'''
+- Name: spectrum
+- Parameter(s):
+    - t: Time of each sample (non-uniform, as returned by the transient analysis)
+    - y: Value of each sample
+    - frequency: Fundamental frequency [Hz]
+    - max_frequency: Highest frequency to return [Hz] (None for all of them, up to Nyquist)
+    - periods, samples_per_period, window: Same as in harmonics
+- Description:
+    Returns the frequency [Hz] and peak amplitude of every bin of the real FFT of the resampled steady-state periods
+'''
+
+@timed('harmonics')
+def spectrum(t, y, frequency, max_frequency=None, periods=None, samples_per_period=None, window='rectangular'):
+    frequency = float(frequency)
+    uniform_t, uniform_y = resample_periods(t, y, 1 / frequency, periods, samples_per_period)
+    samples = len(uniform_y)
+    step = uniform_t[1] - uniform_t[0]
+
+    coefficients = get_window(window, samples)
+    amplitude = np.abs(np.fft.rfft(uniform_y * coefficients)) * 2 / coefficients.sum()
+    amplitude[0] /= 2
+    frequencies = np.fft.rfftfreq(samples, step)
+
+    if max_frequency is not None:
+        last = np.searchsorted(frequencies, float(max_frequency), side='right')
+        frequencies, amplitude = frequencies[:last], amplitude[:last]
+    return frequencies, amplitude
@@ -0,0 +1,370 @@
+import os
+
+import numpy as np
+
+from PySpice.Spice.BasicElement import Resistor, Capacitor, Inductor, VoltageSource, CurrentSource
+from PySpice.Spice.HighLevelElement import SinusoidalMixin
+
+from probes import parse_probe, set_probes
+from result_cache import cached_simulation
+from session import session_simulator, split_netlist, SessionSimulator, VALUE_ATTRIBUTES
+from utilities import format_output, format_waveforms
+
+# Conductance added from every node to ground, as SPICE does, but only when the matrix is singular (floating nodes,
+# or nodes connected only through capacitors at DC), so the circuits that can be solved exactly are not changed
+GMIN = 1e-12
+
+'''
+- Name: get_value
+- Parameter(s):
+    - value: Value of an element (PySpice unit, number or SPICE expression)
+- Description:
+    Returns the value as a float, or None when it can not be evaluated here (e.g. "{r_load}" parameters)
+'''
+
+def get_value(value):
+    if value is None:
+        return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+'''
+- Name: get_source_values
+- Parameter(s):
+    - element: Independent voltage or current source
+- Description:
+    Returns the DC value and the AC magnitude of a source, or None for the sources that are not supported (pulse, PWL, ...)
+'''
+
+def get_source_values(element):
+    if isinstance(element, SinusoidalMixin):
+        dc_value, ac_value = get_value(element.dc_offset), get_value(element.ac_magnitude)
+    elif type(element) in (VoltageSource, CurrentSource):
+        dc_value, ac_value = get_value(element.dc_value), 0.0
+    else:
+        return None
+    if dc_value is None or ac_value is None:
+        return None
+    return dc_value, ac_value
+
+'''
+- Name: LinearCircuit
+- Parameter(s):
+    - circuit: PySpice circuit, made only of resistors, capacitors, inductors and independent sources
+- Description:
+    Modified nodal analysis of a linear circuit. The system is stored as A(w) = G + jw*C, with one row per node
+    (except ground) and one per voltage source and inductor, whose currents are unknowns too, so the DC operating
+    point (w = 0) and every frequency of an AC sweep are solved with the same matrices
+    Raises ValueError if the circuit has any other element (see is_linear)
+'''
+
+class LinearCircuit:
+
+    def __init__(self, circuit):
+        elements = list(circuit.elements)
+        self.nodes = sorted({str(node).lower() for element in elements for node in element.nodes} - {'0'})
+        self.branches = [element.name.lower() for element in elements if isinstance(element, (VoltageSource, Inductor))]
+        self.node_index = node_index = {name: index for index, name in enumerate(self.nodes)}
+        size = len(self.nodes) + len(self.branches)
+
+        self.G = np.zeros((size, size))
+        self.C = np.zeros((size, size))
+        self.dc_excitation = np.zeros(size)
+        self.ac_excitation = np.zeros(size, dtype=complex)
+
+        branch = len(self.nodes)
+        for element in elements:
+            positive, negative = (node_index.get(str(node).lower()) for node in element.nodes)
+
+            if isinstance(element, (Resistor, Capacitor)):
+                value = get_value(element.resistance if isinstance(element, Resistor) else element.capacitance)
+                if value is None:
+                    raise ValueError('Value of {} can not be evaluated: {}'.format(element.name, element.format_spice_parameters()))
+                matrix, admittance = (self.G, 1 / value) if isinstance(element, Resistor) else (self.C, value)
+                self.stamp_admittance(matrix, positive, negative, admittance)
+            elif isinstance(element, (VoltageSource, Inductor)):
+                # Branch current from the positive node, through the element, to the negative one
+                for node, sign in ((positive, 1), (negative, -1)):
+                    if node is not None:
+                        self.G[node, branch] += sign
+                        self.G[branch, node] += sign
+                if isinstance(element, Inductor):
+                    value = get_value(element.inductance)
+                    if value is None:
+                        raise ValueError('Value of {} can not be evaluated: {}'.format(element.name, element.format_spice_parameters()))
+                    self.C[branch, branch] = -value
+                else:
+                    values = self.get_source(element)
+                    self.dc_excitation[branch], self.ac_excitation[branch] = values
+                branch += 1
+            elif isinstance(element, CurrentSource):
+                dc_value, ac_value = self.get_source(element)
+                for node, sign in ((positive, -1), (negative, 1)):
+                    if node is not None:
+                        self.dc_excitation[node] += sign * dc_value
+                        self.ac_excitation[node] += sign * ac_value
+            else:
+                raise ValueError('Element {} is not linear or not supported'.format(element.name))
+
+        # Conductance matrices of the DC and AC systems, with GMIN only if they are singular without it
+        self.dc_matrix = self.G + self.get_shunt(self.G)
+        self.ac_matrix = self.G + self.get_shunt(self.G + 1j * self.C)
+
+    # DC value and AC magnitude of a source (ValueError if it is not supported)
+    @staticmethod
+    def get_source(element):
+        values = get_source_values(element)
+        if values is None:
+            raise ValueError('Source {} is not supported: {}'.format(element.name, element.format_spice_parameters()))
+        return values
+
+    # GMIN from every node to ground if the matrix is singular, zero otherwise
+    def get_shunt(self, matrix):
+        shunt = np.zeros(self.G.shape)
+        if np.linalg.matrix_rank(matrix) < len(matrix):
+            shunt[range(len(self.nodes)), range(len(self.nodes))] = GMIN
+        return shunt
+
+    @staticmethod
+    def stamp_admittance(matrix, positive, negative, admittance):
+        for row, column, sign in ((positive, positive, 1), (negative, negative, 1), (positive, negative, -1), (negative, positive, -1)):
+            if row is not None and column is not None:
+                matrix[row, column] += sign * admittance
+
+    # Splits a solution (last axis: unknowns) in node voltages and branch currents
+    def split(self, solution):
+        nodes = {name: solution[..., index] for index, name in enumerate(self.nodes)}
+        branches = {name: solution[..., len(self.nodes) + index] for index, name in enumerate(self.branches)}
+        return nodes, branches
+
+    def operating_point(self):
+        return self.split(np.linalg.solve(self.dc_matrix, self.dc_excitation)[np.newaxis])
+
+    # Operating points of a batch of cases, solved at once as a stack of systems. "values" has the new values of some
+    # resistors and DC sources (element name -> 1-D array, one value per case), the rest keep their nominal values
+    def batch_operating_point(self, elements, values):
+        cases = len(next(iter(values.values())))
+        matrices = np.repeat(self.dc_matrix[np.newaxis], cases, axis=0)
+        excitation = np.repeat(self.dc_excitation[np.newaxis], cases, axis=0)
+        for name, value in values.items():
+            element = elements[name]
+            positive, negative = (self.node_index.get(str(node).lower()) for node in element.nodes)
+            if isinstance(element, Resistor):
+                pattern = np.zeros(self.G.shape)
+                self.stamp_admittance(pattern, positive, negative, 1)
+                matrices += (1 / value - 1 / get_value(element.resistance))[:, np.newaxis, np.newaxis] * pattern
+            elif type(element) is VoltageSource:
+                excitation[:, len(self.nodes) + self.branches.index(name.lower())] = value
+            elif type(element) is CurrentSource:
+                change = value - get_value(element.dc_value)
+                for node, sign in ((positive, -1), (negative, 1)):
+                    if node is not None:
+                        excitation[:, node] += sign * change
+            elif not isinstance(element, (Capacitor, Inductor)):
+                # Capacitors and inductors are open and short circuits, their values do not change the operating point
+                raise ValueError('The value of {} can not be swept'.format(name))
+        return self.split(np.linalg.solve(matrices, excitation[..., np.newaxis])[..., 0])
+
+    # Every frequency is solved at once, as a stack of complex systems
+    def ac(self, frequency):
+        omega = 2 * np.pi * np.asarray(frequency, dtype=float)
+        matrices = self.ac_matrix[np.newaxis] + 1j * omega[:, np.newaxis, np.newaxis] * self.C[np.newaxis]
+        excitation = np.broadcast_to(self.ac_excitation, (len(omega), len(self.ac_excitation)))
+        return self.split(np.linalg.solve(matrices, excitation[..., np.newaxis])[..., 0])
+
+'''
+- Name: is_linear
+- Parameter(s):
+    - circuit: PySpice circuit
+- Description:
+    Returns whether the circuit can be solved by LinearCircuit: only R, L, C and DC/sinusoidal independent sources,
+    with numeric values (no subcircuits, models or ".param" expressions)
+'''
+
+def is_linear(circuit):
+    for element in circuit.elements:
+        if isinstance(element, (VoltageSource, CurrentSource)):
+            if get_source_values(element) is None:
+                return False
+        elif isinstance(element, Resistor):
+            if get_value(element.resistance) is None:
+                return False
+        elif isinstance(element, Capacitor):
+            if get_value(element.capacitance) is None:
+                return False
+        elif isinstance(element, Inductor):
+            if get_value(element.inductance) is None:
+                return False
+        else:
+            return False
+    return True
+
+'''
+- Name: get_ac_frequencies
+- Parameter(s):
+    - start_frequency, stop_frequency: Band of the sweep [Hz]
+    - number_of_points: Points per decade/octave, or total points for a linear sweep
+    - variation: "dec", "oct" or "lin", as in the SPICE ".ac" analysis
+- Description:
+    Returns the frequencies of an AC sweep, the same grid that ngspice uses
+'''
+
+def get_ac_frequencies(start_frequency, stop_frequency, number_of_points, variation='dec'):
+    start_frequency, stop_frequency = float(start_frequency), float(stop_frequency)
+    if variation == 'lin':
+        return np.linspace(start_frequency, stop_frequency, int(number_of_points))
+    base = {'dec': 10, 'oct': 2}[variation]
+    steps = int(np.floor(np.log(stop_frequency / start_frequency) / np.log(base) * number_of_points + 1e-9))
+    return start_frequency * base ** (np.arange(steps + 1) / number_of_points)
+
+'''
+- Name: solve_linear
+- Parameter(s):
+    - circuit: PySpice circuit (see is_linear)
+    - simulation_mode: Type of simulation (operating_point or ac)
+    - names: Optional list of node/branch names to extract
+    - analysis_parameters: Same keyword arguments of the ngspice analysis (start_frequency, stop_frequency, ...)
+- Description:
+    Solves the circuit in this process, without ngspice, and returns the voltages/currents dictionaries with the same
+    structure produced by format_output
+'''
+
+def solve_linear(circuit, simulation_mode, names=None, **analysis_parameters):
+    linear_circuit = LinearCircuit(circuit)
+    if simulation_mode == 'operating_point':
+        nodes, branches = linear_circuit.operating_point()
+        return format_waveforms(simulation_mode, nodes, branches, None, names)
+    elif simulation_mode == 'ac':
+        frequency = get_ac_frequencies(**analysis_parameters)
+        nodes, branches = linear_circuit.ac(frequency)
+        return format_waveforms(simulation_mode, nodes, branches, frequency, names)
+    raise ValueError('Simulation mode not supported by the linear solver: {}'.format(simulation_mode))
+
+'''
+- Name: fast_simulation
+- Parameter(s):
+    - circuit: PySpice circuit
+    - simulation_mode: Type of simulation (operating_point, transient, ac)
+    - probes: Optional list of signals to probe (see probes.parse_probe)
+    - temperature, nominal_temperature: Temperatures of the simulator [°C]
+    - analysis_parameters: Keyword arguments of the analysis (step_time, end_time, start_frequency, ...)
+- Description:
+    Solves operating point and AC analyses of linear circuits with solve_linear, in this process, and simulates
+    everything else with ngspice (through cached_simulation). The simulator is only created when it is needed
+    Set the environment variable LINEAR_SOLVER to "off" to always use ngspice (e.g. to compare both results)
+    Example:
+        voltages, currents = fast_simulation(circuit, 'operating_point', probes=['out'])
+'''
+
+def fast_simulation(circuit, simulation_mode, probes=None, temperature=25, nominal_temperature=25, **analysis_parameters):
+    names = [parse_probe(probe)[0] for probe in probes] if probes is not None else None
+    use_linear_solver = os.environ.get('LINEAR_SOLVER', '').lower() != 'off'
+    if use_linear_solver and simulation_mode in ('operating_point', 'ac') and is_linear(circuit):
+        return solve_linear(circuit, simulation_mode, names, **analysis_parameters)
+
+    simulator = session_simulator(circuit, temperature=temperature, nominal_temperature=nominal_temperature)
+    if probes is not None:
+        set_probes(simulator, probes)
+    return cached_simulation(simulator, simulation_mode, names=names, **analysis_parameters)
+
+'''
+- Name: get_values
+- Parameter(s):
+    - circuit: PySpice circuit
+    - names: Names of elements (e.g. 'R1', 'Vin') or of ".param" values of the circuit
+- Description:
+    Returns the current value of each name (the ".param" values are read from the netlist, as written by PySpice)
+'''
+
+def get_values(circuit, names):
+    elements = {element.name: element for element in circuit.elements}
+    parameters = split_netlist(str(circuit))[1]
+    values = {}
+    for name in names:
+        if name in elements:
+            attribute = next((attribute for attribute, _ in VALUE_ATTRIBUTES if hasattr(elements[name], attribute)), None)
+            if attribute is None:
+                raise ValueError('The value of {} can not be swept'.format(name))
+            values[name] = getattr(elements[name], attribute)
+        else:
+            values[name] = parameters.get(name.lower())
+    return values
+
+'''
+- Name: set_value
+- Parameter(s):
+    - circuit: PySpice circuit
+    - name: Name of an element (e.g. 'R1', 'Vin') or of a ".param" of the circuit
+    - value: New value (DC value for the sources)
+- Description:
+    Changes the value of an element or a parameter of an existing circuit
+'''
+
+def set_value(circuit, name, value):
+    elements = {element.name: element for element in circuit.elements}
+    if name not in elements:
+        circuit.parameter(name, value)
+        return
+    for attribute, _ in VALUE_ATTRIBUTES:
+        if hasattr(elements[name], attribute):
+            setattr(elements[name], attribute, value)
+            return
+    raise ValueError('The value of {} can not be swept'.format(name))
+
+'''
+- Name: batch_operating_point
+- Parameter(s):
+    - circuit: PySpice circuit, with the nominal values
+    - values: Dictionary with the values of each case for some elements or ".param" values (arrays that broadcast
+      together, e.g. a column and a row for every combination of two lists)
+    - probes: Optional list of signals to probe (see probes.parse_probe)
+    - temperature, nominal_temperature: Temperatures of the simulator [°C]
+- Description:
+    Solves the DC operating point of every case and returns the voltages/currents dictionaries with one array per
+    signal, with the shape of the broadcast values
+    Linear circuits are solved as a single stack of systems (see LinearCircuit.batch_operating_point), the rest with
+    ngspice in a single session: the circuit is loaded once and the values of each case are sent with "alter" and
+    "alterparam" (see SimulatorSession.run_cases). Without the session (NGSPICE_SESSION=off, Xyce) every case is
+    simulated on its own
+    Example:
+        voltages, currents = batch_operating_point(circuit, {'R1': r1[:, np.newaxis], 'R2': r2[np.newaxis, :]}, probes=['out'])
+'''
+
+def batch_operating_point(circuit, values, probes=None, temperature=25, nominal_temperature=25):
+    names = [parse_probe(probe)[0] for probe in probes] if probes is not None else None
+    arrays = np.broadcast_arrays(*(np.asarray(value, dtype=float) for value in values.values()))
+    shape = arrays[0].shape
+    values = {name: array.reshape(-1) for name, array in zip(values, arrays)}
+    elements = {element.name: element for element in circuit.elements}
+
+    use_linear_solver = os.environ.get('LINEAR_SOLVER', '').lower() != 'off'
+    if use_linear_solver and is_linear(circuit) and all(name in elements for name in values):
+        nodes, branches = LinearCircuit(circuit).batch_operating_point(elements, values)
+    else:
+        simulator = session_simulator(circuit, temperature=temperature, nominal_temperature=nominal_temperature)
+        if probes is not None:
+            set_probes(simulator, probes)
+        cases = [{name: float(value[case]) for name, value in values.items()} for case in range(int(np.prod(shape)))]
+        if isinstance(simulator, SessionSimulator):
+            analyses = simulator.run_cases(cases, 'operating_point')
+        else:
+            nominal = get_values(circuit, values)
+            analyses = []
+            try:
+                for case in cases:
+                    for name, value in case.items():
+                        set_value(circuit, name, value)
+                    analyses.append(simulator.operating_point())
+            finally:
+                for name, value in nominal.items():
+                    if value is not None:
+                        set_value(circuit, name, value)
+        results = [format_output(analysis, 'operating_point', names) for analysis in analyses]
+        nodes = {name: np.array([result[0][name] for result in results]) for name in results[0][0]}
+        branches = {name: np.array([result[1][name] for result in results]) for name in results[0][1]}
+
+    nodes = {name: value.reshape(shape) for name, value in nodes.items()}
+    branches = {name: value.reshape(shape) for name, value in branches.items()}
+    return format_waveforms('dc', nodes, branches, None, names)
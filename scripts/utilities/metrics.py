@@ -0,0 +1,263 @@
+import numpy as np
+
+'''
+- Name: get_boundaries
+- Parameter(s):
+    - t: Time of each sample
+    - period: Period of the source [s]
+    - periods: Amount of whole periods to keep, counted back from the end of the simulation (None to keep all of them)
+- Description:
+    Returns the start of every kept period and the end of the last one (periods + 1 instants)
+'''
+
+def get_boundaries(t, period, periods=None):
+    available = int(np.floor((t[-1] - t[0]) / period + 1e-9))
+    if available < 1:
+        raise ValueError('The simulation must hold at least one whole period')
+    periods = available if periods is None else min(int(periods), available)
+    return t[-1] - period * np.arange(periods, -1, -1)
+
+'''
+- Name: insert_boundaries
+- Parameter(s):
+    - t: Time of each sample (non-uniform)
+    - waveforms: List of waveforms sampled at t
+    - boundaries: Instants to add (see get_boundaries)
+- Description:
+    Adds the boundaries of the periods as samples (linearly interpolated) and drops the samples before the first one,
+    so the integrals over every period are exact for the piecewise-linear waveforms
+    Returns the new time, the new waveforms and the position of each boundary
+'''
+
+def insert_boundaries(t, waveforms, boundaries):
+    t = np.asarray(t, dtype=float)
+    waveforms = [np.asarray(waveform, dtype=float) for waveform in waveforms]
+    first = np.searchsorted(t, boundaries[0])
+    new_t = np.union1d(t[first:], boundaries)
+    new_waveforms = [np.interp(new_t, t, waveform) for waveform in waveforms]
+    return new_t, new_waveforms, np.searchsorted(new_t, boundaries)
+
+'''
+- Name: integrate_periods
+- Parameter(s):
+    - t: Time of each sample, with the boundaries already inserted
+    - y: Value of each sample
+    - indexes: Position of each boundary
+- Description:
+    Returns the integral of the waveform over each period (trapezoidal rule, valid for non-uniform timesteps)
+'''
+
+def integrate_periods(t, y, indexes):
+    cumulative = np.concatenate(([0.0], np.cumsum(np.diff(t) * (y[1:] + y[:-1]) / 2)))
+    return np.diff(cumulative[indexes])
+
+'''
+- Name: time_above_periods
+- Parameter(s):
+    - t: Time of each sample, with the boundaries already inserted
+    - y: Value of each sample
+    - threshold: Level to compare with
+    - indexes: Position of each boundary
+- Description:
+    Returns the time the waveform stays above the threshold in each period, with the crossings linearly interpolated
+'''
+
+def time_above_periods(t, y, threshold, indexes):
+    above = y > threshold
+    step = np.diff(t)
+    start, end = y[:-1] - threshold, y[1:] - threshold
+    # Fraction of each step above the threshold: 1 or 0, or the part of the line above it when it crosses
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing = np.where(above[:-1], start, end) / np.abs(end - start)
+    fraction = np.where(above[:-1] == above[1:], above[:-1].astype(float), crossing)
+    cumulative = np.concatenate(([0.0], np.cumsum(step * fraction)))
+    return np.diff(cumulative[indexes])
+
+'''
+- Name: segment_extremes
+- Parameter(s):
+    - y: Value of each sample, with the boundaries already inserted
+    - indexes: Position of each boundary
+- Description:
+    Returns the minimum and maximum of the waveform in each period
+'''
+
+def segment_extremes(y, indexes):
+    starts = indexes[:-1]
+    return np.minimum.reduceat(y, starts)[:len(starts)], np.maximum.reduceat(y, starts)[:len(starts)]
+
+'''
+- Name: waveform_metrics
+- Parameter(s):
+    - t: Time of each sample of the transient analysis (non-uniform)
+    - y: Value of each sample
+    - period: Period of the source [s]
+    - periods: Amount of whole periods to use, counted back from the end (None for all of them)
+    - per_period: If True, every metric is an array with one value per period, otherwise a single value for all the periods
+- Description:
+    Returns the average, RMS, peak to peak ripple, ripple factor (RMS of the AC component / average) and form factor
+    (RMS / average) of a waveform over whole periods, computed in a single pass with trapezoidal integration
+    Example:
+        waveform_metrics(voltages['time'], voltages['output'], source.period, periods=1)
+'''
+
+def waveform_metrics(t, y, period, periods=None, per_period=False):
+    period = float(period)
+    boundaries = get_boundaries(np.asarray(t, dtype=float), period, periods)
+    t, (y,), indexes = insert_boundaries(t, [y], boundaries)
+
+    duration = np.diff(boundaries)
+    integral = integrate_periods(t, y, indexes)
+    square_integral = integrate_periods(t, y * y, indexes)
+    minimum, maximum = segment_extremes(y, indexes)
+    if not per_period:
+        duration, integral, square_integral = duration.sum(), integral.sum(), square_integral.sum()
+        minimum, maximum = minimum.min(), maximum.max()
+
+    average = integral / duration
+    rms = np.sqrt(square_integral / duration)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ripple_factor = np.sqrt(np.maximum(rms ** 2 - average ** 2, 0)) / np.abs(average)
+        form_factor = rms / np.abs(average)
+    return {
+        'average': average,
+        'rms': rms,
+        'ripple': maximum - minimum,
+        'ripple_factor': ripple_factor,
+        'form_factor': form_factor,
+    }
+
+'''
+- Name: conduction_angle
+- Parameter(s):
+    - t: Time of each sample
+    - current: Current through the switch or the load
+    - period: Period of the source [s]
+    - threshold: Current above which it is conducting (defaults to 1 % of the maximum absolute current)
+    - periods: Amount of whole periods to use, counted back from the end (None for all of them)
+- Description:
+    Returns the conduction angle [degrees] in each period: the fraction of the period with current above the threshold
+'''
+
+def conduction_angle(t, current, period, threshold=None, periods=None):
+    period = float(period)
+    current = np.asarray(current, dtype=float)
+    if threshold is None:
+        threshold = 0.01 * np.max(np.abs(current))
+    boundaries = get_boundaries(np.asarray(t, dtype=float), period, periods)
+    t, (current,), indexes = insert_boundaries(t, [current], boundaries)
+    return 360 * time_above_periods(t, current, threshold, indexes) / period
+
+'''
+- Name: get_rising_edges
+- Parameter(s):
+    - t: Time of each sample
+    - y: Value of each sample
+    - threshold: Level of the edge
+- Description:
+    Returns the instants (linearly interpolated) where the waveform crosses the threshold going up
+'''
+
+def get_rising_edges(t, y, threshold):
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float) - threshold
+    edges = np.flatnonzero((y[:-1] <= 0) & (y[1:] > 0))
+    return t[edges] + (t[edges + 1] - t[edges]) * -y[edges] / (y[edges + 1] - y[edges])
+
+'''
+- Name: turn_on_delay
+- Parameter(s):
+    - t: Time of each sample
+    - gate: Gate voltage of the SCR (referred to its cathode)
+    - current: Anode (or load) current
+    - gate_threshold: Gate voltage that defines the trigger instant [V]
+    - current_threshold: Current that defines the start of the conduction (defaults to 1 % of the maximum current)
+- Description:
+    Returns, for each rising edge of the gate, the time until the current rises above the threshold [s]
+    (NaN if it does not conduct before the next gate edge, e.g. when the SCR is reverse biased)
+'''
+
+def turn_on_delay(t, gate, current, gate_threshold=0.5, current_threshold=None):
+    current = np.asarray(current, dtype=float)
+    if current_threshold is None:
+        current_threshold = 0.01 * np.max(np.abs(current))
+    triggers = get_rising_edges(t, gate, gate_threshold)
+    # Instants where the conduction starts, and the ones where the current is already above the threshold at the trigger
+    starts = get_rising_edges(t, current, current_threshold)
+    conducting = np.interp(triggers, t, current) > current_threshold
+
+    following = np.searchsorted(starts, triggers)
+    next_trigger = np.append(triggers[1:], np.inf)
+    delay = np.full(len(triggers), np.nan)
+    valid = following < len(starts)
+    delay[valid] = starts[following[valid]] - triggers[valid]
+    delay[valid & (starts[np.minimum(following, len(starts) - 1)] > next_trigger)] = np.nan
+    delay[conducting] = 0.0
+    return delay
+
+'''
+- Name: power_factor
+- Parameter(s):
+    - t: Time of each sample
+    - voltage: Voltage of the source
+    - current: Current of the source (the sign is not relevant)
+    - period: Period of the source [s]
+    - periods: Amount of whole periods to use, counted back from the end (None for all of them)
+- Description:
+    Returns the input power factor: active power / (RMS voltage * RMS current), over whole periods
+'''
+
+def power_factor(t, voltage, current, period, periods=None):
+    period = float(period)
+    boundaries = get_boundaries(np.asarray(t, dtype=float), period, periods)
+    t, (voltage, current), indexes = insert_boundaries(t, [voltage, current], boundaries)
+    power = integrate_periods(t, voltage * current, indexes).sum()
+    voltage_square = integrate_periods(t, voltage * voltage, indexes).sum()
+    current_square = integrate_periods(t, current * current, indexes).sum()
+    apparent = np.sqrt(voltage_square * current_square)
+    return float(abs(power) / apparent) if apparent > 0 else float('nan')
+
+'''
+- Name: converter_metrics
+- Parameter(s):
+    - voltages, currents: Dictionaries of a transient analysis (format_output/cached_simulation)
+    - period: Period of the source [s]
+    - output: Name of the output voltage
+    - load_current: Optional name of the load current (conduction angle)
+    - source, source_current: Optional names of the source voltage and current (input power factor)
+    - gate: Optional name of the gate voltage referred to the cathode (SCR turn-on delay, measured on the magnitude of
+      the source current, or of the load current if the source current is not given)
+    - periods: Amount of whole periods to use, counted back from the end (defaults to the last one, steady state)
+- Description:
+    Returns a dictionary with every metric that the given signals allow to compute, as plain numbers
+    Example:
+        converter_metrics(voltages, currents, source.period, load_current='l_load', source='a-b',
+                          source_current='vinput', gate='gate1-output')
+'''
+
+def converter_metrics(voltages, currents, period, output='output', load_current=None, source=None,
+                      source_current=None, gate=None, periods=1):
+    t = voltages['time']
+    result = {name: float(value) for name, value in waveform_metrics(t, voltages[output], period, periods).items()}
+    if load_current is not None:
+        result['conduction_angle'] = float(np.mean(conduction_angle(t, currents[load_current], period, periods=periods)))
+    if source is not None and source_current is not None:
+        result['power_factor'] = power_factor(t, voltages[source], currents[source_current], period, periods)
+    if gate is not None and (source_current or load_current) is not None:
+        delays = turn_on_delay(t, voltages[gate], np.abs(currents[source_current or load_current]))
+        result['turn_on_delay'] = float(np.nanmean(delays)) if np.isfinite(delays).any() else float('nan')
+    return result
+
+'''
+- Name: print_metrics
+- Parameter(s):
+    - metrics: Dictionary returned by converter_metrics
+- Description:
+    Prints every metric with its unit
+'''
+
+def print_metrics(metrics):
+    units = {'average': 'V', 'rms': 'V', 'ripple': 'V', 'conduction_angle': '°', 'turn_on_delay': 's'}
+    for name, value in metrics.items():
+        label = name.replace('_', ' ').capitalize().replace('Rms', 'RMS')
+        print('{}: {:.4g} {}'.format(label, value, units.get(name, '')).rstrip())
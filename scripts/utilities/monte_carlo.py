@@ -0,0 +1,367 @@
+import csv
+import multiprocessing
+import os
+import re
+
+import numpy as np
+
+from PySpice.Spice.NgSpice.Shared import NgSpiceCommandError
+
+from builders import get_spice_library, set_parameters, PARAMETERS
+from metrics import waveform_metrics
+from probes import set_probes
+from session import session_simulator
+from utilities import get_cache_file_name
+
+# Parameters of the SCR models (SCR_EC103xx library) that can vary, and the models and parameters each one scales
+SCR_PARAMETERS = {
+    'scr_bv': [('Zbrk', 'BV')],
+    'scr_is': [('Zbrk', 'IS'), ('Pfor', 'IS'), ('Nfor', 'IS')],
+    'scr_bf': [('Pfor', 'BF'), ('Nfor', 'BF')],
+}
+
+# Columns of the result table that are not parameters nor metrics
+INDEX_COLUMN = 'sample'
+FAILED_COLUMN = 'failed'
+
+# State of each worker process: the circuit and its simulator are created only once per process
+_worker = {}
+
+'''
+- Name: draw_samples
+- Parameter(s):
+    - nominal: Dictionary with the nominal value of each varying parameter (e.g. {'R': 10, 'L': 0.1, 'scr_bv': 1})
+    - tolerances: Dictionary with the relative tolerance of each parameter (e.g. {'R': 0.05, 'L': 0.1, 'scr_bv': 0.1})
+    - samples: Amount of samples
+    - seed: Seed of the generator (the same seed always draws the same samples)
+    - distribution: "uniform" (nominal ± tolerance) or "normal" (the tolerance is 3 standard deviations)
+- Description:
+    Draws every sample at once and returns a dictionary with an array of values for each parameter
+    The SCR parameters (see SCR_PARAMETERS) are scale factors of the values of the library, with nominal value 1
+'''
+
+def draw_samples(nominal, tolerances, samples, seed=0, distribution='uniform'):
+    generator = np.random.default_rng(seed)
+    names = list(nominal)
+    tolerance = np.array([tolerances.get(name, 0.0) for name in names], dtype=float)
+    if distribution == 'uniform':
+        deviation = generator.uniform(-1, 1, size=(samples, len(names)))
+    elif distribution == 'normal':
+        deviation = generator.standard_normal(size=(samples, len(names))) / 3
+    else:
+        raise ValueError('Unknown distribution: {}'.format(distribution))
+    values = np.array([nominal[name] for name in names], dtype=float) * (1 + tolerance * deviation)
+    return {name: values[:, index] for index, name in enumerate(names)}
+
+'''
+- Name: get_subcircuit_text
+- Parameter(s):
+    - name: Name of the sub-circuit in the "libraries" folder (e.g. EC103D1)
+- Description:
+    Returns the definition of the sub-circuit, from its ".subckt" line to its ".ends" line, read from its library file
+'''
+
+def get_subcircuit_text(name):
+    spice_library = get_spice_library()
+    with open(spice_library[name], 'rb') as library_file:
+        library_file.seek(spice_library.get_offset(name))
+        content = library_file.read().decode('utf-8', 'replace')
+    end = re.search(r'^[ \t]*\.ends\b.*$', content, re.IGNORECASE | re.MULTILINE)
+    return content[:end.end()] + os.linesep
+
+'''
+- Name: parameterize_subcircuit
+- Parameter(s):
+    - text: Definition of a sub-circuit
+    - parameters: Dictionary with the name of each ".param" and the (model, parameter) pairs it scales (see SCR_PARAMETERS)
+- Description:
+    Replaces the values of the model parameters with expressions, e.g. "BV=400" -> "BV={400*scr_bv}", so they can be
+    changed with ".param" values (circuit.parameter) without editing the library
+'''
+
+def parameterize_subcircuit(text, parameters):
+    scaled = {}
+    for parameter_name, targets in parameters.items():
+        for model, model_parameter in targets:
+            scaled[(model.lower(), model_parameter.lower())] = parameter_name
+
+    lines = []
+    model = None
+    for line in text.splitlines():
+        match = re.match(r'^\s*\.model\s+(\S+)', line, re.IGNORECASE)
+        if match:
+            model = match.group(1).lower()
+        elif not line.lstrip().startswith('+'):
+            model = None
+        if model is not None:
+            def replace(match):
+                parameter_name = scaled.get((model, match.group(1).lower()))
+                if parameter_name is None:
+                    return match.group(0)
+                return '{}={{{}*{}}}'.format(match.group(1), match.group(2), parameter_name)
+            line = re.sub(r'\b([A-Za-z]+)\s*=\s*([-+0-9.eE]+[a-zA-Z]*)', replace, line)
+        lines.append(line)
+    return os.linesep.join(lines) + os.linesep
+
+'''
+- Name: vary_subcircuit
+- Parameter(s):
+    - circuit: Circuit that includes the library of the sub-circuit (e.g. built by semi_converter)
+    - name: Name of the sub-circuit (e.g. EC103D1)
+    - parameters: See parameterize_subcircuit (defaults to SCR_PARAMETERS)
+- Description:
+    Replaces the include of the library with a copy of the sub-circuit whose model parameters are scaled by ".param"
+    values, all of them 1 (nominal) until they are changed with circuit.parameter
+'''
+
+def vary_subcircuit(circuit, name, parameters=None):
+    parameters = SCR_PARAMETERS if parameters is None else parameters
+    library_path = get_spice_library()[name]
+    path = get_cache_file_name('{}-tolerance.lib'.format(name))
+    # Every worker writes the same content, each one to its own temporary file first
+    temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary_path, 'w') as library_file:
+        library_file.write(parameterize_subcircuit(get_subcircuit_text(name), parameters))
+    os.replace(temporary_path, path)
+
+    circuit._includes = [path if include == library_path else include for include in circuit._includes]
+    for parameter_name in parameters:
+        circuit.parameter(parameter_name, 1)
+
+'''
+- Name: init_worker
+- Parameter(s):
+    - builder: Converter builder (e.g. semi_converter)
+    - nominal: Keyword arguments of the builder with the nominal values
+    - subcircuit: Name of the SCR sub-circuit whose parameters vary (None if no SCR parameter varies)
+    - analysis_parameters: Keyword arguments of the transient analysis
+- Description:
+    Builds the circuit and its simulator once in every worker process (each worker owns one ngspice instance)
+'''
+
+def init_worker(builder, nominal, subcircuit, analysis_parameters):
+    circuit = builder(**nominal)
+    if subcircuit is not None:
+        vary_subcircuit(circuit, subcircuit)
+    simulator = session_simulator(circuit, temperature=25, nominal_temperature=25)
+    set_probes(simulator, ['output'])
+    _worker.update(circuit=circuit, simulator=simulator, analysis_parameters=analysis_parameters,
+                   period=1 / nominal.get('frequency', 50))
+
+'''
+- Name: run_sample
+- Parameter(s):
+    - task: Tuple with the index of the sample and its parameter values
+- Description:
+    Patches the ".param" values of the circuit of the worker, simulates it and returns only its scalar metrics
+    (the waveforms are discarded). A sample that fails to simulate, or whose result is too short for the metrics,
+    returns no metrics
+'''
+
+def run_sample(task):
+    index, values = task
+    circuit = _worker['circuit']
+    set_parameters(circuit, **{name: value for name, value in values.items() if name in PARAMETERS})
+    for name, value in values.items():
+        if name not in PARAMETERS:
+            circuit.parameter(name, float(value))
+
+    # Only the failures of the simulator (PySpice raises NameError) and too short results count as failed samples,
+    # any other error is a bug and stops the run
+    try:
+        analysis = _worker['simulator'].transient(**_worker['analysis_parameters'])
+        metrics = waveform_metrics(np.asarray(analysis.time), np.asarray(analysis['output']), _worker['period'], periods=1)
+        metrics = {name: float(value) for name, value in metrics.items()}
+    except (NgSpiceCommandError, NameError, ValueError):
+        metrics = None
+    return index, metrics
+
+'''
+- Name: read_table
+- Parameter(s):
+    - path: Path of a CSV table written by run_monte_carlo
+- Description:
+    Returns the table as a dictionary with an array for each column
+'''
+
+def read_table(path):
+    with open(path, 'r', newline='') as table_file:
+        rows = list(csv.DictReader(table_file))
+    if not rows:
+        return {}
+    return {name: np.array([float(row[name]) for row in rows]) for name in rows[0]}
+
+'''
+- Name: is_same_run
+- Parameter(s):
+    - previous: Table read from the CSV file of a previous run (see read_table)
+    - columns: Columns of the current run
+    - draws: Parameter values of every sample of the current run (see draw_samples)
+- Description:
+    Returns whether the previous table belongs to the current run: same columns and, for every sample it holds,
+    the same parameter values (a different seed, distribution, nominal value or tolerance starts the run again)
+'''
+
+def is_same_run(previous, columns, draws):
+    if list(previous) != columns:
+        return False
+    indexes = previous[INDEX_COLUMN].astype(int)
+    return all(np.allclose(previous[name][indexes < len(values)], values[indexes[indexes < len(values)]], rtol=1e-12, atol=0)
+               for name, values in draws.items())
+
+'''
+- Name: run_monte_carlo
+- Parameter(s):
+    - builder: Converter builder (half_wave_converter, semi_converter, full_converter)
+    - nominal: Keyword arguments of the builder (alpha, R, L, C, ...), also the nominal value of the varying ones
+      (the SCR parameters are scale factors, 1 unless given)
+    - tolerances: Relative tolerance of each varying parameter: R, L, C and the SCR parameters scr_bv, scr_is, scr_bf
+    - samples: Amount of samples
+    - analysis_parameters: Keyword arguments of the transient analysis (step_time, end_time)
+    - seed, distribution: See draw_samples
+    - processes: Amount of worker processes (defaults to the amount of CPUs)
+    - path: Optional CSV file where each row is appended as soon as it is simulated. If the file already holds
+      rows of the same run, those samples are not simulated again, so a long run can be resumed
+- Description:
+    Runs a Monte Carlo tolerance analysis: draws the samples, simulates them in a pool of worker processes (one
+    ngspice instance per worker, or serially inside a daemonic process) and returns a table (dictionary of arrays,
+    one row per sample, in sample order) with the parameter values, the metrics of waveform_metrics (metrics module)
+    and whether the simulation failed
+    Example:
+        table = run_monte_carlo(semi_converter, {'alpha': 0.3, 'R': 10, 'L': 0.1},
+                                {'R': 0.05, 'L': 0.1, 'scr_bv': 0.2}, 1000,
+                                {'step_time': 1e-4, 'end_time': 0.2}, path=get_output_file_name('monte-carlo.csv'))
+'''
+
+def run_monte_carlo(builder, nominal, tolerances, samples, analysis_parameters, seed=0, distribution='uniform',
+                    processes=None, path=None):
+    # The SCR parameters are scale factors, nominal 1
+    nominal = dict({name: 1.0 for name in tolerances if name in SCR_PARAMETERS}, **nominal)
+    varying = {name: value for name, value in nominal.items() if name in tolerances}
+    draws = draw_samples(varying, tolerances, samples, seed, distribution)
+    builder_parameters = {name: value for name, value in nominal.items() if name not in SCR_PARAMETERS}
+    subcircuit = 'EC103D1' if any(name in SCR_PARAMETERS for name in varying) else None
+    metric_names = ['average', 'rms', 'ripple', 'ripple_factor', 'form_factor']
+    columns = [INDEX_COLUMN] + list(draws) + metric_names + [FAILED_COLUMN]
+
+    table = {name: np.full(samples, np.nan) for name in columns}
+    table[INDEX_COLUMN] = np.arange(samples, dtype=float)
+    for name, values in draws.items():
+        table[name] = values
+
+    # Samples already simulated by a previous (interrupted) run, which must have drawn the same parameter values
+    done = set()
+    if path is not None and os.path.isfile(path):
+        previous = read_table(path)
+        if is_same_run(previous, columns, draws):
+            for row, index in enumerate(previous[INDEX_COLUMN].astype(int)):
+                if index < samples:
+                    done.add(index)
+                    for name in metric_names + [FAILED_COLUMN]:
+                        table[name][index] = previous[name][row]
+        else:
+            print('Warning: {} holds a different Monte Carlo run, it is kept as {}.old'.format(path, path))
+            os.replace(path, path + '.old')
+
+    tasks = [(index, {name: float(values[index]) for name, values in draws.items()})
+             for index in range(samples) if index not in done]
+    if tasks:
+        table_file = None
+        if path is not None:
+            new_file = not os.path.isfile(path)
+            table_file = open(path, 'a', newline='')
+            writer = csv.writer(table_file)
+            if new_file:
+                writer.writerow(columns)
+
+        # The daemonic workers of a pool (e.g. run_all) can not have children, so they simulate every sample themselves
+        processes = min(processes or os.cpu_count() or 1, len(tasks))
+        initargs = (builder, builder_parameters, subcircuit, analysis_parameters)
+        pool = None
+        try:
+            if multiprocessing.current_process().daemon:
+                init_worker(*initargs)
+                results = map(run_sample, tasks)
+            else:
+                context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+                pool = context.Pool(processes, initializer=init_worker, initargs=initargs)
+                results = pool.imap_unordered(run_sample, tasks, chunksize=4)
+
+            for index, metrics in results:
+                table[FAILED_COLUMN][index] = float(metrics is None)
+                for name in metric_names:
+                    table[name][index] = np.nan if metrics is None else metrics[name]
+                if table_file is not None:
+                    writer.writerow([repr(float(table[name][index])) for name in columns])
+                    table_file.flush()
+        finally:
+            if pool is not None:
+                pool.terminate()
+            if table_file is not None:
+                table_file.close()
+
+    return table
+
+'''
+- Name: summarize
+- Parameter(s):
+    - values: Values of a metric for every sample (failed samples, NaN, are ignored)
+    - percentiles: Percentiles to report
+    - bins: Amount of bins of the histogram
+- Description:
+    Returns the mean, standard deviation, minimum, maximum, percentiles and histogram (counts and bin edges) of a metric
+'''
+
+def summarize(values, percentiles=(1, 5, 50, 95, 99), bins=20):
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return None
+    counts, edges = np.histogram(values, bins=bins)
+    return {
+        'samples': len(values),
+        'mean': float(np.mean(values)),
+        'std': float(np.std(values)),
+        'min': float(np.min(values)),
+        'max': float(np.max(values)),
+        'percentiles': dict(zip(percentiles, np.percentile(values, percentiles).tolist())),
+        'histogram': (counts, edges),
+    }
+
+'''
+- Name: get_yield
+- Parameter(s):
+    - table: Table returned by run_monte_carlo
+    - limits: Dictionary with the (minimum, maximum) of each metric, None for no limit (e.g. {'average': (90, None)})
+- Description:
+    Returns the fraction of samples that simulated successfully and meet every limit
+'''
+
+def get_yield(table, limits):
+    passed = table[FAILED_COLUMN] == 0
+    for name, (minimum, maximum) in limits.items():
+        if minimum is not None:
+            passed &= table[name] >= minimum
+        if maximum is not None:
+            passed &= table[name] <= maximum
+    return float(np.mean(passed))
+
+'''
+- Name: print_summary
+- Parameter(s):
+    - table: Table returned by run_monte_carlo
+    - metrics: Names of the metrics to summarize
+- Description:
+    Prints the amount of failed samples and the statistics and percentiles of every metric
+'''
+
+def print_summary(table, metrics=('average', 'rms', 'ripple', 'ripple_factor')):
+    print('Samples: {}, failed: {}'.format(len(table[INDEX_COLUMN]), int(np.nansum(table[FAILED_COLUMN]))))
+    for name in metrics:
+        summary = summarize(table[name])
+        if summary is None:
+            print('{}: no data'.format(name))
+            continue
+        percentiles = '  '.join('p{}={:.4g}'.format(percentile, value) for percentile, value in summary['percentiles'].items())
+        print('{}: mean={:.4g} std={:.4g} min={:.4g} max={:.4g}  {}'.format(
+            name, summary['mean'], summary['std'], summary['min'], summary['max'], percentiles))
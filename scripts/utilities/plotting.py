@@ -0,0 +1,110 @@
+import numpy as np
+
+from profiling import timed
+
+'''
+- Name: minmax_envelope
+- Parameter(s):
+    - x: Abscissa of each sample, sorted (e.g. time)
+    - y: Value of each sample
+    - buckets: Amount of buckets (one per pixel column of the plot)
+- Description:
+    Splits the x range in buckets of the same width and keeps, for each one, its first, last, minimum and maximum
+    samples (in their original order). Drawn with one bucket per pixel column, the result looks the same as the
+    full waveform, with at most 4 points per column
+'''
+
+def minmax_envelope(x, y, buckets):
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(x) <= 4 * buckets:
+        return x, y
+
+    span = x[-1] - x[0]
+    if span <= 0:
+        return x[[0, -1]], y[[0, -1]]
+    bucket = np.minimum(((x - x[0]) * (buckets / span)).astype(np.int64), buckets - 1)
+
+    # x is sorted, so every bucket is a contiguous range of samples
+    starts = np.flatnonzero(np.diff(bucket, prepend=-1))
+    ends = np.append(starts[1:], len(x)) - 1
+    minimum = np.minimum.reduceat(y, starts)
+    maximum = np.maximum.reduceat(y, starts)
+
+    # Position of the first minimum/maximum of each bucket
+    bucket_index = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(x))))
+    candidates = np.flatnonzero(y == minimum[bucket_index])
+    _, first = np.unique(bucket_index[candidates], return_index=True)
+    minimum_index = candidates[first]
+    candidates = np.flatnonzero(y == maximum[bucket_index])
+    _, first = np.unique(bucket_index[candidates], return_index=True)
+    maximum_index = candidates[first]
+
+    indexes = np.unique(np.concatenate((starts, ends, minimum_index, maximum_index)))
+    return x[indexes], y[indexes]
+
+'''
+- Name: lttb
+- Parameter(s):
+    - x: Abscissa of each sample, sorted (e.g. time)
+    - y: Value of each sample
+    - points: Amount of points to keep
+- Description:
+    Largest-Triangle-Three-Buckets downsampling: keeps the first and last samples and, for each bucket in between,
+    the sample that forms the largest triangle with the previously kept one and the average of the next bucket
+    It keeps the shape of the waveform with fewer points than the envelope, but may miss narrow spikes
+'''
+
+def lttb(x, y, points):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if points >= len(x) or points < 3:
+        return x, y
+
+    # Buckets of (almost) the same amount of samples, without the first and last samples
+    edges = np.linspace(1, len(x) - 1, points - 1).astype(np.int64)
+    indexes = np.empty(points, dtype=np.int64)
+    indexes[0] = 0
+    indexes[-1] = len(x) - 1
+
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+        else:
+            next_start, next_end = len(x) - 1, len(x)
+        average_x = x[next_start:next_end].mean()
+        average_y = y[next_start:next_end].mean()
+
+        previous = indexes[bucket]
+        areas = np.abs((x[previous] - average_x) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (average_y - y[previous]))
+        indexes[bucket + 1] = start + np.argmax(areas)
+
+    return x[indexes], y[indexes]
+
+'''
+- Name: plot_decimated
+- Parameter(s):
+    - ax: Matplotlib axes
+    - x, y: Abscissa and values of the waveform
+    - method: "minmax" (envelope, looks the same as the full waveform) or "lttb"
+    - points: Amount of buckets (minmax) or points (lttb), defaults to the width of the axes in pixels
+    - args, kwargs: Passed to ax.plot (format, label, color, ...)
+- Description:
+    Same as ax.plot(x, y), but the waveform is reduced before drawing, so the rendering cost depends on the width
+    of the figure instead of the amount of samples
+'''
+
+@timed('plotting')
+def plot_decimated(ax, x, y, *args, method='minmax', points=None, **kwargs):
+    if points is None:
+        points = max(int(ax.get_window_extent().width), 1)
+
+    if method == 'minmax':
+        x, y = minmax_envelope(x, y, points)
+    elif method == 'lttb':
+        x, y = lttb(x, y, points)
+    else:
+        raise ValueError('Unknown decimation method: {}'.format(method))
+    return ax.plot(x, y, *args, **kwargs)
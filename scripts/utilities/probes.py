@@ -0,0 +1,62 @@
+import re
+
+from backend import is_xyce
+
+CURRENT_REGEX = re.compile(r'^\s*(?:i\((\S+)\)|(\S+)#branch)\s*$', re.IGNORECASE)
+
+'''
+- Name: parse_probe
+- Parameter(s):
+    - probe: Signal to probe, one of:
+        - "output": Voltage of a node
+        - "i(l1)" or "l1#branch": Current of a voltage source or inductor
+        - "a-b": Differential voltage between two nodes ("a-0" is the voltage of "a")
+- Description:
+    Returns the name of the signal in the voltages/currents dictionaries and the vectors the simulator has to save to compute it
+'''
+
+def parse_probe(probe):
+    probe = str(probe).strip()
+    match = CURRENT_REGEX.match(probe)
+    if match:
+        name = (match.group(1) or match.group(2)).lower()
+        return name, [name + '#branch']
+
+    name = probe.lower()
+    if '-' in name:
+        positive, negative = name.split('-', 1)
+        if not positive or not negative:
+            raise ValueError('Invalid differential probe: {}'.format(probe))
+        return name, [node for node in (positive, negative) if node != '0']
+    return name, [name]
+
+'''
+- Name: set_probes
+- Parameter(s):
+    - simulator: PySpice simulator
+    - probes: List of signals to probe (see parse_probe), e.g. ['output', 'gate', 'i(l1)', 'a-b']
+- Description:
+    Replaces the vectors saved by the simulator (".save" statement) with only the ones needed by the probes, so the
+    internal nodes of the sub-circuits and the unused signals are neither stored by the simulator nor transferred
+    Returns the list of names to give to format_output/cached_simulation, so only the probed signals are formatted
+    Example:
+        names = set_probes(simulator, ['a-b', 'output', 'i(l_load)'])
+        voltages, currents = cached_simulation(simulator, 'transient', names=names, step_time=..., end_time=...)
+'''
+
+def set_probes(simulator, probes):
+    names = []
+    vectors = []
+    for probe in probes:
+        name, saved = parse_probe(probe)
+        names.append(name)
+        vectors.extend(vector for vector in saved if vector not in vectors)
+
+    # Xyce writes every vector and its ".save" statement stores initial conditions instead
+    if is_xyce(simulator):
+        return names
+
+    # The option to save every device current would defeat the purpose
+    simulator._options.pop('SAVECURRENTS', None)
+    simulator._saved_nodes = set(vectors)
+    return names
@@ -0,0 +1,186 @@
+import atexit
+import contextlib
+import datetime
+import functools
+import json
+import os
+import re
+import sys
+import time
+
+from utilities import get_output_file_name
+
+PROFILE_FILE_NAME = 'profile.jsonl'
+
+# Lines of the ngspice "rusage" report, e.g. "Transient timepoints = 1234"
+STATISTIC_REGEX = re.compile(r'^\s*([A-Za-z][A-Za-z ()]*?)\s*=\s*([-+0-9.eE]+)')
+
+'''
+- Name: is_enabled
+- Parameter(s):
+    - None
+- Description:
+    Profiling is enabled with the environment variable PROFILE set to "Yes", otherwise every span is a no-op
+'''
+
+def is_enabled():
+    return os.environ.get('PROFILE') == 'Yes'
+
+'''
+- Name: Profiler
+- Parameter(s):
+    - name: Name of the run (defaults to the name of the script)
+- Description:
+    Collects the wall and CPU time of each stage (span) of a run and the statistics of every simulation, and
+    writes them as one JSON line to "results/profile.jsonl" (or the file set in the PROFILE_FILE variable)
+    Repeated spans with the same name are accumulated (e.g. three "simulation" spans for three circuits)
+'''
+
+class Profiler:
+
+    def __init__(self, name=None):
+        self.name = name or os.path.splitext(os.path.basename(sys.argv[0] or 'interactive'))[0]
+        self.started = datetime.datetime.now().isoformat(timespec='seconds')
+        self.spans = {}
+        self.simulations = []
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._emitted = False
+
+    @contextlib.contextmanager
+    def span(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            record = self.spans.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'count': 0})
+            record['wall'] += time.perf_counter() - wall
+            record['cpu'] += time.process_time() - cpu
+            record['count'] += 1
+
+    # Adds the statistics of a simulation (see get_ngspice_statistics)
+    def add_simulation(self, simulation_mode, statistics):
+        self.simulations.append(dict(statistics, simulation_mode=simulation_mode))
+
+    def to_dict(self):
+        record = {
+            'run': self.name,
+            'started': self.started,
+            'wall': time.perf_counter() - self._wall,
+            'cpu': time.process_time() - self._cpu,
+            'spans': self.spans,
+            'simulations': self.simulations,
+        }
+        try:
+            import resource
+            # Peak resident memory [kB on Linux]
+            record['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        except ImportError:
+            pass
+        return record
+
+    # Writes the JSON line (only once per run)
+    def emit(self):
+        if self._emitted:
+            return
+        self._emitted = True
+        path = os.environ.get('PROFILE_FILE') or get_output_file_name(PROFILE_FILE_NAME)
+        with open(path, 'a') as profile_file:
+            profile_file.write(json.dumps(self.to_dict()) + '\n')
+
+_profiler = None
+
+'''
+- Name: get_profiler
+- Parameter(s):
+    - None
+- Description:
+    Returns the profiler of the current run (created on first use, and emitted when the interpreter exits)
+'''
+
+def get_profiler():
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+        atexit.register(_profiler.emit)
+    return _profiler
+
+'''
+- Name: span
+- Parameter(s):
+    - name: Name of the stage (netlist, simulation, format, harmonics, plotting, ...)
+- Description:
+    Context manager that measures the wall and CPU time of the stage, when profiling is enabled
+    Example:
+        with span('netlist'):
+            print(circuit)
+'''
+
+@contextlib.contextmanager
+def span(name):
+    if not is_enabled():
+        yield
+        return
+    with get_profiler().span(name):
+        yield
+
+'''
+- Name: timed
+- Parameter(s):
+    - name: Name of the stage
+- Description:
+    Decorator that measures every call of a function as a span
+'''
+
+def timed(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+'''
+- Name: get_ngspice_statistics
+- Parameter(s):
+    - simulator: PySpice simulator, just after running an analysis
+- Description:
+    Returns the statistics of the last analysis reported by ngspice ("rusage all", the same values printed with
+    ".option acct"): accepted/rejected timepoints, iterations, analysis time, ... with snake_case names
+    Returns an empty dictionary for simulators that do not run in the shared ngspice library
+'''
+
+def get_ngspice_statistics(simulator):
+    ngspice = getattr(simulator, 'ngspice', None)
+    if ngspice is None:
+        return {}
+    try:
+        report = ngspice.exec_command('rusage all')
+    except Exception:
+        return {}
+
+    statistics = {}
+    for line in report.splitlines():
+        match = STATISTIC_REGEX.match(line)
+        if match:
+            name = re.sub(r'\W+', '_', match.group(1).strip().lower()).strip('_')
+            value = float(match.group(2))
+            statistics[name] = int(value) if value.is_integer() else value
+    return statistics
+
+'''
+- Name: record_simulation
+- Parameter(s):
+    - simulator: PySpice simulator, just after running an analysis
+    - simulation_mode: Type of simulation (operating_point, transient, ac)
+    - cached: Whether the result was taken from the cache (there are no statistics then)
+- Description:
+    Adds the ngspice statistics of the last analysis to the profile of the run, when profiling is enabled
+'''
+
+def record_simulation(simulator, simulation_mode, cached=False):
+    if is_enabled():
+        statistics = {} if cached else get_ngspice_statistics(simulator)
+        get_profiler().add_simulation(simulation_mode, dict(statistics, cached=cached))
@@ -0,0 +1,281 @@
+import ctypes.util
+import hashlib
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+import PySpice
+
+from profiling import record_simulation, span
+from utilities import format_output, format_waveforms, get_output_file_name, get_waveform_name
+
+CACHE_FOLDER_NAME = 'simulation-cache'
+CACHE_VERSION = 1
+
+# ".include path" and ".lib path [section]" lines of a library file (the path may be quoted)
+INCLUDE_REGEX = re.compile(r'^\s*\.(?:include|inc|lib)\s+["\']?([^"\'\s]+)', re.IGNORECASE | re.MULTILINE)
+
+# Maximum size of the cache folder, the least recently used results are deleted when it is exceeded
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+'''
+- Name: get_cache_folder
+- Parameter(s):
+    - None
+- Description:
+    Returns the absolute path to the folder that holds the cached simulation results, inside "results"
+'''
+
+def get_cache_folder():
+    my_path = get_output_file_name(CACHE_FOLDER_NAME)
+
+    if not os.path.isdir(my_path):
+        os.makedirs(my_path)
+
+    return my_path
+
+'''
+- Name: get_simulator_version
+- Parameter(s):
+    - simulator: PySpice simulator
+- Description:
+    Returns a string that identifies the simulator and its version, without starting it
+    It is made of the simulator type, the PySpice version and the size/mtime of the installed simulator binaries
+'''
+
+def get_simulator_version(simulator):
+    version = [type(simulator).__name__, getattr(simulator, 'SIMULATOR', ''), PySpice.__version__]
+    candidates = [
+        os.environ.get('NGSPICE_LIBRARY_PATH'),
+        ctypes.util.find_library('ngspice'),
+        shutil.which('ngspice'),
+        shutil.which('Xyce'),
+    ]
+    for candidate in candidates:
+        if candidate and os.path.isfile(candidate):
+            status = os.stat(os.path.realpath(candidate))
+            version.append('{}:{}:{}'.format(os.path.realpath(candidate), status.st_size, int(status.st_mtime)))
+        elif candidate:
+            version.append(candidate)
+    return '|'.join(version)
+
+'''
+- Name: normalize_netlist
+- Parameter(s):
+    - netlist: SPICE netlist (string)
+- Description:
+    Removes comments, blank lines and redundant whitespace, so equivalent netlists get the same key
+'''
+
+def normalize_netlist(netlist):
+    lines = []
+    for line in netlist.splitlines():
+        line = ' '.join(line.split())
+        if line and not line.startswith('*'):
+            lines.append(line)
+    return '\n'.join(lines)
+
+'''
+- Name: hash_library
+- Parameter(s):
+    - digest: hashlib object to update
+    - path: Path of an included library file
+    - visited: Set with the real paths already hashed (to not loop on circular includes)
+- Description:
+    Adds the contents of the library file, and of every file it includes (recursively), to the digest
+    Relative paths are resolved from the folder of the file that includes them, as ngspice does
+'''
+
+def hash_library(digest, path, visited):
+    path = os.path.realpath(str(path))
+    if path in visited:
+        return
+    visited.add(path)
+    try:
+        with open(path, 'rb') as library_file:
+            contents = library_file.read()
+    except OSError:
+        # Missing file: the simulator fails anyway, the path alone identifies it
+        digest.update(path.encode())
+        return
+    digest.update(contents)
+
+    folder = os.path.dirname(path)
+    for included_path in INCLUDE_REGEX.findall(contents.decode(errors='replace')):
+        hash_library(digest, os.path.join(folder, os.path.expanduser(included_path)), visited)
+
+'''
+- Name: get_cache_key
+- Parameter(s):
+    - simulator: PySpice simulator, with the circuit to simulate
+    - simulation_mode: Type of simulation (operating_point, transient, ac)
+    - analysis_parameters: Keyword arguments of the analysis
+- Description:
+    Returns the hash that identifies a simulation: normalized netlist and simulator settings, contents of the
+    included libraries (and of the files they include), analysis parameters and simulator version
+'''
+
+def get_cache_key(simulator, simulation_mode, analysis_parameters):
+    digest = hashlib.sha256()
+    digest.update(str(CACHE_VERSION).encode())
+    # Netlist, options, saved vectors and initial conditions (the analysis is added below)
+    netlist = simulator.circuit.str(simulator=simulator.SIMULATOR) + simulator.str_options()
+    digest.update(normalize_netlist(netlist).encode())
+    for settings in ('_saved_nodes', '_initial_condition', '_node_set', '_measures'):
+        values = getattr(simulator, settings, ())
+        # Initial conditions and node sets are dictionaries: their values identify the simulation as much as the nodes
+        items = values.items() if isinstance(values, dict) else values
+        digest.update(repr(sorted(str(item) for item in items)).encode())
+
+    circuit = simulator.circuit
+    visited = set()
+    for path in list(getattr(circuit, '_includes', [])) + [lib[0] for lib in getattr(circuit, '_libs', [])]:
+        hash_library(digest, path, visited)
+
+    parameters = {}
+    for name, value in sorted(analysis_parameters.items()):
+        try:
+            parameters[name] = float(value)
+        except (TypeError, ValueError):
+            parameters[name] = str(value)
+    digest.update(json.dumps([simulation_mode, parameters], sort_keys=True).encode())
+    digest.update(get_simulator_version(simulator).encode())
+
+    return digest.hexdigest()
+
+'''
+- Name: evict
+- Parameter(s):
+    - folder: Cache folder
+    - max_size: Maximum size of the folder [bytes]
+- Description:
+    Deletes the least recently used results until the folder fits in max_size
+'''
+
+def evict(folder, max_size):
+    entries = []
+    for item in os.scandir(folder):
+        if item.is_file() and item.name.endswith('.npz'):
+            status = item.stat()
+            entries.append((status.st_mtime, status.st_size, item.path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+            total_size -= size
+        except OSError:
+            pass
+
+'''
+- Name: load_result
+- Parameter(s):
+    - path: Path of a cached result
+    - names: Optional list of node/branch names to extract
+- Description:
+    Loads a cached result and returns it with the same structure produced by format_output
+'''
+
+def load_result(path, names=None):
+    with np.load(path, allow_pickle=False) as data:
+        metadata = json.loads(str(data['metadata']))
+        abscissa = data['abscissa'] if 'abscissa' in data.files else None
+        nodes = {name: data['node_' + str(index)] for index, name in enumerate(metadata['nodes'])}
+        branches = {name: data['branch_' + str(index)] for index, name in enumerate(metadata['branches'])}
+    return format_waveforms(metadata['simulation_mode'], nodes, branches, abscissa, names)
+
+'''
+- Name: save_result
+- Parameter(s):
+    - path: Path of the cached result
+    - analysis: SPICE simulation result
+    - simulation_mode: Type of simulation (operating_point, transient, ac)
+- Description:
+    Saves the raw values of every node and branch of the analysis in a compressed NumPy file
+'''
+
+def save_result(path, analysis, simulation_mode):
+    nodes = [get_waveform_name(node) for node in analysis.nodes.values()]
+    branches = [get_waveform_name(branch) for branch in analysis.branches.values()]
+    arrays = {
+        'metadata': np.array(json.dumps({'simulation_mode': simulation_mode, 'nodes': nodes, 'branches': branches})),
+    }
+    for index, node in enumerate(analysis.nodes.values()):
+        arrays['node_' + str(index)] = np.asarray(node)
+    for index, branch in enumerate(analysis.branches.values()):
+        arrays['branch_' + str(index)] = np.asarray(branch)
+    if simulation_mode == 'transient':
+        arrays['abscissa'] = np.asarray(analysis.time)
+    elif simulation_mode == 'ac':
+        arrays['abscissa'] = np.asarray(analysis.frequency)
+
+    # Write to a temporary file first, so an interrupted run never leaves a corrupted result
+    temporary_path = path + '.tmp.npz'
+    np.savez_compressed(temporary_path, **arrays)
+    os.replace(temporary_path, path)
+
+'''
+- Name: simulate
+- Parameter(s):
+    - simulator: PySpice simulator
+    - simulation_mode: Type of simulation (operating_point, transient, ac)
+    - names: Optional list of node/branch names to extract
+    - path: Path where the result is cached (None to not cache it)
+    - max_size: Maximum size of the cache folder [bytes]
+    - analysis_parameters: Keyword arguments of the analysis
+- Description:
+    Runs the analysis, caches the raw result and returns it formatted, measuring each stage when profiling is enabled
+'''
+
+def simulate(simulator, simulation_mode, names=None, path=None, max_size=DEFAULT_MAX_SIZE, **analysis_parameters):
+    with span('simulation'):
+        analysis = getattr(simulator, simulation_mode)(**analysis_parameters)
+    record_simulation(simulator, simulation_mode)
+
+    if path is not None:
+        with span('cache'):
+            save_result(path, analysis, simulation_mode)
+            evict(os.path.dirname(path), max_size)
+
+    with span('format'):
+        return format_output(analysis, simulation_mode, names)
+
+'''
+- Name: cached_simulation
+- Parameter(s):
+    - simulator: PySpice simulator (e.g. circuit.simulator(temperature=25, nominal_temperature=25))
+    - simulation_mode: Type of simulation (operating_point, transient, ac)
+    - names: Optional list of node/branch names to extract
+    - max_size: Maximum size of the cache folder [bytes]
+    - analysis_parameters: Keyword arguments of the analysis (step_time, end_time, ...)
+- Description:
+    Runs the analysis (or takes it from the cache, without starting the simulator, if the same simulation was
+    already run) and returns the voltages/currents dictionaries, with the same structure produced by format_output
+    Set the environment variable SIMULATION_CACHE to "off" to always simulate
+    Example:
+        voltages, currents = cached_simulation(simulator, 'transient', step_time=source.period/200, end_time=source.period*2)
+'''
+
+def cached_simulation(simulator, simulation_mode, names=None, max_size=DEFAULT_MAX_SIZE, **analysis_parameters):
+    if os.environ.get('SIMULATION_CACHE', '').lower() == 'off':
+        return simulate(simulator, simulation_mode, names, **analysis_parameters)
+
+    with span('cache'):
+        folder = get_cache_folder()
+        path = os.path.join(folder, get_cache_key(simulator, simulation_mode, analysis_parameters) + '.npz')
+
+        if os.path.isfile(path):
+            try:
+                result = load_result(path, names)
+                os.utime(path)  # Mark as recently used
+                record_simulation(simulator, simulation_mode, cached=True)
+                return result
+            except (OSError, ValueError, KeyError):
+                # Corrupted entry, simulate again
+                pass
+
+    return simulate(simulator, simulation_mode, names, path, max_size, **analysis_parameters)
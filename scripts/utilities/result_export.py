@@ -0,0 +1,207 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from profiling import timed
+from utilities import format_waveforms
+
+METADATA_FILE_NAME = 'metadata.json'
+EXPORT_VERSION = 1
+
+# Units of the abscissa of each simulation mode
+ABSCISSA_UNITS = {'transient': ('time', 's'), 'ac': ('frequency', 'Hz')}
+
+'''
+- Name: get_raw_values
+- Parameter(s):
+    - simulation_mode: Type of simulation (operating_point, transient, ac)
+    - value: Value of a node/branch, as returned by format_output
+- Description:
+    Returns the value as a 1-D array: the complex values for ac (rebuilt from magnitude and phase), one element for operating point
+'''
+
+def get_raw_values(simulation_mode, value):
+    if simulation_mode == 'ac':
+        return np.asarray(value['magnitude']) * np.exp(1j * np.asarray(value['phase']))
+    return np.asarray(value, dtype=float).reshape(-1)
+
+'''
+- Name: is_enabled
+- Parameter(s):
+    - None
+- Description:
+    Exporting is enabled with the environment variable EXPORT_RESULTS set to "Yes". It is off by default, since the
+    simulations are already stored (compressed) by the result cache, and writing every waveform again costs time and disk
+'''
+
+def is_enabled():
+    return os.environ.get('EXPORT_RESULTS') == 'Yes'
+
+'''
+- Name: export_results
+- Parameter(s):
+    - path: Path of the result folder (e.g. get_output_file_name('half-wave-converter'))
+    - simulation_mode: Type of simulation (operating_point, transient, ac)
+    - voltages, currents: Dictionaries returned by format_output/cached_simulation
+    - netlist: Optional netlist of the simulated circuit (e.g. str(circuit))
+    - parameters: Optional dictionary with the parameters of the simulation (analysis and circuit values)
+- Description:
+    Saves the result as a folder with one ".npy" file per signal (columnar) and a JSON file with the simulation mode,
+    names, units, netlist and parameters. The ".npy" files are not compressed, so they can be memory-mapped by load_results
+    The folder is replaced atomically, an interrupted export never leaves a half written result
+    Nothing is written unless exporting is enabled (see is_enabled)
+'''
+
+@timed('export')
+def export_results(path, simulation_mode, voltages, currents, netlist=None, parameters=None):
+    if not is_enabled():
+        return
+    abscissa_name, abscissa_unit = ABSCISSA_UNITS.get(simulation_mode, (None, None))
+    columns = []
+    for kind, values, unit in (('nodes', voltages, 'V'), ('branches', currents, 'A')):
+        for name, value in values.items():
+            if name != abscissa_name:
+                columns.append((kind, name, unit, get_raw_values(simulation_mode, value)))
+
+    metadata = {
+        'version': EXPORT_VERSION,
+        'simulation_mode': simulation_mode,
+        'netlist': netlist,
+        'parameters': {name: value if isinstance(value, (int, str, bool)) or value is None else float(value)
+                       for name, value in (parameters or {}).items()},
+        'abscissa': None,
+        'nodes': {},
+        'branches': {},
+        'units': {},
+    }
+
+    temporary_path = path.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+
+    if abscissa_name is not None:
+        np.save(os.path.join(temporary_path, 'abscissa.npy'), np.asarray(voltages[abscissa_name], dtype=float))
+        metadata['abscissa'] = abscissa_name
+        metadata['units'][abscissa_name] = abscissa_unit
+
+    for index, (kind, name, unit, values) in enumerate(columns):
+        file_name = 'signal_{}.npy'.format(index)
+        np.save(os.path.join(temporary_path, file_name), values)
+        metadata[kind][name] = file_name
+        metadata['units'][name] = unit
+
+    with open(os.path.join(temporary_path, METADATA_FILE_NAME), 'w') as metadata_file:
+        json.dump(metadata, metadata_file, indent=1)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(temporary_path, path)
+
+'''
+- Name: StoredResult
+- Parameter(s):
+    - path: Path of a result folder saved by export_results
+- Description:
+    Result loaded by load_results. Only the metadata is read when it is opened, each signal is memory-mapped the first
+    time it is used, so reading one signal of a 1M-point result does not load the rest
+    Examples:
+        result = load_results(path)
+        result['output'][-1000:] -> last 1000 points, only those pages are read from disk
+        voltages, currents = result.to_dicts(['output']) -> same structure returned by format_output
+'''
+
+class StoredResult:
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, METADATA_FILE_NAME), 'r') as metadata_file:
+            self.metadata = json.load(metadata_file)
+        if self.metadata.get('version') != EXPORT_VERSION:
+            raise ValueError('Unsupported result version: {}'.format(self.metadata.get('version')))
+        self._arrays = {}
+
+    @property
+    def simulation_mode(self):
+        return self.metadata['simulation_mode']
+
+    @property
+    def netlist(self):
+        return self.metadata['netlist']
+
+    @property
+    def parameters(self):
+        return self.metadata['parameters']
+
+    @property
+    def units(self):
+        return self.metadata['units']
+
+    @property
+    def nodes(self):
+        return list(self.metadata['nodes'])
+
+    @property
+    def branches(self):
+        return list(self.metadata['branches'])
+
+    # Memory-maps a file of the result (only once)
+    def _load(self, file_name):
+        if file_name not in self._arrays:
+            self._arrays[file_name] = np.load(os.path.join(self.path, file_name), mmap_mode='r')
+        return self._arrays[file_name]
+
+    @property
+    def abscissa(self):
+        if self.metadata['abscissa'] is None:
+            return None
+        return self._load('abscissa.npy')
+
+    def __contains__(self, name):
+        return name == self.metadata['abscissa'] or name in self.metadata['nodes'] or name in self.metadata['branches']
+
+    # Returns the raw values of a signal (nodes first, then branches), or the abscissa ("time"/"frequency")
+    def __getitem__(self, name):
+        if name == self.metadata['abscissa']:
+            return self.abscissa
+        elif name in self.metadata['nodes']:
+            return self._load(self.metadata['nodes'][name])
+        elif name in self.metadata['branches']:
+            return self._load(self.metadata['branches'][name])
+        raise KeyError(name)
+
+    # Returns the voltages/currents dictionaries, as format_output does, memory-mapping only the requested signals
+    def to_dicts(self, names=None):
+        nodes = {name: LazyColumn(self, file_name) for name, file_name in self.metadata['nodes'].items()}
+        branches = {name: LazyColumn(self, file_name) for name, file_name in self.metadata['branches'].items()}
+        return format_waveforms(self.simulation_mode, nodes, branches, self.abscissa, names)
+
+'''
+- Name: LazyColumn
+- Parameter(s):
+    - result: StoredResult that holds the column
+    - file_name: File of the column
+- Description:
+    Placeholder of a column that is only memory-mapped when it is converted to an array
+'''
+
+class LazyColumn:
+
+    def __init__(self, result, file_name):
+        self._result = result
+        self._file_name = file_name
+
+    def __array__(self, dtype=None, copy=None):
+        array = self._result._load(self._file_name)
+        return array if dtype is None else array.astype(dtype)
+
+'''
+- Name: load_results
+- Parameter(s):
+    - path: Path of a result folder saved by export_results
+- Description:
+    Opens a saved result, without reading the signals (see StoredResult)
+'''
+
+def load_results(path):
+    return StoredResult(path)
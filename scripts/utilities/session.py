@@ -0,0 +1,268 @@
+import functools
+import os
+import re
+
+from PySpice.Spice.HighLevelElement import PulseMixin, SinusoidalMixin
+from PySpice.Spice.NgSpice.Shared import NgSpiceShared, NgSpiceCommandError
+from PySpice.Spice.NgSpice.Simulation import NgSpiceSharedCircuitSimulator
+from PySpice.Spice.Simulation import CircuitSimulator
+
+from backend import backend_simulator
+
+# Attribute of the PySpice elements with a plain value, and the parameter of "alter" that sets it
+VALUE_ATTRIBUTES = (('resistance', 'resistance'), ('capacitance', 'capacitance'), ('inductance', 'inductance'),
+                    ('dc_value', 'dc'))
+
+# Lines of the netlist whose value can be changed with "alter": passive elements and DC sources with a plain value,
+# and sources with a pulse or sinusoidal waveform
+PASSIVE_LINE = re.compile(r'^([rlcvi]\S*)(\s+\S+\s+\S+\s+)(\S+)$', re.IGNORECASE)
+SOURCE_LINE = re.compile(r'^([vi]\S*)(\s.*?\b(pulse|sin)\()(.*)(\)\s*)$', re.IGNORECASE)
+
+'''
+- Name: split_netlist
+- Parameter(s):
+    - netlist: Netlist of the circuit, without the analyses
+- Description:
+    Splits the netlist in:
+        - Its structure: every line, with the values that can be altered replaced by a mark
+        - The values of the ".param" lines
+        - The values of the elements that can be altered (see PASSIVE_LINE and SOURCE_LINE)
+    Two netlists with the same structure only differ in values that can be sent to a loaded circuit
+'''
+
+def split_netlist(netlist):
+    structure = []
+    parameters = {}
+    values = {}
+    in_subcircuit = False
+    for line in netlist.splitlines():
+        lower = line.lower()
+        if lower.startswith('.subckt'):
+            in_subcircuit = True
+        elif lower.startswith('.ends'):
+            in_subcircuit = False
+        elif lower.startswith('.param ') and not in_subcircuit:
+            name, _, value = line[len('.param '):].partition('=')
+            parameters[name.strip().lower()] = value.strip()
+            continue
+        elif not in_subcircuit and '{' not in line:
+            match = PASSIVE_LINE.match(line) or SOURCE_LINE.match(line)
+            if match is not None:
+                values[match.group(1)] = line
+                line = '{}{}*'.format(match.group(1), match.group(2))
+        structure.append(line)
+    return '\n'.join(structure), parameters, values
+
+'''
+- Name: get_alteration
+- Parameter(s):
+    - element: Element of the circuit (resistor, capacitor, inductor, DC, pulse or sinusoidal source)
+- Description:
+    Returns the name and the value of the parameter to give to the "alter" command to set the value of the element
+    (a list of strings for the pulse and sinusoidal waveforms), or None if the element can not be altered
+'''
+
+def get_alteration(element):
+    try:
+        if isinstance(element, PulseMixin):
+            values = (element.initial_value, element.pulsed_value, element.delay_time, element.rise_time,
+                      element.fall_time, element.pulse_width, element.period)
+            return 'pulse', ['{:g}'.format(float(value)) for value in values]
+        if isinstance(element, SinusoidalMixin):
+            values = (element.offset, element.amplitude, element.frequency, element.delay, element.damping_factor)
+            return 'sin', ['{:g}'.format(float(value)) for value in values]
+        for attribute, parameter in VALUE_ATTRIBUTES:
+            if hasattr(element, attribute):
+                return parameter, '{:g}'.format(float(getattr(element, attribute)))
+    except (TypeError, ValueError):
+        pass
+    return None
+
+'''
+- Name: SimulatorSession
+- Parameter(s):
+    - ngspice_id: Id of the ngspice shared instance
+- Description:
+    Keeps a circuit loaded in the ngspice shared instance and reuses it in the following simulations: when only
+    the ".param" values, the values of the passive elements and DC sources or the pulse/sinusoidal waveforms change,
+    they are sent with "alterparam" and "alter" instead of loading (and parsing) the circuit and its libraries again.
+    The analyses are run as commands, so different analyses of the same circuit also reuse it
+    Any other change of the netlist (or a circuit loaded by other code in the same instance) loads the circuit again
+    Example:
+        session = get_session()
+        simulator = session.simulator(circuit, temperature=25, nominal_temperature=25)
+'''
+
+class SimulatorSession:
+
+    def __init__(self, ngspice_id=0):
+        self.ngspice = NgSpiceShared.new_instance(ngspice_id=ngspice_id)
+        self._structure = None
+        self._parameters = {}
+        self._loaded_values = {}
+        self._values = {}
+        self._last_plot = None
+        self.loads = 0
+        self.reuses = 0
+
+    # Returns a simulator (same interface as circuit.simulator) whose analyses run in this session
+    def simulator(self, circuit, **kwargs):
+        return SessionSimulator(circuit, self, **kwargs)
+
+    # Whether the loaded circuit is still the one of this session: any other code that simulates in the same
+    # instance destroys the plots and creates a new one (ngspice never reuses the name of a plot)
+    def _is_current(self):
+        return self._structure is not None and self.ngspice.last_plot == self._last_plot
+
+    def _load(self, netlist, structure, parameters, values):
+        self.ngspice.destroy()
+        self.ngspice.load_circuit(netlist)
+        self._structure = structure
+        self._parameters = dict(parameters)
+        self._loaded_values = dict(values)
+        self._values = dict(values)
+        self.loads += 1
+
+    # Sends the values that changed since the last simulation, returns False if some of them can not be sent
+    def _update(self, circuit, parameters, values):
+        changed_parameters = {name: value for name, value in parameters.items() if self._parameters.get(name) != value}
+        if changed_parameters:
+            for name, value in changed_parameters.items():
+                self.ngspice.exec_command('alterparam {}={}'.format(name, value))
+            # The ".param" values are applied when the circuit is parsed again, which also drops the previous alters
+            self.ngspice.exec_command('reset')
+            self._parameters.update(changed_parameters)
+            self._values = dict(self._loaded_values)
+
+        for name, line in values.items():
+            if self._values[name] == line:
+                continue
+            alteration = get_alteration(circuit[name])
+            if alteration is None:
+                return False
+            self.ngspice.alter_device(name, **dict([alteration]))
+            self._values[name] = line
+        self.reuses += 1
+        return True
+
+    # Simulates the netlist (without analyses) of the simulator with the given analyses, returns the PySpice analysis
+    def run(self, simulator, netlist, analyses):
+        structure, parameters, values = split_netlist(netlist)
+        updated = False
+        if self._is_current() and structure == self._structure and parameters.keys() == self._parameters.keys():
+            try:
+                updated = self._update(simulator.circuit, parameters, values)
+            except (NgSpiceCommandError, NameError, KeyError):
+                updated = False
+        if not updated:
+            self._load(netlist, structure, parameters, values)
+
+        # Only the result of this simulation is kept in memory
+        self.ngspice.destroy()
+        for analysis in analyses:
+            self.ngspice.exec_command(str(analysis).strip().lstrip('.'))
+
+        return self._get_analysis(simulator)
+
+    # PySpice analysis of the last plot (NameError if the simulation failed)
+    def _get_analysis(self, simulator):
+        plot_name = self.ngspice.last_plot
+        if plot_name == 'const':
+            self._structure = None
+            raise NameError('Simulation failed')
+        self._last_plot = plot_name
+        return self.ngspice.plot(simulator, plot_name).to_analysis()
+
+    # Loads the netlist (without analyses) of the simulator once and runs the analyses for every case, a dictionary
+    # with the values of some elements (sent with "alter") and ".param" values (sent with "alterparam")
+    # Returns one PySpice analysis per case
+    def run_cases(self, simulator, netlist, analyses, cases):
+        elements = {element.name.lower(): element for element in simulator.circuit.elements}
+        self._load(netlist, *split_netlist(netlist))
+        # The loaded values will not match the netlist anymore, the next simulation loads it again
+        self._structure = None
+
+        results = []
+        for case in cases:
+            parameters = {name: value for name, value in case.items() if name.lower() not in elements}
+            for name, value in parameters.items():
+                self.ngspice.exec_command('alterparam {}={!r}'.format(name, float(value)))
+            if parameters:
+                # The ".param" values are applied when the circuit is parsed again, which also drops the previous alters
+                self.ngspice.exec_command('reset')
+            for name, value in case.items():
+                element = elements.get(name.lower())
+                if element is not None:
+                    parameter = next((parameter for attribute, parameter in VALUE_ATTRIBUTES if hasattr(element, attribute)), None)
+                    if parameter is None:
+                        raise ValueError('The value of {} can not be swept'.format(name))
+                    self.ngspice.alter_device(name, **{parameter: repr(float(value))})
+
+            self.ngspice.destroy()
+            for analysis in analyses:
+                self.ngspice.exec_command(str(analysis).strip().lstrip('.'))
+            results.append(self._get_analysis(simulator))
+        return results
+
+'''
+- Name: SessionSimulator
+- Parameter(s):
+    - circuit: Circuit to simulate
+    - session: SimulatorSession where the analyses are run
+    - kwargs: Same keyword arguments of circuit.simulator (temperature, nominal_temperature, ...)
+- Description:
+    Shared ngspice simulator that runs its analyses in a SimulatorSession instead of loading the circuit every time
+'''
+
+class SessionSimulator(NgSpiceSharedCircuitSimulator):
+
+    def __init__(self, circuit, session, **kwargs):
+        super().__init__(circuit, ngspice_shared=session.ngspice, **kwargs)
+        self._session = session
+
+    def _run(self, analysis_method, *args, **kwargs):
+        CircuitSimulator._run(self, analysis_method, *args, **kwargs)
+        analyses = list(self._analyses.values())
+        self.reset_analysis()
+        return self._session.run(self, str(self), analyses)
+
+    # Runs the same analysis (e.g. "operating_point") for every case, loading the circuit only once, and returns one
+    # PySpice analysis per case (see SimulatorSession.run_cases)
+    def run_cases(self, cases, analysis_method, *args, **kwargs):
+        CircuitSimulator._run(self, analysis_method, *args, **kwargs)
+        analyses = list(self._analyses.values())
+        self.reset_analysis()
+        return self._session.run_cases(self, str(self), analyses, cases)
+
+'''
+- Name: get_session
+- Parameter(s):
+    - ngspice_id: Id of the ngspice shared instance
+- Description:
+    Returns the session of this process, which is created only once (every worker of a pool has its own session)
+'''
+
+@functools.lru_cache(maxsize=None)
+def get_session(ngspice_id=0):
+    return SimulatorSession(ngspice_id)
+
+'''
+- Name: session_simulator
+- Parameter(s):
+    - circuit: Circuit to simulate
+    - kwargs: Same keyword arguments of circuit.simulator (temperature, nominal_temperature, ...)
+- Description:
+    Returns a simulator that runs in the session of this process, it can be used wherever circuit.simulator is used
+    Set the environment variable NGSPICE_SESSION to "off" to load the circuit in every simulation (plain PySpice simulator)
+    When Xyce is the selected backend (see backend.get_backend), a Xyce simulator is returned instead
+    Example:
+        simulator = session_simulator(circuit, temperature=25, nominal_temperature=25)
+'''
+
+def session_simulator(circuit, **kwargs):
+    simulator = backend_simulator(circuit, **kwargs)
+    if simulator is not None:
+        return simulator
+    if os.environ.get('NGSPICE_SESSION', '').lower() == 'off':
+        return circuit.simulator(**kwargs)
+    return get_session().simulator(circuit, **kwargs)
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import re
+
+from backend import get_backend
+from utilities import get_cache_file_name
+
+# Same extensions scanned by PySpice.Spice.Library.SpiceLibrary
+EXTENSIONS = ('.spice', '.lib', '.mod', '.lib@xyce', '.mod@xyce')
+
+INDEX_FILE_NAME = 'spice-library-index-{}.json'
+INDEX_VERSION = 1
+
+DEFINITION_REGEX = re.compile(rb'^[ \t]*\.(subckt|model|ends)\b[ \t]*(\S*)', re.IGNORECASE | re.MULTILINE)
+
+# Suffix of the library files written for Xyce
+XYCE_VARIANT = '@xyce'
+
+'''
+- Name: scan_library_file
+- Parameter(s):
+    - content: Content (bytes) of a SPICE library file
+- Description:
+    Returns the top level definitions of the file, as a list of [name, kind, byte offset], where kind is "subcircuit" or "model"
+    Models defined inside a sub-circuit belong to it, so they are not listed (same criteria used by PySpice)
+'''
+
+def scan_library_file(content):
+    definitions = []
+    depth = 0
+    for match in DEFINITION_REGEX.finditer(content):
+        keyword = match.group(1).lower()
+        if keyword == b'ends':
+            depth = max(depth - 1, 0)
+            continue
+        if depth == 0:
+            kind = 'subcircuit' if keyword == b'subckt' else 'model'
+            definitions.append([match.group(2).decode('utf-8', 'replace'), kind, match.start()])
+        if keyword == b'subckt':
+            depth += 1
+    return definitions
+
+'''
+- Name: read_definition
+- Parameter(s):
+    - path: Path of the library file
+    - offset: Byte offset of the definition (see scan_library_file)
+- Description:
+    Returns the text of a definition: a sub-circuit up to its ".ends", or a model with its continuation lines
+'''
+
+def read_definition(path, offset):
+    with open(path, 'rb') as library_file:
+        library_file.seek(offset)
+        lines = library_file.read().decode('utf-8', 'replace').splitlines()
+    definition = [lines[0]]
+    if lines[0].lstrip().lower().startswith('.subckt'):
+        depth = 1
+        for line in lines[1:]:
+            definition.append(line)
+            keyword = line.lstrip().lower()
+            depth += keyword.startswith('.subckt') - keyword.startswith('.ends')
+            if depth == 0:
+                break
+    else:
+        for line in lines[1:]:
+            if not line.lstrip().startswith(('+', '*')) and line.strip():
+                break
+            definition.append(line)
+    return '\n'.join(definition) + '\n'
+
+'''
+- Name: replace_models
+- Parameter(s):
+    - subcircuit: Text of a sub-circuit definition
+    - models: Text of the model definitions that replace the ones inside the sub-circuit
+- Description:
+    Returns the sub-circuit with its inner ".model" statements (and their continuation lines) replaced by the given ones
+'''
+
+def replace_models(subcircuit, models):
+    lines = []
+    in_model = False
+    for line in subcircuit.splitlines():
+        stripped = line.lstrip().lower()
+        if stripped.startswith('.model'):
+            in_model = True
+            continue
+        if in_model and stripped.startswith(('+', '*')):
+            continue
+        in_model = False
+        if stripped.startswith('.ends'):
+            lines.append(models.rstrip('\n'))
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+'''
+- Name: IndexedSpiceLibrary
+- Parameter(s):
+    - root_path: Path to the folder with the libraries
+    - index_path: Path to the on-disk index (defaults to a file in the ".cache" folder, one per root_path)
+    - backend: Simulator the circuits are built for (defaults to the one selected with SPICE_BACKEND, see backend.get_backend)
+- Description:
+    Drop-in replacement of PySpice's SpiceLibrary that keeps an on-disk index with the sub-circuits and
+    models of every library file (path, byte offset, mtime, size and hash)
+    Only the files whose mtime or size changed (and whose hash is also different) are scanned again, and
+    the folders are only listed again when their mtime changes, so lookups like spice_library['EC103D1']
+    need neither a directory walk nor parsing the libraries
+    Example:
+        spice_library = IndexedSpiceLibrary(libraries_path)
+        circuit.include(spice_library['EC103D1'])
+    With Xyce, the "@xyce" variant of a definition (e.g. "BAV21.lib@xyce") is preferred to the default one
+'''
+
+class IndexedSpiceLibrary:
+
+    def __init__(self, root_path, index_path=None, backend=None):
+        self._root_path = os.path.realpath(os.path.expanduser(os.path.expandvars(root_path)))
+        if index_path is None:
+            root_hash = hashlib.sha1(self._root_path.encode('utf-8')).hexdigest()[:12]
+            index_path = get_cache_file_name(INDEX_FILE_NAME.format(root_hash))
+        self._index_path = index_path
+        self._subcircuits = {}
+        self._models = {}
+        self._variant = XYCE_VARIANT if (backend or get_backend()).startswith('xyce') else None
+
+        index = self._load_index()
+        modified = self._refresh(index)
+        if modified:
+            self._save_index(index)
+
+        for relative_path, entry in sorted(index['files'].items()):
+            extension = self._get_extension(relative_path)
+            for name, kind, offset in entry['definitions']:
+                if extension.endswith('@xyce'):
+                    name += '@xyce'
+                target = self._subcircuits if kind == 'subcircuit' else self._models
+                target[name] = (os.path.join(self._root_path, relative_path), offset)
+
+    @staticmethod
+    def _get_extension(path):
+        for extension in EXTENSIONS:
+            if path.lower().endswith(extension):
+                return extension
+        return None
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, 'r') as index_file:
+                index = json.load(index_file)
+            if index.get('version') == INDEX_VERSION and index.get('root') == self._root_path:
+                return index
+        except (OSError, ValueError):
+            pass
+        return {'version': INDEX_VERSION, 'root': self._root_path, 'folders': {}, 'files': {}}
+
+    def _save_index(self, index):
+        temporary_path = self._index_path + '.tmp'
+        try:
+            with open(temporary_path, 'w') as index_file:
+                json.dump(index, index_file)
+            os.replace(temporary_path, self._index_path)
+        except OSError:
+            # Read-only cache folder: the index is rebuilt in memory on every run
+            pass
+
+    # Returns the library files, listing again only the folders whose mtime changed since the last run
+    def _list_files(self, index):
+        modified = False
+        folders = {}
+        pending = ['']
+        while pending:
+            relative_folder = pending.pop()
+            folder = os.path.join(self._root_path, relative_folder)
+            try:
+                mtime = os.stat(folder).st_mtime_ns
+            except OSError:
+                continue
+            cached = index['folders'].get(relative_folder)
+            if cached is None or cached['mtime'] != mtime:
+                modified = True
+                cached = {'mtime': mtime, 'folders': [], 'files': []}
+                for item in sorted(os.scandir(folder), key=lambda item: item.name):
+                    relative_path = os.path.join(relative_folder, item.name)
+                    if item.is_dir():
+                        cached['folders'].append(relative_path)
+                    elif item.is_file() and self._get_extension(item.name) is not None:
+                        cached['files'].append(relative_path)
+            folders[relative_folder] = cached
+            pending.extend(cached['folders'])
+
+        modified = modified or folders.keys() != index['folders'].keys()
+        index['folders'] = folders
+        return [path for folder in folders.values() for path in folder['files']], modified
+
+    # Brings the index up to date, returns True if it has been modified
+    def _refresh(self, index):
+        files, modified = self._list_files(index)
+        updated_files = {}
+        for relative_path in files:
+            path = os.path.join(self._root_path, relative_path)
+            try:
+                status = os.stat(path)
+            except OSError:
+                continue
+            entry = index['files'].get(relative_path)
+            if entry is not None and entry['mtime'] == status.st_mtime_ns and entry['size'] == status.st_size:
+                updated_files[relative_path] = entry
+                continue
+
+            with open(path, 'rb') as library_file:
+                content = library_file.read()
+            digest = hashlib.sha1(content).hexdigest()
+            if entry is None or entry['hash'] != digest:
+                entry = {'definitions': scan_library_file(content), 'hash': digest}
+            entry.update({'mtime': status.st_mtime_ns, 'size': status.st_size})
+            updated_files[relative_path] = entry
+            modified = True
+
+        modified = modified or updated_files.keys() != index['files'].keys()
+        index['files'] = updated_files
+        return modified
+
+    def __getitem__(self, name):
+        if self._variant is not None and not name.endswith(self._variant) and name + self._variant in self:
+            return self._get_variant(name)
+        if name in self._subcircuits:
+            return self._subcircuits[name][0]
+        elif name in self._models:
+            return self._models[name][0]
+        else:
+            raise KeyError(name)
+
+    # Returns the path of the variant of a definition. When the default definition is a sub-circuit but the variant
+    # only has its model (as in "BAV21.lib@xyce"), the sub-circuit is written again with the model of the variant,
+    # so the circuits keep using the same "X" elements with both simulators
+    def _get_variant(self, name):
+        variant = name + self._variant
+        if not (variant in self._models and name in self._subcircuits):
+            return self[variant]
+
+        subcircuit = read_definition(*self._subcircuits[name])
+        model = read_definition(*self._models[variant])
+        content = replace_models(subcircuit, model)
+        digest = hashlib.sha1(content.encode('utf-8')).hexdigest()[:12]
+        path = get_cache_file_name('{}{}-{}.lib'.format(name, self._variant.replace('@', '-'), digest))
+        if not os.path.isfile(path):
+            temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+            with open(temporary_path, 'w') as library_file:
+                library_file.write(content)
+            os.replace(temporary_path, path)
+        return path
+
+    def __contains__(self, name):
+        return name in self._subcircuits or name in self._models
+
+    # Returns the byte offset of the definition inside its file
+    def get_offset(self, name):
+        if name in self._subcircuits:
+            return self._subcircuits[name][1]
+        return self._models[name][1]
+
+    @property
+    def subcircuits(self):
+        return iter(self._subcircuits)
+
+    @property
+    def models(self):
+        return iter(self._models)
+
+    # Returns a dictionary with all the models/sub-circuits with names matching the regular expression
+    def search(self, regex):
+        matches = {}
+        for definitions in (self._models, self._subcircuits):
+            for name, (path, _) in definitions.items():
+                if re.search(regex, name):
+                    matches[name] = path
+        return matches
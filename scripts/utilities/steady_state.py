@@ -0,0 +1,170 @@
+import numpy as np
+
+from PySpice.Spice.NgSpice.Shared import ffi
+from PySpice.Spice.NgSpice.Simulation import NgSpiceSharedCircuitSimulator
+from PySpice.Spice.Simulation import CircuitSimulation
+
+from profiling import record_simulation, timed
+from utilities import format_waveforms
+
+'''
+- Name: list_vectors
+- Parameter(s):
+    - ngspice: NgSpiceShared instance
+    - plot_name: Name of the ngspice plot (e.g. "tran1")
+- Description:
+    Returns the names of the vectors of the plot, without reading their data
+'''
+
+def list_vectors(ngspice, plot_name):
+    # The PySpice wrapper only exposes whole plots, so the ngspice API is used directly to read single vectors
+    all_vectors = ngspice._ngspice_shared.ngSpice_AllVecs(plot_name.encode('utf8'))
+    names = []
+    while all_vectors[len(names)] != ffi.NULL:
+        names.append(ffi.string(all_vectors[len(names)]).decode('utf8'))
+    return names
+
+'''
+- Name: get_vector
+- Parameter(s):
+    - ngspice: NgSpiceShared instance
+    - plot_name: Name of the ngspice plot
+    - vector_name: Name of the vector (e.g. "output", "l1#branch", "time")
+    - start: Index of the first sample to copy
+    - copy: If False, returns a view over the ngspice buffer, which is only valid until the simulation is resumed
+- Description:
+    Returns a copy of the vector samples from "start" to the end, without copying the rest of the vector
+'''
+
+def get_vector(ngspice, plot_name, vector_name, start=0, copy=True):
+    name = '{}.{}'.format(plot_name, vector_name).encode('utf8')
+    vector_info = ngspice._ngspice_shared.ngGet_Vec_Info(name)
+    if vector_info == ffi.NULL:
+        raise KeyError(vector_name)
+    length = vector_info.v_length
+    data = np.frombuffer(ffi.buffer(vector_info.v_realdata, length * 8), dtype=np.float64)[start:]
+    return np.array(data) if copy else data
+
+'''
+- Name: get_vector_name
+- Parameter(s):
+    - vectors: Names of the vectors of the plot
+    - name: Node or branch name, as used by format_output (e.g. "output", "l1")
+- Description:
+    Returns the ngspice vector name of a node voltage or a branch current
+'''
+
+def get_vector_name(vectors, name):
+    name = str(name).lower()
+    for candidate in (name, name + '#branch', 'v({})'.format(name), 'i({})'.format(name)):
+        if candidate in vectors:
+            return candidate
+    raise KeyError(name)
+
+'''
+- Name: periods_converged
+- Parameter(s):
+    - t: Time of the last samples (at least two periods)
+    - waveforms: List with the last samples of each watched waveform
+    - period: Period of the source [s]
+    - rtol, atol: Relative (to the peak-to-peak value) and absolute tolerance
+- Description:
+    Resamples the last two periods to the same uniform grid and checks whether every waveform repeats within tolerance
+'''
+
+def periods_converged(t, waveforms, period, rtol, atol, samples=512):
+    end = t[-1]
+    grid = end - period + np.arange(samples) * (period / samples)
+    for waveform in waveforms:
+        last = np.interp(grid, t, waveform)
+        previous = np.interp(grid - period, t, waveform)
+        tolerance = rtol * np.ptp(last) + atol
+        if np.max(np.abs(last - previous)) > tolerance:
+            return False
+    return True
+
+'''
+- Name: steady_state_transient
+- Parameter(s):
+    - simulator: PySpice simulator using the shared ngspice backend (the default one)
+    - period: Period of the source [s]
+    - step_time: Step of the transient analysis [s]
+    - watch: Names of the waveforms that must settle (e.g. ['l1', 'output'])
+    - names: Optional list of node/branch names to return (default all of them)
+    - rtol, atol: Relative (to the peak-to-peak value) and absolute tolerance between successive periods
+    - min_periods: Minimum amount of periods to simulate
+    - max_periods: Maximum amount of periods to simulate, when the waveforms do not settle
+    - keep_periods: Amount of periods (the last ones) to return
+- Description:
+    Runs the transient analysis one period at a time (pausing ngspice with a breakpoint at the end of each
+    period) and stops as soon as two successive periods of the watched waveforms are equal within tolerance
+    Returns the voltages/currents dictionaries (same structure as format_output) with the last keep_periods
+    periods only, plus the amount of simulated periods
+    Example:
+        voltages, currents, simulated_periods = steady_state_transient(simulator, source.period, source.period/5000, watch=['l1'])
+'''
+
+@timed('simulation')
+def steady_state_transient(simulator, period, step_time, watch, names=None, rtol=1e-3, atol=1e-6,
+                           min_periods=2, max_periods=200, keep_periods=1):
+    if not isinstance(simulator, NgSpiceSharedCircuitSimulator):
+        raise ValueError('The steady-state mode needs the shared ngspice simulator')
+
+    period = float(period)
+    end_time = period * max_periods
+    min_periods = max(int(min_periods), 2, int(keep_periods))
+
+    # Load the circuit with the longest transient, it is paused at the end of every period
+    simulator.reset_analysis()
+    CircuitSimulation.transient(simulator, step_time=step_time, end_time=end_time)
+    desk = str(simulator)
+    simulator.reset_analysis()
+
+    ngspice = simulator.ngspice
+    ngspice.destroy()
+    ngspice.load_circuit(desk)
+
+    simulated_periods = min_periods
+    ngspice.exec_command('stop when time > {}'.format(simulated_periods * period))
+    ngspice.run()
+
+    while True:
+        plot_name = ngspice.last_plot
+        vectors = list_vectors(ngspice, plot_name)
+        time = get_vector(ngspice, plot_name, 'time', copy=False)
+        finished = time[-1] >= end_time * (1 - 1e-9)
+
+        start = max(np.searchsorted(time, time[-1] - 2 * period) - 1, 0)
+        waveforms = [get_vector(ngspice, plot_name, get_vector_name(vectors, name), start) for name in watch]
+        if finished or periods_converged(time[start:], waveforms, period, rtol, atol):
+            break
+
+        # Move the breakpoint to the end of the next period and continue
+        simulated_periods += 1
+        ngspice.exec_command('delete all')
+        ngspice.exec_command('stop when time > {}'.format(simulated_periods * period))
+        ngspice.resume(background=False)
+
+    ngspice.exec_command('delete all')
+    record_simulation(simulator, 'transient')
+
+    # Copy only the periods to return
+    start = max(np.searchsorted(time, time[-1] - keep_periods * period) - 1, 0)
+    if names is None:
+        selected = [vector for vector in vectors if vector != 'time']
+    else:
+        selected = [get_vector_name(vectors, name) for name in names]
+
+    nodes = {}
+    branches = {}
+    for vector in selected:
+        if vector.endswith('#branch'):
+            branches[vector[:-len('#branch')]] = get_vector(ngspice, plot_name, vector, start)
+        elif vector.startswith('i('):
+            branches[vector[2:-1]] = get_vector(ngspice, plot_name, vector, start)
+        else:
+            name = vector[2:-1] if vector.startswith('v(') else vector
+            nodes[name] = get_vector(ngspice, plot_name, vector, start)
+
+    voltages, currents = format_waveforms('transient', nodes, branches, np.array(time[start:]))
+    return voltages, currents, simulated_periods
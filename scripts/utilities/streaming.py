@@ -0,0 +1,364 @@
+import abc
+import queue
+import time
+
+import numpy as np
+
+from PySpice.Spice.NgSpice.Shared import NgSpiceShared, ffi
+from PySpice.Spice.Simulation import CircuitSimulation
+
+from steady_state import get_vector_name
+
+# Amount of chunks that can wait to be consumed, ngspice is paused when the consumer falls behind
+MAX_PENDING_CHUNKS = 4
+
+# Id of the streaming instance: PySpice loads "libngspice<id>.so" for every id but 0, a separate copy of the library,
+# since ngSpice_Init registers the callbacks of the whole library and would take them from the default instance
+# (used by the session and the usual simulators)
+STREAMING_NGSPICE_ID = 1
+
+'''
+- Name: StreamingNgSpiceShared
+- Parameter(s):
+    - ngspice_id: Id of the ngspice instance (see STREAMING_NGSPICE_ID)
+    - verbose: Whether to print the ngspice messages
+- Description:
+    ngspice shared instance with the data callback enabled, which copies every new point of the selected vectors
+    into a fixed size buffer and hands it over (as a chunk) to the consumer once it is full
+    The simulation runs in the ngspice background thread, so the points are consumed while they are produced
+'''
+
+class StreamingNgSpiceShared(NgSpiceShared):
+
+    # Not shared with NgSpiceShared, whose default instance is created without the data callback
+    _instances = {}
+
+    def __init__(self, ngspice_id=STREAMING_NGSPICE_ID, verbose=False):
+        self._stream = None
+        super().__init__(ngspice_id=ngspice_id, send_data=True, verbose=verbose)
+
+    # Starts collecting the given vectors (lowercase names) in chunks of chunk_size points
+    def start_stream(self, vectors, chunk_size):
+        self._stream = {
+            'vectors': vectors,
+            'indexes': None,
+            'buffer': np.empty((chunk_size, len(vectors) + 1)),
+            'length': 0,
+            'queue': queue.Queue(MAX_PENDING_CHUNKS),
+            'cancelled': False,
+        }
+        return self._stream['queue']
+
+    # Drops the points produced from now on and unblocks the ngspice thread if it is waiting for the consumer
+    def cancel_stream(self):
+        stream = self._stream
+        if stream is not None:
+            stream['cancelled'] = True
+            try:
+                while True:
+                    stream['queue'].get_nowait()
+            except queue.Empty:
+                pass
+
+    def _put(self, item):
+        stream = self._stream
+        while not stream['cancelled']:
+            try:
+                stream['queue'].put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _flush(self):
+        stream = self._stream
+        if stream['length']:
+            self._put(stream['buffer'][:stream['length']].copy())
+            stream['length'] = 0
+
+    @staticmethod
+    def _send_data(data, number_of_vectors, ngspice_id, user_data):
+        self = ffi.from_handle(user_data)
+        stream = self._stream
+        if stream is None or stream['cancelled']:
+            return 0
+
+        values = data.vecsa
+        if stream['indexes'] is None:
+            # The order of the vectors is the same for every point, so the names are only looked up once
+            names = [ffi.string(values[i].name).decode('utf8').lower() for i in range(int(number_of_vectors))]
+            scale = [i for i in range(int(number_of_vectors)) if values[i].is_scale]
+            stream['indexes'] = scale[:1] + [names.index(get_vector_name(names, vector)) for vector in stream['vectors']]
+
+        row = stream['buffer'][stream['length']]
+        for column, index in enumerate(stream['indexes']):
+            row[column] = values[index].creal
+        stream['length'] += 1
+        if stream['length'] == len(stream['buffer']):
+            self._flush()
+        return 0
+
+    # ngspice calls it when the background thread starts and when it exits, with the flag of the exit (despite the
+    # name in its header, the flag is false at the start and true at the end)
+    @staticmethod
+    def _background_thread_running(exited, ngspice_id, user_data):
+        self = ffi.from_handle(user_data)
+        self._is_running = not exited
+        stream = self._stream
+        if stream is not None and exited:
+            # End of the simulation: send the last (partial) chunk and the end mark
+            self._flush()
+            self._put(None)
+        return 0
+
+    # Whether the background thread is still simulating
+    @property
+    def running(self):
+        return bool(self._ngspice_shared.ngSpice_running())
+
+    # Waits until the background thread stops (halt only asks it to stop), returns False on timeout
+    def wait(self, timeout=10, interval=0.01):
+        deadline = time.monotonic() + timeout
+        while self.running:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(interval)
+        return True
+
+'''
+- Name: streaming_simulator
+- Parameter(s):
+    - circuit: Circuit to simulate
+    - ngspice_id: Id of the ngspice instance, a copy of the library named libngspice<id>.so must be installed next to
+      libngspice.so (see STREAMING_NGSPICE_ID)
+    - kwargs: Same keyword arguments of circuit.simulator (temperature, nominal_temperature, ...)
+- Description:
+    Returns a simulator that uses the streaming ngspice instance, it also works with the usual analyses (transient, ac, ...)
+    Example:
+        simulator = streaming_simulator(circuit, temperature=25, nominal_temperature=25)
+'''
+
+def streaming_simulator(circuit, ngspice_id=STREAMING_NGSPICE_ID, **kwargs):
+    ngspice = StreamingNgSpiceShared.new_instance(ngspice_id=ngspice_id)
+    return circuit.simulator(simulator='ngspice-shared', ngspice_shared=ngspice, **kwargs)
+
+'''
+- Name: stream_transient
+- Parameter(s):
+    - simulator: Simulator returned by streaming_simulator
+    - step_time, end_time, start_time, max_time, use_initial_condition: Parameters of the transient analysis
+    - nodes: Names of the nodes to stream (e.g. ['output', 'gate'])
+    - branches: Names of the branches to stream (e.g. ['l1'])
+    - chunk_size: Amount of points of each chunk
+- Description:
+    Runs the transient analysis in the background and yields time-ordered chunks as they are produced, each one a
+    dictionary with the "time" array and one array per node/branch (with the same names used by format_output)
+    On the Python side at most MAX_PENDING_CHUNKS chunks are held in memory. ngspice still keeps every point of the
+    streamed vectors in its plot until the run ends (it is destroyed then), so only the requested vectors are saved
+    Breaking out of the loop halts the simulation
+    Example:
+        for chunk in stream_transient(simulator, source.period/50000, source.period*100, nodes=['output'], branches=['l1']):
+            ...
+'''
+
+def stream_transient(simulator, step_time, end_time, nodes=(), branches=(), chunk_size=10000,
+                     start_time=0, max_time=None, use_initial_condition=False):
+    ngspice = simulator.ngspice
+    if not isinstance(ngspice, StreamingNgSpiceShared):
+        raise ValueError('The simulator must be created with streaming_simulator')
+
+    nodes = [str(node).lower() for node in nodes]
+    branches = [str(branch).lower() for branch in branches]
+    if not nodes and not branches:
+        raise ValueError('At least one node or branch must be streamed')
+
+    # Build the netlist saving only the streamed vectors
+    saved_nodes = set(simulator._saved_nodes)
+    simulator.reset_analysis()
+    simulator.save(nodes + [branch + '#branch' for branch in branches])
+    CircuitSimulation.transient(simulator, step_time=step_time, end_time=end_time, start_time=start_time,
+                                max_time=max_time, use_initial_condition=use_initial_condition)
+    desk = str(simulator)
+    simulator.reset_analysis()
+    simulator._saved_nodes = saved_nodes
+
+    ngspice.destroy()
+    ngspice.load_circuit(desk)
+    chunks = ngspice.start_stream(nodes + [branch + '#branch' for branch in branches], chunk_size)
+    ngspice.run(background=True)
+
+    names = ['time'] + nodes + branches
+    try:
+        while True:
+            data = chunks.get()
+            if data is None:
+                break
+            yield {name: data[:, column] for column, name in enumerate(names)}
+    finally:
+        ngspice.cancel_stream()
+        if ngspice.running:
+            # bg_halt returns before the thread stops, the plot can not be destroyed while it is still simulating
+            ngspice.halt()
+            ngspice.wait()
+        ngspice._stream = None
+        # The streamed vectors are not needed anymore, release the memory of the ngspice plot
+        ngspice.destroy()
+
+'''
+- Name: integrate
+- Parameter(s):
+    - t: Time of each sample
+    - y: Value of each sample
+- Description:
+    Returns the cumulative integral of the waveform (trapezoidal rule), starting at 0
+'''
+
+def integrate(t, y):
+    return np.concatenate(([0.0], np.cumsum(np.diff(t) * (y[1:] + y[:-1]) / 2)))
+
+'''
+- Name: Reducer
+- Parameter(s):
+    - name: Name of the node/branch to reduce
+- Description:
+    Base class of the on-the-fly reducers, which consume the chunks of stream_transient one at a time
+    The last point of each chunk is kept, so the integrals (trapezoidal rule) are continuous between chunks
+'''
+
+class Reducer(abc.ABC):
+
+    def __init__(self, name):
+        self.name = str(name).lower()
+        self._last = None
+
+    # Returns the time and values of the chunk, preceded by the last point of the previous chunk
+    def _get_points(self, chunk):
+        t = chunk['time']
+        y = chunk[self.name]
+        if self._last is not None:
+            t = np.concatenate(([self._last[0]], t))
+            y = np.concatenate(([self._last[1]], y))
+        self._last = (t[-1], y[-1])
+        return t, y
+
+    # Consumes the next chunk
+    @abc.abstractmethod
+    def update(self, chunk):
+        pass
+
+    # Returns the reduced value of all the chunks consumed so far
+    @abc.abstractmethod
+    def result(self):
+        pass
+
+'''
+- Name: RunningMean
+- Description:
+    Time-weighted average of the waveform (the simulation timestep is not uniform)
+'''
+
+class RunningMean(Reducer):
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._start = None
+        self._integral = 0.0
+
+    def update(self, chunk):
+        t, y = self._get_points(chunk)
+        if self._start is None:
+            self._start = t[0]
+        self._integral += integrate(t, y)[-1]
+
+    def result(self):
+        duration = self._last[0] - self._start if self._last is not None else 0
+        return self._integral / duration if duration > 0 else float('nan')
+
+'''
+- Name: RunningRMS
+- Description:
+    Time-weighted RMS value of the waveform
+'''
+
+class RunningRMS(RunningMean):
+
+    def update(self, chunk):
+        t, y = self._get_points(chunk)
+        if self._start is None:
+            self._start = t[0]
+        self._integral += integrate(t, y * y)[-1]
+
+    def result(self):
+        return float(np.sqrt(super().result()))
+
+'''
+- Name: RunningMinMax
+- Description:
+    Minimum and maximum values of the waveform, returned as a (min, max) tuple
+'''
+
+class RunningMinMax(Reducer):
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._min = np.inf
+        self._max = -np.inf
+
+    def update(self, chunk):
+        y = chunk[self.name]
+        if len(y):
+            self._min = min(self._min, float(y.min()))
+            self._max = max(self._max, float(y.max()))
+
+    def result(self):
+        return self._min, self._max
+
+'''
+- Name: PeriodAverages
+- Parameter(s):
+    - name: Name of the node/branch to reduce
+    - period: Period of the source [s]
+- Description:
+    Time-weighted average of every whole period of the waveform, returned as an array (one value per period)
+    Useful to see how the waveform settles without keeping it in Python
+'''
+
+class PeriodAverages(Reducer):
+
+    def __init__(self, name, period):
+        super().__init__(name)
+        self.period = float(period)
+        self._averages = []
+        self._integral = 0.0  # Integral since the start of the current period
+
+    def update(self, chunk):
+        t, y = self._get_points(chunk)
+        if len(t) < 2:
+            return
+        cumulative = integrate(t, y)
+        # Period boundaries inside the chunk, the integral at each one is interpolated
+        first = np.floor(t[0] / self.period + 1e-9) + 1
+        boundaries = np.arange(first, np.floor(t[-1] / self.period + 1e-9) + 1) * self.period
+        previous = 0.0
+        for value in np.interp(boundaries, t, cumulative):
+            self._averages.append((self._integral + value - previous) / self.period)
+            self._integral = 0.0
+            previous = value
+        self._integral += cumulative[-1] - previous
+
+    def result(self):
+        return np.array(self._averages)
+
+'''
+- Name: reduce_stream
+- Parameter(s):
+    - chunks: Chunks yielded by stream_transient
+    - reducers: Dictionary with the reducers to update (e.g. {'i_mean': RunningMean('l1')})
+- Description:
+    Feeds every chunk to every reducer and returns a dictionary with their results, with the same keys
+'''
+
+def reduce_stream(chunks, reducers):
+    for chunk in chunks:
+        for reducer in reducers.values():
+            reducer.update(chunk)
+    return {key: reducer.result() for key, reducer in reducers.items()}
@@ -0,0 +1,143 @@
+import itertools
+import multiprocessing
+import os
+
+import numpy as np
+
+from builders import get_circuit, BUILDERS
+from session import session_simulator
+from utilities import WaveformSet, format_output
+
+'''
+- Name: parameter_grid
+- Parameter(s):
+    - grid: Dictionary with a list of values for each parameter, e.g. {'alpha': [0.1, 0.5], 'R': [1, 10]}
+- Description:
+    Returns the list of points (one dictionary per combination) of the cartesian product of the grid,
+    in row-major order (the last parameter changes fastest)
+'''
+
+def parameter_grid(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+'''
+- Name: SweepResult
+- Parameter(s):
+    - grid: Dictionary with the list of values of each swept parameter
+    - results: List with the result of each point, in the order given by parameter_grid(grid)
+- Description:
+    Collects the results of a parameter sweep, indexed by grid position or by parameter values
+    Examples:
+        sweep[2, 0] -> result for the third value of the first parameter and the first of the second
+        sweep.get(alpha=0.5, R=10) -> same lookup, by value
+        sweep.to_array(lambda ws: ws['output'].mean()) -> numpy array with the grid shape
+'''
+
+class SweepResult:
+
+    def __init__(self, grid, results):
+        self.grid = {name: list(values) for name, values in grid.items()}
+        self.shape = tuple(len(values) for values in self.grid.values())
+        if len(results) != int(np.prod(self.shape)):
+            raise ValueError('Expected one result per point of the grid')
+        self.points = parameter_grid(self.grid)
+        self.results = list(results)
+
+    def __len__(self):
+        return len(self.results)
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index,)
+        return self.results[np.ravel_multi_index(index, self.shape)]
+
+    def get(self, **parameters):
+        index = tuple(self.grid[name].index(parameters[name]) for name in self.grid)
+        return self[index]
+
+    def items(self):
+        return zip(self.points, self.results)
+
+    # Applies "function" to every result and arranges the values with the shape of the grid
+    def to_array(self, function=None):
+        values = self.results if function is None else [function(result) for result in self.results]
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        try:
+            array = array.astype(float)
+        except (TypeError, ValueError):
+            pass
+        return array.reshape(self.shape)
+
+'''
+- Name: run_point
+- Parameter(s):
+    - task: Tuple with the circuit builder, the point, the analysis settings and the reducer
+- Description:
+    Runs a single point of a sweep: builds the circuit, simulates it and formats (and optionally reduces) the result
+    It is executed inside a worker process, since the ngspice shared library is not re-entrant
+    The circuits of the builders module are built once per structure (see builders.get_circuit), and the circuit stays
+    loaded in the session of the worker, so the next points only send the values that change
+'''
+
+def run_point(task):
+    circuit_builder, point, simulation_mode, analysis_parameters, names, reduce = task
+
+    if circuit_builder in BUILDERS:
+        circuit = get_circuit(circuit_builder, **point)
+    else:
+        circuit = circuit_builder(**point)
+    if callable(analysis_parameters):
+        analysis_parameters = analysis_parameters(circuit, **point)
+
+    simulator = session_simulator(circuit, temperature=25, nominal_temperature=25)
+    analysis = getattr(simulator, simulation_mode)(**analysis_parameters)
+
+    if simulation_mode == 'operating_point':
+        result = format_output(analysis, simulation_mode, names)
+    else:
+        result = WaveformSet.from_analysis(analysis, simulation_mode, names)
+
+    if reduce is not None:
+        result = reduce(result, **point)
+    return result
+
+'''
+- Name: run_sweep
+- Parameter(s):
+    - circuit_builder: Module level function that receives the parameters of a point as keyword arguments and returns a Circuit
+    - grid: Dictionary with the list of values of each parameter
+    - simulation_mode: Type of simulation (operating_point, transient, ac)
+    - analysis_parameters: Keyword arguments of the analysis, or a function (circuit, **point) that returns them
+    - names: Optional list of node/branch names to keep from each result
+    - reduce: Optional function (result, **point) executed in the worker, to return only scalars instead of waveforms
+    - processes: Amount of worker processes (defaults to the amount of CPUs)
+    - fresh_process: If True, every point runs in a brand new process (slower, but no simulator state is shared)
+- Description:
+    Runs the simulation of every point of the grid in a pool of worker processes and returns a SweepResult
+    Example:
+        sweep = run_sweep(half_wave_converter, {'alpha': [0.1, 0.3, 0.5], 'R': [1, 10, 100]}, 'transient',
+                          {'step_time': 20e-6, 'end_time': 0.1}, names=['output'])
+    See the trigger angle sweep of thyristor/half-wave-converter.py
+'''
+
+def run_sweep(circuit_builder, grid, simulation_mode='transient', analysis_parameters=None, names=None,
+              reduce=None, processes=None, fresh_process=False):
+    if analysis_parameters is None:
+        analysis_parameters = {}
+    points = parameter_grid(grid)
+    tasks = [(circuit_builder, point, simulation_mode, analysis_parameters, names, reduce) for point in points]
+
+    # The daemonic workers of a pool (e.g. run_all) can not have children, so they simulate every point themselves
+    if multiprocessing.current_process().daemon:
+        return SweepResult(grid, [run_point(task) for task in tasks])
+
+    processes = min(processes or os.cpu_count() or 1, len(tasks)) or 1
+    maxtasksperchild = 1 if fresh_process else None
+    # Forking keeps the functions of the calling script (reduce, analysis_parameters) available in the workers
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+    with context.Pool(processes, maxtasksperchild=maxtasksperchild) as pool:
+        results = pool.map(run_point, tasks, chunksize=1)
+
+    return SweepResult(grid, results)
@@ -1,61 +1,256 @@
+import importlib
 import numpy as np
 import os
+import types
 
 '''
-- Name: format_output
+- Name: as_read_only
 - Parameter(s):
-    - analysis: SPICE simulation result
-    - simulation_mode: Type of simulation (operating_pint, transient, ac)
+    - data: numpy array (or PySpice waveform) holding simulation values
 - Description:
-    Receives a raw SPICE simulation result and creates a dictionary with a key/value pair for each node
+    Returns a read-only plain numpy view over the given buffer, without copying it
+'''
+
+def as_read_only(data):
+    view = np.asarray(data).view(np.ndarray)
+    view.flags.writeable = False
+    return view
+
+'''
+- Name: get_waveform_name
+- Parameter(s):
+    - waveform: PySpice waveform of a node or a branch
+- Description:
+    Returns the name of the waveform in lowercase: ngspice returns lowercase names, while Xyce keeps the case
+    of the netlist, so the results of both simulators have the same keys
+'''
+
+def get_waveform_name(waveform):
+    return str(waveform).lower()
+
+'''
+- Name: format_waveforms
+- Parameter(s):
+    - simulation_mode: Type of simulation (operating_point, transient, ac)
+    - nodes: Dictionary with the values of each node (name/array or scalar)
+    - branches: Dictionary with the values of each branch (name/array or scalar)
+    - abscissa: Time (transient) or frequency (ac) axis, None for operating point
+    - names: Optional list of node/branch names to extract, the rest are never materialized
+             Differential voltages can be requested as "positive-negative" (e.g. "a-b")
+- Description:
+    Creates the voltages/currents dictionaries returned by format_output, from the raw values of each node and branch
 '''
 
-def format_output(analysis, simulation_mode):
+def format_waveforms(simulation_mode, nodes, branches, abscissa=None, names=None):
     voltages = {}
-    currents ={}
+    currents = {}
 
-    # Loop through nodes
-    for node in analysis.nodes.values():
-        data_label = str(node)  # Extract node name
+    if names is not None:
+        names = {str(name).lower() for name in names}
+
+    def format_waveform(waveform):
         if simulation_mode == 'operating_point':
-            voltages[data_label] = float(node)
+            return float(np.asarray(waveform).reshape(-1)[0])
         elif simulation_mode == 'ac':
-            voltages[data_label] = {}
-            voltages[data_label]['magnitude'] = np.abs(node)
-            voltages[data_label]['phase'] = np.angle(node)
+            data = np.asarray(waveform)
+            return {
+                'magnitude': np.abs(data),
+                'phase': np.angle(data)
+            }
         else:
-            voltages[data_label] = np.array(node)
-    
+            return as_read_only(waveform)
+
+    # Loop through nodes
+    for data_label, node in nodes.items():
+        if names is None or data_label in names:
+            voltages[data_label] = format_waveform(node)
+
+    # Differential voltages, computed from the raw values of both nodes ("0" is the ground)
+    for name in sorted(names or ()):
+        if name not in nodes and name not in branches and '-' in name:
+            positive, negative = name.split('-', 1)
+            if positive not in nodes or (negative not in nodes and negative != '0'):
+                raise KeyError(name)
+            difference = np.asarray(nodes[positive])
+            if negative != '0':
+                difference = np.subtract(difference, np.asarray(nodes[negative]))
+            voltages[name] = format_waveform(difference)
+
     # Loop through branches
-    for branch in analysis.branches.values():
-        data_label = str(branch)  # Extract node name
-        if simulation_mode == 'operating_point':
-            currents[data_label] = float(branch)
-        elif simulation_mode == 'ac':
-            currents[data_label] = {}
-            currents[data_label]['magnitude'] = np.abs(branch)
-            currents[data_label]['phase'] = np.angle(branch)
-        else:
-            currents[data_label] = np.array(branch)
-    
-    # If the simulation mode is "transient",  we also return time
+    for data_label, branch in branches.items():
+        if names is None or data_label in names:
+            currents[data_label] = format_waveform(branch)
+
+    # If the simulation mode is "transient", we also return time (shared by both dictionaries)
     if simulation_mode == 'transient':
-        t = []
-        for val in analysis.time:
-            t.append(val)
-        voltages['time'] = np.array(t)
-        currents['time'] = np.array(t)
-    
-    # If the simulation mode is "ac",  we also return frequency
+        t = as_read_only(abscissa)
+        voltages['time'] = t
+        currents['time'] = t
+
+    # If the simulation mode is "ac", we also return frequency (shared by both dictionaries)
     if simulation_mode == 'ac':
-        f = []
-        for val in analysis.frequency:
-            f.append(val)
-        voltages['frequency'] = np.array(f)
-        currents['frequency'] = np.array(f)
-    
+        f = as_read_only(abscissa)
+        voltages['frequency'] = f
+        currents['frequency'] = f
+
     return voltages, currents
 
+'''
+- Name: format_output
+- Parameter(s):
+    - analysis: SPICE simulation result
+    - simulation_mode: Type of simulation (operating_point, transient, ac)
+    - names: Optional list of node/branch names to extract, the rest are never materialized (see format_waveforms)
+- Description:
+    Receives a raw SPICE simulation result and creates a dictionary with a key/value pair for each node
+    For transient simulations the arrays are read-only views over the simulator buffers, not copies
+'''
+
+def format_output(analysis, simulation_mode, names=None):
+    nodes = {get_waveform_name(node): node for node in analysis.nodes.values()}
+    branches = {get_waveform_name(branch): branch for branch in analysis.branches.values()}
+
+    abscissa = None
+    if simulation_mode == 'transient':
+        abscissa = analysis.time
+    elif simulation_mode == 'ac':
+        abscissa = analysis.frequency
+
+    return format_waveforms(simulation_mode, nodes, branches, abscissa, names)
+
+'''
+- Name: WaveformSet
+- Parameter(s):
+    - abscissa: Time (transient) or frequency (ac) axis, one value per row
+    - data: 2-D array with one column per node/branch (float64 for transient, complex128 for ac)
+    - names: List of column names, in the same order as the columns of data
+    - nodes: Optional list with the names that correspond to node voltages (the rest are branch currents)
+    - simulation_mode: Type of simulation (transient, ac)
+- Description:
+    Columnar container for the waveforms of a simulation. All the signals live in a single
+    column-major array, so every signal is a contiguous view and differential signals like
+    ws['a'] - ws['b'] are computed straight from the simulation data, with no intermediate copies
+'''
+
+class WaveformSet:
+
+    def __init__(self, abscissa, data, names, nodes=None, simulation_mode='transient'):
+        data = np.asarray(data)
+        if data.ndim != 2 or data.shape[1] != len(names):
+            raise ValueError('data must have one column per name')
+        if len(abscissa) != data.shape[0]:
+            raise ValueError('abscissa and data must have the same number of rows')
+
+        self._abscissa = as_read_only(abscissa)
+        self._data = as_read_only(data)
+        self._index = {name: column for column, name in enumerate(names)}
+        if len(self._index) != len(names):
+            raise ValueError('column names must be unique')
+        self._nodes = set(names if nodes is None else nodes)
+        self.simulation_mode = simulation_mode
+
+    # Builds the set from a raw SPICE simulation result, copying each waveform once into its column
+    @classmethod
+    def from_analysis(cls, analysis, simulation_mode, names=None):
+        if simulation_mode == 'transient':
+            abscissa = analysis.time
+            dtype = np.float64
+        elif simulation_mode == 'ac':
+            abscissa = analysis.frequency
+            dtype = np.complex128
+        else:
+            raise ValueError('Unsupported simulation mode: {}'.format(simulation_mode))
+
+        if names is not None:
+            names = {str(name).lower() for name in names}
+
+        waveforms = {}
+        for waveform in list(analysis.nodes.values()) + list(analysis.branches.values()):
+            data_label = get_waveform_name(waveform)
+            if names is None or data_label in names:
+                waveforms[data_label] = waveform
+
+        data = np.empty((len(abscissa), len(waveforms)), dtype=dtype, order='F')
+        for column, waveform in enumerate(waveforms.values()):
+            data[:, column] = np.asarray(waveform)
+
+        nodes = [get_waveform_name(node) for node in analysis.nodes.values()]
+        return cls(abscissa, data, list(waveforms), nodes, simulation_mode)
+
+    @property
+    def abscissa(self):
+        return self._abscissa
+
+    @property
+    def time(self):
+        return self._abscissa
+
+    @property
+    def frequency(self):
+        return self._abscissa
+
+    @property
+    def names(self):
+        return list(self._index)
+
+    @property
+    def data(self):
+        return self._data
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes + self._abscissa.nbytes
+
+    def __len__(self):
+        return self._data.shape[0]
+
+    def __contains__(self, name):
+        return name in self._index
+
+    # ws['a'] returns a read-only view of the column, ws['a', 'b'] returns the differential signal a - b
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            positive, negative = key
+            return np.subtract(self[positive], self[negative])
+        return self._data[:, self._index[key]]
+
+    def magnitude(self, name):
+        return np.abs(self[name])
+
+    def phase(self, name):
+        return np.angle(self[name])
+
+    # Returns a new set (a view, not a copy) restricted to start <= abscissa <= stop
+    def window(self, start=None, stop=None):
+        first = 0 if start is None else np.searchsorted(self._abscissa, start, side='left')
+        last = len(self) if stop is None else np.searchsorted(self._abscissa, stop, side='right')
+        return self._take(slice(first, last))
+
+    # Returns a new set (a view, not a copy) keeping one of every "factor" rows
+    def decimate(self, factor):
+        if factor < 1:
+            raise ValueError('factor must be a positive integer')
+        return self._take(slice(None, None, int(factor)))
+
+    def _take(self, rows):
+        return WaveformSet(self._abscissa[rows], self._data[rows], self.names, self._nodes, self.simulation_mode)
+
+    # Returns the voltages/currents dictionary pair, with the same layout as format_output
+    def to_dicts(self):
+        voltages = {}
+        currents = {}
+        for name in self._index:
+            target = voltages if name in self._nodes else currents
+            if self.simulation_mode == 'ac':
+                target[name] = {'magnitude': self.magnitude(name), 'phase': self.phase(name)}
+            else:
+                target[name] = self[name]
+
+        axis_name = 'frequency' if self.simulation_mode == 'ac' else 'time'
+        voltages[axis_name] = self._abscissa
+        currents[axis_name] = self._abscissa
+        return voltages, currents
+
 '''
 - Name: get_output_file_name
 - Parameter(s):
@@ -70,4 +265,83 @@ def get_output_file_name(file_name):
     if not os.path.isdir(my_path):
         os.makedirs(my_path)
 
-    return os.path.join(my_path, file_name)
\ No newline at end of file
+    return os.path.join(my_path, file_name)
+
+'''
+- Name: get_libraries_path
+- Parameter(s):
+    - None
+- Description:
+    Returns the absolute path to the "libraries" folder, with the definitions of components
+'''
+
+def get_libraries_path():
+    return os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + "/libraries"
+
+'''
+- Name: get_cache_file_name
+- Parameter(s):
+    - file_name: string
+- Description:
+    Generates the absolute path to save a cache file in the ".cache" folder
+'''
+
+def get_cache_file_name(file_name):
+    my_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + "/.cache"
+
+    if not os.path.isdir(my_path):
+        os.makedirs(my_path)
+
+    return os.path.join(my_path, file_name)
+
+'''
+- Name: LazyModule
+- Parameter(s):
+    - name: Full name of the module (e.g. "matplotlib.pyplot")
+    - before_import: Optional function called just before the module is imported
+- Description:
+    Placeholder of a module that is only imported the first time one of its attributes is used,
+    so scripts that never plot (or never compute a spectrum) do not pay for importing those modules
+    Example:
+        plt = LazyModule('matplotlib.pyplot')
+        plt.subplots()  # matplotlib is imported here
+'''
+
+class LazyModule(types.ModuleType):
+
+    def __init__(self, name, before_import=None):
+        super().__init__(name)
+        self._before_import = before_import
+        self._module = None
+
+    # Imports the module (only once) and returns it
+    def load(self):
+        if self._module is None:
+            if self._before_import is not None:
+                self._before_import()
+            self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, name):
+        if name.startswith('__') and name.endswith('__'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __dir__(self):
+        return dir(self.load())
+
+'''
+- Name: select_backend
+- Parameter(s):
+    - None
+- Description:
+    Selects the non-interactive Agg backend of matplotlib when running inside the container, where there is no display
+'''
+
+def select_backend():
+    if os.environ.get('IN_CONTAINER') == 'Yes' and 'MPLBACKEND' not in os.environ:
+        import matplotlib
+        matplotlib.use('Agg')
+
+# matplotlib.pyplot, imported when the first figure is created
+pyplot = LazyModule('matplotlib.pyplot', before_import=select_backend)